@@ -31,7 +31,7 @@ import png
 
 from roboviz import MapVisualizer
 from stellar.models.robot import Robot
-from stellar.simulation.data import png_to_ogm
+from stellar.utils import png_to_ogm
 from stellar.cognition import mapping
 from stellar.perception.sensors import sense_distance, get_occupied_cell_from_distance, SensorArray
 
@@ -0,0 +1,339 @@
+"""
+Stellar benchmarks.
+
+Micro benchmarks for the performance critical parts of stellar.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import partial
+from glob import glob
+from timeit import repeat
+
+try:
+    import resource
+except ImportError:  # Unix only, peak resident memory isn't reported elsewhere.
+    resource = None
+
+import numpy as np
+
+from stellar.cognition import mapping
+from stellar.cognition.planning import AStarPlanner
+from stellar.models.gridmap import TiledGrid
+from stellar.perception import pylon_detection
+from stellar.perception.pylon_detection import Pylon, PylonDetector
+from stellar.perception.sensors import SensorArray
+
+
+def update_occupancy_map_per_cell(gridmap, pose, measurement, sonar_bearing_angle,
+                                  sonar_opening_angle, z_max):
+    """Baseline: evaluates the inverse sensor model cell by cell."""
+    if measurement in (-1, 0):
+        measurement = z_max
+
+    B = mapping.get_occupied_cell_from_distance(
+        gridmap, pose, measurement + 5, sonar_bearing_angle - np.deg2rad(10))
+    C = mapping.get_occupied_cell_from_distance(
+        gridmap, pose, measurement + 5, sonar_bearing_angle + np.deg2rad(10))
+    max_x, min_x, max_y, min_y = mapping.fov_bounding_box(pose, B, C)
+
+    if pose[1] <= gridmap.shape[0] and pose[0] <= gridmap.shape[1]:
+        gridmap[pose[1], pose[0]] -= mapping.LOG_ODD_FREE
+    for y in range(min_y, min(max_y, gridmap.shape[0])):
+        for x in range(min_x, min(max_x, gridmap.shape[1])):
+            p = mapping.inverse_range_sensor_model(
+                (x, y), pose, sonar_bearing_angle, sonar_opening_angle,
+                z_max, measurement)
+            if p == -1:
+                gridmap[y, x] -= mapping.LOG_ODD_FREE
+            if p == 1:
+                gridmap[y, x] += mapping.LOG_ODD_OCCU
+
+    return np.clip(gridmap, a_max=mapping.LOG_ODD_MAX, a_min=mapping.LOG_ODD_MIN)
+
+
+PYLON_TEST_IMAGES = "tests/pylon_test_images"
+
+# Machine-readable results of all benchmarks run, see --report.
+results: dict = {}
+
+
+def record(name, **values):
+    results.setdefault(name, {}).update(values)
+
+
+def report(name, timings, number):
+    best = min(timings) / number
+    print(f"{name:<40} {best * 1000:10.3f} ms")
+    record(name, ms=round(best * 1000, 3))
+    return best
+
+
+def bench_mapping(number, rounds):
+    """Benchmark one learning mode tick, i.e. three sonar updates."""
+    gridmap = np.zeros((200, 200))
+    pose = (100, 100, np.radians(30))
+    z_max = 40
+    opening_angle = np.radians(15)
+    readings = [(np.radians(0), 25.0), (np.radians(90), -1),
+                (np.radians(-90), 12.0)]
+
+    def tick(update, initial_grid=gridmap):
+        def run():
+            grid = initial_grid
+            for angle, measurement in readings:
+                grid = update(grid, pose, measurement, angle,
+                              opening_angle, z_max)
+        return run
+
+    baseline = report("mapping: per-cell",
+                      repeat(tick(update_occupancy_map_per_cell),
+                             number=number, repeat=rounds), number)
+    batched = report("mapping: batched",
+                     repeat(tick(mapping.update_occupancy_map),
+                            number=number, repeat=rounds), number)
+    print(f"{'speedup':<40} {baseline / batched:10.1f} x")
+
+    in_place = gridmap.copy()
+    report("mapping: batched, in place",
+           repeat(tick(partial(mapping.update_occupancy_map, out=in_place), in_place),
+                  number=number, repeat=rounds), number)
+    log_odds_grid = mapping.create_log_odds_grid(gridmap.shape)
+    report("mapping: batched, int8 log odds grid",
+           repeat(tick(mapping.update_occupancy_map, log_odds_grid),
+                  number=number, repeat=rounds), number)
+    report("mapping: batched, tiled grid",
+           repeat(tick(mapping.update_occupancy_map, TiledGrid()),
+                  number=number, repeat=rounds), number)
+
+
+def bench_planning(number, rounds):
+    """Benchmark a full-map plan on a 200x200 map with two walls."""
+    gridmap = np.zeros((200, 200))
+    gridmap[50:150, 100] = mapping.LOG_ODD_MAX
+    gridmap[100, 20:180] = mapping.LOG_ODD_MAX
+    planner = AStarPlanner()
+
+    report("planning: 200x200 full map",
+           repeat(lambda: planner.plan(gridmap, (5, 5), (195, 195)),
+                  number=number, repeat=rounds), number)
+
+
+def bench_sensing(number, rounds):
+    """Benchmark sensing all three sonars in a 200x200 world."""
+    rng = np.random.default_rng(0)
+    world = np.zeros((200, 200))
+    world[rng.integers(0, 200, 400), rng.integers(0, 200, 400)] = 1
+    sensors = SensorArray(z_max=40)
+    sensors.sense(world, (100, 100, 0.0))  # Precompute the ray tables.
+
+    report("sensing: three sonars",
+           repeat(lambda: sensors.sense(world, (100, 100, np.radians(30))),
+                  number=number, repeat=rounds), number)
+    tiled_world = TiledGrid.from_array(world)
+    report("sensing: three sonars, tiled world",
+           repeat(lambda: sensors.sense(tiled_world, (100, 100, np.radians(30))),
+                  number=number, repeat=rounds), number)
+
+
+def intersection_over_union(a, b):
+    (ax, ay), (bx, by) = a.position, b.position
+    width = min(ax + a.width, bx + b.width) - max(ax, bx)
+    height = min(ay + a.height, by + b.height) - max(ay, by)
+    intersection = max(width, 0) * max(height, 0)
+    union = a.width * a.height + b.width * b.height - intersection
+    return intersection / union
+
+
+def count_matches(pylons, reference, min_iou=0.5):
+    """Number of reference pylons overlapped by a detected pylon."""
+    return sum(any(intersection_over_union(pylon, expected) >= min_iou
+                   for pylon in pylons)
+               for expected in reference)
+
+
+def bench_segmentation(number, rounds):
+    """Benchmark the color segregation modes on the pylon test images.
+
+    Times the segregate stage of PylonDetector.find_pylons. Agreement
+    compares the detected pylons to those of the mean shift baseline
+    (IoU >= 0.5).
+    """
+    pylon_detection.DO_CREATE_DEBUG_IMAGES = False
+    images = [PylonDetector.load_image(path)
+              for path in sorted(glob(f"{PYLON_TEST_IMAGES}/*.jpg"))]
+
+    def detect_all(mode):
+        pylon_detection.COLOR_SEGREGATION_MODE = mode
+        return [PylonDetector.find_pylons(image) for image in images]
+
+    def time_segregation():
+        timings = {}
+        with timed_stages(timings):
+            for _ in range(number):
+                for image in images:
+                    PylonDetector.find_pylons(image)
+        return timings['segregate']
+
+    default_mode = pylon_detection.COLOR_SEGREGATION_MODE
+    baseline = detect_all('mean-shift')
+    for mode in ('mean-shift', 'median'):
+        detected = detect_all(mode)
+        report(f"segmentation: {mode}", [time_segregation() for _ in range(rounds)],
+               number * len(images))
+        matched = sum(count_matches(pylons, reference)
+                      for pylons, reference in zip(detected, baseline))
+        print(f"{'  pylons (matched/baseline/detected)':<40} "
+              f"{matched}/{sum(map(len, baseline))}/{sum(map(len, detected))}")
+        record(f"segmentation: {mode}", matched=matched,
+               baseline=sum(map(len, baseline)), detected=sum(map(len, detected)))
+    pylon_detection.COLOR_SEGREGATION_MODE = default_mode
+
+
+# Stages of PylonDetector.find_pylons and the methods they are timed by.
+PYLON_DETECTION_STAGES = {
+    'resize': 'resize_image',
+    'segregate': 'segregate_colors',
+    'threshold': 'detect_pylon_colors',
+    'morph': 'morph_image',
+    'connected components': 'get_component_stats',
+}
+
+
+@contextmanager
+def timed_stages(timings):
+    """Adds the time spent in each stage of PylonDetector.find_pylons to
+    timings (s), by wrapping the methods of the stages while active."""
+    def timed(stage, method):
+        def run(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+        return staticmethod(run)
+
+    methods = {name: PylonDetector.__dict__[name] for name in PYLON_DETECTION_STAGES.values()}
+    for stage, name in PYLON_DETECTION_STAGES.items():
+        setattr(PylonDetector, name, timed(stage, methods[name].__func__))
+    try:
+        yield timings
+    finally:
+        for name, method in methods.items():
+            setattr(PylonDetector, name, method)
+
+
+def find_pylons_by_stage(image):
+    """PylonDetector.find_pylons, timing its stages.
+
+    Returns the pylons and the time spent in each stage (s), 'filter' is
+    the time spent outside of the other stages.
+    """
+    timings = dict.fromkeys(PYLON_DETECTION_STAGES, 0.0)
+    with timed_stages(timings):
+        started = time.perf_counter()
+        pylons = PylonDetector.find_pylons(image)
+        total = time.perf_counter() - started
+    timings['filter'] = total - sum(timings.values())
+
+    return pylons, timings
+
+
+def load_annotations(path):
+    """Ground truth pylons per image name, see tests/pylon_test_images/annotations.json."""
+    with open(path) as f:
+        return {name: [Pylon(*pylon['box']) for pylon in pylons]
+                for name, pylons in json.load(f).items()}
+
+
+def bench_pylons(number, rounds):
+    """Benchmark pylon detection stage by stage on the pylon test images.
+
+    Also records the peak memory allocated while detecting and the detected
+    pylons matching the ground truth annotations (IoU >= 0.5).
+    """
+    pylon_detection.DO_CREATE_DEBUG_IMAGES = False
+    annotations = load_annotations(f"{PYLON_TEST_IMAGES}/annotations.json")
+    images = {name: PylonDetector.load_image(f"{PYLON_TEST_IMAGES}/{name}")
+              for name in sorted(annotations)}
+
+    record("pylons: config", **{name: getattr(pylon_detection, name) for name in (
+        'MAX_IMAGE_SIZE', 'MIN_PYLON_SIZE', 'COLOR_SEGREGATION_MODE',
+        'COLOR_SEGREGATION_SPATIAL_RADIUS', 'COLOR_SEGREGATION_COLOR_RADIUS',
+        'COLOR_SEGREGATION_MEDIAN_KERNEL_SIZE')})
+
+    stages = list(PYLON_DETECTION_STAGES) + ['filter']
+    best = {stage: float('inf') for stage in stages}
+    for _ in range(rounds):
+        totals = dict.fromkeys(stages, 0.0)
+        for _ in range(number):
+            for image in images.values():
+                for stage, seconds in find_pylons_by_stage(image)[1].items():
+                    totals[stage] += seconds
+        for stage, total in totals.items():
+            best[stage] = min(best[stage], total)
+
+    for stage in stages:
+        report(f"pylons: {stage}", [best[stage]], number * len(images))
+    report("pylons: total", [sum(best.values())], number * len(images))
+
+    # Separate pass, tracing allocations slows detection down.
+    tracemalloc.start()
+    detected = {}
+    for name, image in images.items():
+        detected[name] = PylonDetector.find_pylons(image)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{'pylons: peak allocated':<40} {peak / 2 ** 20:10.3f} MiB")
+    memory = {'peak_allocated_mib': round(peak / 2 ** 20, 3)}
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f"{'pylons: peak resident (process)':<40} {max_rss / 2 ** 10:10.3f} MiB")
+        memory['peak_resident_mib'] = round(max_rss / 2 ** 10, 3)
+    record("pylons: memory", **memory)
+
+    for name, expected in annotations.items():
+        matched = count_matches(detected[name], expected)
+        print(f"{'  ' + name + ' (matched/expected/detected)':<40} "
+              f"{matched}/{len(expected)}/{len(detected[name])}")
+        record(f"pylons: {name}", matched=matched, expected=len(expected),
+               detected=len(detected[name]))
+
+
+BENCHMARKS = {
+    'mapping': bench_mapping,
+    'planning': bench_planning,
+    'sensing': bench_sensing,
+    'segmentation': bench_segmentation,
+    'pylons': bench_pylons,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Stellar benchmarks')
+    parser.add_argument('benchmarks', nargs='*', default=list(BENCHMARKS),
+                        choices=list(BENCHMARKS), help="Benchmarks to run.")
+    parser.add_argument('--number', type=int, default=10,
+                        help="Number of executions per round.")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Number of rounds, the best one is reported.")
+    parser.add_argument('--report', default=None,
+                        help="Write the results as JSON to this file, e.g. to diff runs.")
+    args = parser.parse_args()
+
+    try:
+        for benchmark in args.benchmarks:
+            BENCHMARKS[benchmark](args.number, args.repeat)
+    except KeyboardInterrupt:
+        sys.exit(1)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'benchmarks': results, 'number': args.number, 'repeat': args.repeat,
+                       'python': sys.version.split()[0], 'host': platform.node()},
+                      f, indent=2, sort_keys=True)
+            f.write('\n')
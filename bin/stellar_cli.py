@@ -4,6 +4,7 @@ Stellar CLI.
 Currently used for demo and experimenting purposes.
 """
 import argparse
+import os
 import sys
 from time import time
 from enum import Enum
@@ -11,19 +12,21 @@ from functools import partial
 
 import numpy as np
 from roboviz import MapVisualizer
-from skimage.transform import resize
 from bresenham import bresenham
 from tqdm import tqdm
 
 
 from stellar.action import motion
-from stellar.cognition import mapping, planning, tracking
+from stellar.communication.map_delta import MapDeltaEncoder
+from stellar.cognition import control, mapping, planning
 from stellar.models.astar import AStarPlanner
-from stellar.models.gridmap import OccupancyGridMap
-from stellar.models.robot import Robot
+from stellar.models.gridmap import LogOddsGrid, OccupancyGridMap
+from stellar.models.robot import Robot, RobotBatch
 from stellar.perception import sensors
-from stellar.perception.sensors import SensorArray
-from stellar.simulation.data import load_world, png_to_ogm
+from stellar.perception.sensors import SensorArray, send_message
+from stellar.simulation.data import load_world
+from stellar.simulation.run_file import RunWriter, load_map
+from stellar.utils import load_ogm
 
 VERSION = "0.0.1"
 HEADER = r"""
@@ -51,11 +54,6 @@ class MODE(Enum):
     WALL_FOLLOW = 1
 
 
-def store_simulation_data_at_step(step, occupancy_grid_map):
-    with open(f"logs/ogm_savefile_{step}.np", 'wb+') as fd:
-        np.save(fd, occupancy_grid_map)
-
-
 def is_in_goal(robot, goal):
     """
     Checks wether robot is in goal.
@@ -72,10 +70,18 @@ def is_in_goal(robot, goal):
 
 
 def simulate_learning_mode(robot: Robot, world: np.ndarray, sensors: SensorArray,
-                           scale: float, visualization: MapVisualizer = None):
+                           scale: float, visualization: MapVisualizer = None,
+                           map_encoder: MapDeltaEncoder = None, run_writer: RunWriter = None,
+                           occupancy_grid_map: LogOddsGrid = None):
     """
     Run the learning mode simulation.
 
+    If a map encoder is given, the changes of the map are published
+    to the observatory after every step. If a run writer is given, the
+    pose and sonar readings of every step are recorded, along with
+    snapshots of the map. Pass the map the run writer was created
+    with as occupancy_grid_map, a new one is created otherwise.
+
     Returns:
         The simulation returns a tuple consisting of the constructed
         occupancy grid map, the robots configuration and the history
@@ -84,7 +90,8 @@ def simulate_learning_mode(robot: Robot, world: np.ndarray, sensors: SensorArray
     """
     steer = 0       # Relative change in direction
     step = 0
-    occupancy_grid_map = np.zeros(world.shape)
+    if occupancy_grid_map is None:
+        occupancy_grid_map = mapping.create_log_odds_grid(world.shape)
     previous_time = time()
     history = list()
 
@@ -97,8 +104,8 @@ def simulate_learning_mode(robot: Robot, world: np.ndarray, sensors: SensorArray
     while not robot_is_in_goal(goal):
         progress_bar.update(1)
         if visualization is not None:
-            if not visualization.display(robot, occupancy_grid_map, mapping.LOG_ODD_MIN, mapping.LOG_ODD_MAX):
-                store_simulation_data_at_step(step, occupancy_grid_map)
+            log_odds = occupancy_grid_map.log_odds()
+            if not visualization.display(robot, log_odds, mapping.LOG_ODD_MIN, mapping.LOG_ODD_MAX):
                 exit(0)
 
         # Calculate distance based on MPS and timedelta
@@ -113,17 +120,29 @@ def simulate_learning_mode(robot: Robot, world: np.ndarray, sensors: SensorArray
         map_pose = robot.pose_in_grid(map_scale_meters_per_pixel)
         # Retrieve measurements from ultrasonic sensors
         distance_measurements = sensors.sense(world, map_pose)
+        if run_writer is not None:
+            run_writer.write_tick(map_pose, [distance for _, distance in distance_measurements],
+                                  occupancy_grid_map)
 
         # Update occupancy grid map with new information
         for angle, measurement in distance_measurements:
-            occupancy_grid_map = mapping.update_occupancy_map(
+            _, region = mapping.update_occupancy_map(
                 occupancy_grid_map,
                 map_pose,
                 measurement,
                 angle,
                 sensors.sonar_opening_angle,
-                sensors.z_max
+                sensors.z_max,
+                return_region=True,
+                out=occupancy_grid_map
             )
+            if map_encoder is not None:
+                map_encoder.mark_dirty(region)
+
+        if map_encoder is not None:
+            map_delta = map_encoder.encode(occupancy_grid_map)
+            if map_delta is not None:
+                send_message('cognition/mapping', map_delta)
 
         # Convert sensor measurements back to meters
         front, left, right = [distance * map_scale_meters_per_pixel
@@ -133,7 +152,72 @@ def simulate_learning_mode(robot: Robot, world: np.ndarray, sensors: SensorArray
         step += 1
         history.append((robot.x, robot.y))
 
-    return (occupancy_grid_map, robot, history)
+    return (occupancy_grid_map.log_odds(), robot, history)
+
+
+def simulate_learning_mode_batch(robots: RobotBatch, world: np.ndarray, sensors: SensorArray,
+                                 scale: float, speeds=SPEED_MPS, gains=10, dt=0.1,
+                                 max_steps=5000):
+    """
+    Run the learning mode simulation for many robots at once.
+
+    Unlike `simulate_learning_mode`, time advances in fixed steps of `dt`
+    seconds, so runs are reproducible. Robots stop once they are in goal.
+
+    Args:
+        robots:     The robots, with their start poses set.
+        speeds:     Speed in meters per second, per robot or for all.
+        gains:      Follow wall gain (degrees), per robot or for all.
+        dt:         Simulated time per step (s).
+        max_steps:  Stop after this number of steps.
+
+    Returns:
+        The simulation returns a tuple consisting of the constructed
+        occupancy grid maps, the robots configuration and the history
+        of their positions (steps x robots x 2).
+
+    """
+    steer = np.zeros(len(robots))
+    occupancy_grid_maps = np.zeros((len(robots),) + world.shape)
+    history = list()
+
+    goal = (2.5, 2.5)
+    active = np.ones(len(robots), dtype=bool)
+
+    for _ in tqdm(range(max_steps)):
+        active &= ~robots.in_goal(goal, min_distance=5.0, proximity=2.0)
+        if not active.any():
+            break
+
+        robots.move(np.where(active, np.multiply(speeds, dt), 0.0),
+                    np.where(active, np.radians(steer), 0.0))
+
+        # Get current positions in grid (pixel/cell wise)
+        map_poses = robots.pose_in_grid(scale)
+        # Retrieve measurements from ultrasonic sensors
+        distance_measurements = sensors.sense_batch(world, map_poses)
+
+        # Update occupancy grid maps of the moving robots
+        indices = np.flatnonzero(active)
+        active_poses = tuple(value[indices] for value in map_poses)
+        for i, (_, angle) in enumerate(sensors.sonar_sensors):
+            mapping.update_occupancy_maps(
+                occupancy_grid_maps,
+                active_poses,
+                distance_measurements[indices, i],
+                angle,
+                sensors.sonar_opening_angle,
+                sensors.z_max,
+                indices=indices
+            )
+
+        # Convert sensor measurements back to meters
+        front, left, right = (distance_measurements * scale).T
+
+        steer = motion.follow_wall_batch(front, left, right, gains)
+        history.append(np.column_stack((robots.x, robots.y)))
+
+    return (occupancy_grid_maps, robots, np.array(history))
 
 
 class Postprocessing:
@@ -171,7 +255,7 @@ def contest(datafile):
         (60, 50)
     ]
 
-    occupancy_grid_map = np.load(datafile)
+    occupancy_grid_map = load_map(datafile)
 
     occupancy_grid_map = Postprocessing.connect_pylons(occupancy_grid_map,
                                                        pylons)
@@ -207,15 +291,7 @@ def contest(datafile):
     [plt.plot(x, y, marker='x')
      for x, y in robot_history if should_plot_waypoints]
 
-    path = list()
-    to_ = None
-    from_ = (25, 25)
-    for waypoint in robot_history:
-        to_ = waypoint
-        print(from_, "=>", to_)
-        planned_path = planner.plan(occupancy_grid_map, from_, to_)
-        path.extend(planned_path)
-        from_ = waypoint
+    path = planner.plan_route(occupancy_grid_map, (25, 25), robot_history)
 
     # path = planner.plan(occupancy_grid_map, (25, 25), robot_history[0])
     # path_second = planner.plan(occupancy_grid_map, path[-1], robot_history[1])
@@ -251,90 +327,32 @@ def contest(datafile):
 
 def run(robot, reference, tau_p, tau_d, tau_i, n=100, speed=1.0, world=None):
     """Run the robot simulation."""
-    x_trajectory = []
-    y_trajectory = []
-
     viz = MapVisualizer(MAP_SIZE_PIXELS, MAP_SIZE_METERS,
                         'StellarAI Visualization', True, reference_trajectory=np.array(reference))
 
-    reference = np.array(reference)
-
-    previous_crosstrack_error = tracking.cte(robot, reference, 0)
-    integral_cte = 0.0
-    steer = robot.theta
-    err = 0
-    for t in range(n):
+    def display(t, robot):
         if t % 5 == 0:
-            print("UPDATE")
+            print(f"[t: {t}, robot: {robot}]")
             viz.display(robot, world, mapping.LOG_ODD_MIN, mapping.LOG_ODD_MAX)
 
-        crosstrack_error = tracking.cte(robot, reference, t)
-
-        differential_cte = (crosstrack_error - previous_crosstrack_error)
-        previous_crosstrack_error = crosstrack_error
-        integral_cte += crosstrack_error
-
-        steer = (-tau_p * crosstrack_error - tau_d *
-                 differential_cte - tau_i * integral_cte)
-
-        #steer = np.radians(steer)
-        print(
-            f"[steer: {steer:.4f}\tcte: {crosstrack_error:.4f}, robot: {robot}]")
-        # print(steer)
-        robot.move(speed, steer)
-        err += crosstrack_error
+    return control.simulate(robot, reference, tau_p, tau_d, tau_i,
+                            n=n, speed=speed, callback=display)
 
-        x_trajectory.append(robot.x)
-        y_trajectory.append(robot.y)
 
-    return x_trajectory, y_trajectory, err / n
+def twiddle(path, n, tol=0.1, processes=None):
+    """Tune the PID gains headless, evaluating candidates in parallel."""
+    evaluate = control.TrackingEvaluator(path, (25, 25, np.radians(90)), n=n)
+    return control.twiddle(evaluate, tol=tol, processes=processes)
 
 
-def twiddle(path, n, tol=0.1):
-    p = [0, 0, 0.0]
-    dp = [1.0, 1.0, 1.0]
-    robot = Robot()
-    robot.set(25, 25, np.radians(90))
-    x_trajectory, y_trajectory, best_err = run(robot, path, *p, n=n)
-
-    it = 0
-    while sum(dp) > tol:
-        print("Iteration {}, best error = {}, dp = {}".format(
-            it, best_err, sum(dp)))
-        for i in range(len(p)):
-            p[i] += dp[i]
-            robot = Robot()
-            robot.set(25, 25, np.radians(90))
-            x_trajectory, y_trajectory, err = run(robot, path, *p, n=n)
-
-            if err < best_err:
-                best_err = err
-                dp[i] *= 1.1
-            else:
-                p[i] -= 2 * dp[i]
-
-                x_trajectory, y_trajectory, err = run(robot, path, *p, n=n)
-
-                if err < best_err:
-                    best_err = err
-                    dp[i] *= 1.1
-                else:
-                    p[i] += dp[i]
-                    dp[i] *= 0.9
-        it += 1
-    return p, best_err
-
-
-def main(parcours_filename):
+def main(parcours_filename, run_filename):
 
     # Create a MapVisualizer to track the robots behaviour
     viz = MapVisualizer(MAP_SIZE_PIXELS, MAP_SIZE_METERS,
                         'StellarAI Visualization', True)
 
     # Load preconstructed environment / world
-    mapbytes = np.array(png_to_ogm(parcours_filename, normalized=True))
-
-    mapbytes = resize(mapbytes, (MAP_SIZE_PIXELS, MAP_SIZE_PIXELS))
+    mapbytes = load_ogm(parcours_filename, (MAP_SIZE_PIXELS, MAP_SIZE_PIXELS))
     occupancy_grid_map = np.zeros(mapbytes.shape)
 
     # Sonar configuration: three sensors are mounted on the roboter
@@ -356,9 +374,14 @@ def main(parcours_filename):
     robot = Robot()
     robot.set(2, 2, np.radians(90))
 
-    # Start learning drive
-    occupancy_grid_map, robot, history = simulate_learning_mode(
-        robot, mapbytes, sensors, viz.map_scale_meters_per_pixel, visualization=viz)
+    # Start learning drive, recording it for replay and contest mode
+    os.makedirs(os.path.dirname(run_filename) or '.', exist_ok=True)
+    occupancy_grid_map = mapping.create_log_odds_grid(mapbytes.shape)
+    with RunWriter(run_filename, occupancy_grid_map, sensors) as run_writer:
+        occupancy_grid_map, robot, history = simulate_learning_mode(
+            robot, mapbytes, sensors, viz.map_scale_meters_per_pixel, visualization=viz,
+            map_encoder=MapDeltaEncoder(mapbytes.shape), run_writer=run_writer,
+            occupancy_grid_map=occupancy_grid_map)
 
     print("=> Terminated learning mode. Post-processing collected information...")
 
@@ -371,21 +394,42 @@ def main(parcours_filename):
         sampled_pylon_positions, occupancy_grid_map)
 
     # 2. Plan path through track
-    path = list()
-    path_planner = planning.GridPlaner()
-    _to, _from = None, (robot.x, robot.y)
-    for waypoint in history:
-        _to = waypoint
-        print(_from, "=>", _to)
-        segment = planner.plan(occupancy_grid_map, _from, _to)
-        path.extend(segment)
-        _from = waypoint
+    planner = planning.AStarPlanner()
+    path = planner.plan_route(occupancy_grid_map, (robot.x, robot.y), history)
 
     #   3. Optimize (i.e. smooth) track
 
     # Start contest mode
 
 
+def sweep(parcours_filename, number_of_robots, max_steps, seed=None):
+    """Run the learning mode for many robots with randomized parameters."""
+    scale = MAP_SIZE_METERS / MAP_SIZE_PIXELS
+    world = load_ogm(parcours_filename, (MAP_SIZE_PIXELS, MAP_SIZE_PIXELS))
+    sensors = SensorArray(int(4 / scale))
+
+    rng = np.random.default_rng(seed)
+    robots = RobotBatch(number_of_robots)
+    robots.set(rng.uniform(1.5, 2.5, number_of_robots),
+               rng.uniform(1.5, 2.5, number_of_robots),
+               np.radians(rng.uniform(80, 100, number_of_robots)))
+    speeds = rng.uniform(0.25, 1.0, number_of_robots)
+    gains = rng.uniform(5, 15, number_of_robots)
+
+    start = time()
+    _, robots, history = simulate_learning_mode_batch(
+        robots, world, sensors, scale, speeds, gains, max_steps=max_steps)
+    elapsed = time() - start
+
+    in_goal = robots.in_goal((2.5, 2.5), min_distance=5.0, proximity=2.0)
+    print(f"{len(history)} steps in {elapsed:.2f}s "
+          f"({elapsed / max(len(history), 1) * 1000:.2f} ms per step), "
+          f"{in_goal.sum()}/{number_of_robots} robots in goal.")
+    for i in np.flatnonzero(in_goal):
+        print(f"  speed: {speeds[i]:.2f} m/s, gain: {gains[i]:.1f}, "
+              f"distance: {robots.total_distance_covered[i]:.1f} m")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Stellar CLI')
 
@@ -394,19 +438,34 @@ if __name__ == "__main__":
     learn_mode_args = subparsers.add_parser('learn')
     learn_mode_args.add_argument('--parcours', required=True,
                                  help="Path to parcours image.")
+    learn_mode_args.add_argument('--run-file', default='logs/learning.run',
+                                 help="Path to record the run to.")
 
     # Run contest mode from prerecorded data
     contest_mode_args = subparsers.add_parser('contest')
     contest_mode_args.add_argument('--datafile', required=True,
-                                   help='Path to the datafile.')
+                                   help='Path to the run file of a learning run, or a saved map.')
+
+    # Run learning mode for many robots with randomized parameters
+    sweep_mode_args = subparsers.add_parser('sweep')
+    sweep_mode_args.add_argument('--parcours', required=True,
+                                 help="Path to parcours image.")
+    sweep_mode_args.add_argument('--robots', type=int, default=100,
+                                 help="Number of simulated robots.")
+    sweep_mode_args.add_argument('--steps', type=int, default=5000,
+                                 help="Maximum number of simulation steps.")
+    sweep_mode_args.add_argument('--seed', type=int, default=None,
+                                 help="Seed for the randomized parameters.")
 
     args = parser.parse_args()
 
     try:
         if args.mode == 'learn':
-            main(args.parcours)
+            main(args.parcours, args.run_file)
         elif args.mode == 'contest':
             contest(args.datafile)
+        elif args.mode == 'sweep':
+            sweep(args.parcours, args.robots, args.steps, args.seed)
         else:
             print(f"Unknown mode: {args.mode}. Stopping.")
     except KeyboardInterrupt:
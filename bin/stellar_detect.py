@@ -0,0 +1,55 @@
+"""
+Stellar batch pylon detection.
+
+Detects pylons in a directory of frames or a video and writes the results
+as JSON lines (frame id, boxes, distances, timing). Aggregate throughput
+is printed to stderr.
+"""
+import argparse
+import json
+import sys
+import time
+
+from stellar.perception import pylon_batch
+
+
+def summarize(results: list, elapsed: float) -> str:
+    frames = len(results)
+    pylons = sum(len(result['pylons']) for result in results)
+    decode_ms = sum(result['decode_ms'] for result in results) / max(frames, 1)
+    detect_ms = sum(result['detect_ms'] for result in results) / max(frames, 1)
+    fps = frames / elapsed if elapsed > 0 else 0.0
+    return (f"{frames} frames, {pylons} pylons in {elapsed:.2f} s: {fps:.2f} fps "
+            f"(mean decode {decode_ms:.2f} ms, mean detect {detect_ms:.2f} ms per frame)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Stellar batch pylon detection')
+    parser.add_argument('source', help="Directory of frames or video file.")
+    parser.add_argument('-o', '--output', default='-',
+                        help="JSON lines output file, defaults to stdout.")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="Number of detection processes, defaults to the number of CPUs.")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="Number of threads decoding frames of a directory.")
+    parser.add_argument('--segregation', choices=['mean-shift', 'median'], default=None,
+                        help="Color segregation mode.")
+    parser.add_argument('--rotate', action='store_true',
+                        help="Rotate video frames by 180 degrees, as recorded by the picam.")
+    args = parser.parse_args()
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    results = []
+    started = time.perf_counter()
+    try:
+        frames = pylon_batch.read_frames(args.source, args.threads, args.rotate)
+        for result in pylon_batch.detect_frames(frames, args.processes, args.segregation):
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+            results.append(result)
+    except KeyboardInterrupt:
+        sys.exit(1)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        print(summarize(results, time.perf_counter() - started), file=sys.stderr)
@@ -8,9 +8,10 @@ import matplotlib.pyplot as plt
 
 from bresenham import bresenham
 
-from stellar.cognition import mapping
-from stellar.cognition.planning import GridPlaner
+from stellar.cognition import control, mapping
+from stellar.cognition.planning import AStarPlanner
 from stellar.models.robot import Robot
+from stellar.simulation.run_file import load_map
 
 
 
@@ -24,7 +25,7 @@ def dist(a, b):
 def main(mapfile):
 
     # Prepare environment from saved parcours
-    occupancy_grid_map = np.load(mapfile)
+    occupancy_grid_map = load_map(mapfile)
     pylons = [
         (50, 75),
         (75, 150),
@@ -35,7 +36,7 @@ def main(mapfile):
 
     occupancy_grid_map = mapping.connect_pylons(pylons, occupancy_grid_map)
 
-    planner = GridPlaner()
+    planner = AStarPlanner()
 
     # Sample waypoints to direct A*
     robot_history = [
@@ -54,15 +55,7 @@ def main(mapfile):
     [plt.plot(x, y, marker='x')
      for x, y in robot_history if should_plot_waypoints]
 
-    path = list()
-    to_ = None
-    from_ = (25, 25)
-    for waypoint in robot_history:
-        to_ = waypoint
-        print(from_, "=>", to_)
-        planned_path = planner.plan(occupancy_grid_map, from_, to_)
-        path.extend(planned_path)
-        from_ = waypoint
+    path = planner.plan_route(occupancy_grid_map, (25, 25), robot_history)
 
     # path = planner.plan(occupancy_grid_map, (25, 25), robot_history[0])
     # path_second = planner.plan(occupancy_grid_map, path[-1], robot_history[1])
@@ -145,51 +138,33 @@ def run(robot, reference, tau_p, tau_d, tau_i, n=100, speed=1.0):
     return x_trajectory, y_trajectory, err / n
 
 
-def twiddle(path, n, tol=0.01):
-    # TODO: Add code here
-    # Don't forget to call `make_robot` before you call `run`!
-    p = [0, 0, 0.0]
-    dp = [1.0, 1.0, 1.0]
-    robot = Robot()
-    robot.set(60, 180, 0)
-    x_trajectory, y_trajectory, best_err = run(robot, path, *p, n=n)
-
-    it = 0
-    while sum(dp) > tol:
-        # print("Iteration {}, best error = {}".format(it, best_err))
-        for i in range(len(p)):
-            p[i] += dp[i]
-            robot = Robot()
-            robot.set(60, 180, 0)
-            x_trajectory, y_trajectory, err = run(robot, path, *p, n=n)
-
-            if err < best_err:
-                best_err = err
-                dp[i] *= 1.1
-            else:
-                p[i] -= 2 * dp[i]
-
-                x_trajectory, y_trajectory, err = run(robot, path, *p, n=n)
-
-                if err < best_err:
-                    best_err = err
-                    dp[i] *= 1.1
-                else:
-                    p[i] += dp[i]
-                    dp[i] *= 0.9
-        it += 1
-    return p, best_err
+class RunEvaluator(control.TrackingEvaluator):
+    """Average crosstrack error of a `run` with the given gains.
+
+    Keyed by the contents of the path, so errors are cached across calls.
+    """
+
+    def __call__(self, gains):
+        robot = Robot()
+        robot.set(*self.start)
+        _, _, err = run(robot, self.reference, *gains, n=self.n, speed=self.speed)
+        return err
+
+
+def twiddle(path, n, tol=0.01, processes=None):
+    """Tune the PID gains, evaluating candidates in parallel."""
+    return control.twiddle(RunEvaluator(path, (60, 180, 0), n=n),
+                           tol=tol, processes=processes)
 
 
 if __name__ == "__main__":
-    # parser = argparse.ArgumentParser()
-    # parser.add_argument("--saved-map",
-    #                     required=True,
-    #                     help="Path to stored map.")
-    # args = parser.parse_args()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--saved-map",
+                        default="logs/learning.run",
+                        help="Path to the run file of a learning run, or a saved map.")
+    args = parser.parse_args()
 
     try:
-        # main(args.saved_map)
-        main("logs/ogm_savefile_533.np")
+        main(args.saved_map)
     except KeyboardInterrupt:
         sys.exit(1)
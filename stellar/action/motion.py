@@ -23,6 +23,28 @@ def follow_wall(front, left, right):
     return change_direction
 
 
+def follow_wall_batch(front, left, right, gain=10):
+    """Vectorized follow wall controller for many robots.
+
+    Args:
+        front, left, right: Arrays with the measured distances (m).
+        gain:               Change of direction when correcting, per robot
+                            or for all.
+
+    Returns:
+        An array with the change of direction for each robot.
+    """
+    gain = np.asarray(gain)
+
+    return np.select(
+        [(0 < front) & (front < 3),
+         (1.0 <= left) & (left <= 2.0),
+         (0 < left) & (left < 1.0),
+         left > 2.0],
+        [-gain, 0, -gain, gain],
+        default=0)
+
+
 def move(pose, number_of_steps, direction):
     """Move the robot in the world.
 
@@ -16,3 +16,177 @@ reference trajectory (i.e. the planned path)
 The greater this error is, the more the vehicle has to steer to this reference.
 
 """
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from stellar.cognition import tracking
+from stellar.models.robot import Robot
+
+# Errors of already simulated (path, gains) combinations.
+twiddle_cache: dict = {}
+# Oldest errors are evicted beyond that many entries.
+TWIDDLE_CACHE_SIZE = 10000
+
+
+def simulate(robot, reference, tau_p, tau_d, tau_i, n=100, speed=1.0, callback=None):
+    """Simulate the robot tracking the reference path with a PID controller.
+
+    Pure simulation, i.e. no visualization and no output. Use `callback`
+    to observe the robot.
+
+    Args:
+        robot:      The robot, set to its start pose. Is moved in place.
+        reference:  The reference path, a list of (x, y) coordinates.
+        tau_p:      Proportional gain.
+        tau_d:      Differential gain.
+        tau_i:      Integral gain.
+        n:          Number of simulation steps.
+        speed:      Distance covered per step.
+        callback:   Called with the step and the robot before each step.
+
+    Returns:
+        The x- and y-coordinates of the trajectory and the average
+        crosstrack error.
+
+    """
+    x_trajectory = []
+    y_trajectory = []
+
+    reference = np.array(reference)
+
+    # The crosstrack error latches once the robot passed the far side of
+    # the track, every simulation has to start afresh.
+    tracking.GOO = False
+
+    previous_crosstrack_error = tracking.cte(robot, reference, 0)
+    integral_cte = 0.0
+    err = 0
+    for t in range(n):
+        if callback is not None:
+            callback(t, robot)
+
+        crosstrack_error = tracking.cte(robot, reference, t)
+
+        differential_cte = (crosstrack_error - previous_crosstrack_error)
+        previous_crosstrack_error = crosstrack_error
+        integral_cte += crosstrack_error
+
+        steer = (-tau_p * crosstrack_error - tau_d *
+                 differential_cte - tau_i * integral_cte)
+
+        robot.move(speed, steer)
+        err += crosstrack_error
+
+        x_trajectory.append(robot.x)
+        y_trajectory.append(robot.y)
+
+    return x_trajectory, y_trajectory, err / n
+
+
+class TrackingEvaluator:
+    """Evaluates PID gains by simulating a robot tracking a path.
+
+    Instances are picklable, so they can be evaluated in worker processes.
+    """
+
+    def __init__(self, reference, start, n=100, speed=1.0):
+        """
+        Args:
+            reference:  The reference path, a list of (x, y) coordinates.
+            start:      Start pose (x, y, theta) of the robot.
+            n:          Number of simulation steps.
+            speed:      Distance covered per step.
+
+        """
+        self.reference = np.array(reference, dtype=float)
+        self.start = tuple(start)
+        self.n = n
+        self.speed = speed
+
+        digest = hashlib.sha1(self.reference.tobytes()).hexdigest()
+        self.key = (type(self).__qualname__, digest, self.reference.shape, self.start, n, speed)
+
+    def __call__(self, gains):
+        robot = Robot()
+        robot.set(*self.start)
+        _, _, err = simulate(robot, self.reference, *gains,
+                             n=self.n, speed=self.speed)
+        return err
+
+
+def evaluate_gains(pool, evaluate, candidates):
+    """Evaluates candidate gains in the process pool.
+
+    Candidates that have already been evaluated are looked up in
+    `twiddle_cache`, keyed by `evaluate.key` (or `evaluate` itself) and
+    the gains. The cache keeps the last TWIDDLE_CACHE_SIZE errors.
+    """
+    evaluator_key = getattr(evaluate, 'key', evaluate)
+    keys = [(evaluator_key, tuple(gains)) for gains in candidates]
+
+    missing = list({key[1]: key for key in keys if key not in twiddle_cache}.values())
+    for key, err in zip(missing, pool.map(evaluate, [key[1] for key in missing])):
+        twiddle_cache[key] = err
+
+    errors = [twiddle_cache[key] for key in keys]
+    # Dicts keep insertion order, the first keys are the oldest.
+    for key in list(twiddle_cache)[:max(len(twiddle_cache) - TWIDDLE_CACHE_SIZE, 0)]:
+        del twiddle_cache[key]
+    return errors
+
+
+def twiddle(evaluate, p=(0, 0, 0.0), dp=(1.0, 1.0, 1.0), tol=0.1, processes=None):
+    """Searches PID gains minimizing the error returned by `evaluate`.
+
+    Parallel variant of twiddle (coordinate descent): in each iteration,
+    increasing and decreasing each gain is evaluated concurrently. The
+    best improving candidate is taken, the step sizes of improving gains
+    grow and those of the others shrink.
+
+    Args:
+        evaluate:   Picklable callable returning the error for a list of gains.
+        p:          Initial gains.
+        dp:         Initial step sizes.
+        tol:        Stop once the sum of step sizes is below.
+        processes:  Number of worker processes, defaults to the CPU count.
+
+    Returns:
+        The best gains and their error.
+
+    """
+    p = list(p)
+    dp = list(dp)
+
+    with ProcessPoolExecutor(processes) as pool:
+        best_err, = evaluate_gains(pool, evaluate, [p])
+
+        it = 0
+        while sum(dp) > tol:
+            print("Iteration {}, best error = {}, dp = {}".format(
+                it, best_err, sum(dp)))
+
+            candidates = []
+            for i in range(len(p)):
+                for sign in (1, -1):
+                    candidate = list(p)
+                    candidate[i] += sign * dp[i]
+                    candidates.append(candidate)
+
+            errors = evaluate_gains(pool, evaluate, candidates)
+
+            best_candidate = int(np.argmin(errors))
+            improved = errors[best_candidate] < best_err
+            for i in range(len(p)):
+                if min(errors[2 * i], errors[2 * i + 1]) < best_err:
+                    dp[i] *= 1.1
+                else:
+                    dp[i] *= 0.9
+
+            if improved:
+                p = candidates[best_candidate]
+                best_err = errors[best_candidate]
+            it += 1
+
+    return p, best_err
@@ -6,6 +6,7 @@ from math import floor
 import numpy as np
 from bresenham import bresenham
 
+from stellar.models.gridmap import LogOddsGrid, TiledGrid
 from stellar.perception.sensors import get_occupied_cell_from_distance
 
 
@@ -80,20 +81,179 @@ def inverse_range_sensor_model(cell, pose, relative_sensor_angle, beta, z_max, z
         return -1
 
 
-def update_occupancy_map(gridmap, pose, measurement, sonar_bearing_angle, sonar_opening_angle, z_max):
+def inverse_range_sensor_model_batch(xs, ys, pose, relative_sensor_angle, beta, z_max, z_t):
+    """Vectorized version of `inverse_range_sensor_model`.
+
+    Evaluates the model for all cells spanned by `xs` and `ys` at once.
+    The arrays are broadcast against each other, e.g. a row of x and a
+    column of y coordinates yield the model for the whole bounding box.
+    Pose and measurement may be arrays as well, to evaluate the model
+    for many robots at once. The same operations as in the per-cell
+    model are applied, so the results are identical.
+
+    Args:
+        xs: x coordinates of the cells (broadcastable against ys).
+        ys: y coordinates of the cells (broadcastable against xs).
+        pose: A tuple of the robot pose, consisting of x, y and theta.
+        relative_sensor_angle: Angle of the sensor relative to the roboter
+        beta: Opening angle of range sensor
+        z_max: Maximum range of sensor
+        z_t: Sensor measurement at time t
+
+    Returns:
+        An int8 array indicating for each cell whether its state is
+        unknown (0), occupied (1) or free (-1).
+
+    """
+    alpha = 2  # obstacle thickness
+    xr, yr, theta_r = pose
+
+    sonar_theta = relative_sensor_angle
+
+    r = np.sqrt(np.square(xs - xr) + np.square(ys - yr))
+    phi = np.arctan2(ys - yr, xs - xr) - theta_r
+
+    phi = np.where(phi >= np.pi, phi - 2 * np.pi,
+                   np.where(phi <= -np.pi, phi + 2 * np.pi, phi))
+
+    unknown = (r > np.minimum(z_max, z_t + alpha / 2)) | \
+        (np.abs(phi - sonar_theta) > (beta / 2))
+    occupied = ~unknown & (z_t < z_max) & (np.abs(r - z_t) < alpha / 2)
+    free = ~unknown & ~occupied
+
+    cells = np.zeros(np.shape(r), dtype=np.int8)
+    cells[occupied] = 1
+    cells[free] = -1
+
+    return cells
+
+
+def apply_log_odds(gridmap, ys, xs, cells):
+    """Apply the outcome of the inverse sensor model to the gridmap.
+
+    Args:
+        gridmap: Occupancy grid map to update in place (2D).
+        ys: Row indices covered by `cells`.
+        xs: Column indices covered by `cells`.
+        cells: Output of `inverse_range_sensor_model_batch`.
+
+    """
+    if ys.size == 0 or xs.size == 0:
+        return
+
+    if ys[0] >= 0 and xs[0] >= 0:
+        window = gridmap[ys[0]:ys[-1] + 1, xs[0]:xs[-1] + 1]
+        window[cells == -1] -= LOG_ODD_FREE
+        window[cells == 1] += LOG_ODD_OCCU
+        return
+
+    # Negative indices wrap around, so a cell may be hit twice. Accumulate
+    # unbuffered and in row-major order, just like a loop over the cells.
+    rows, cols = np.nonzero(cells)
+    deltas = np.where(cells[rows, cols] == 1, LOG_ODD_OCCU, -LOG_ODD_FREE)
+    np.add.at(gridmap, (ys[rows], xs[cols]), deltas)
+
+
+def create_log_odds_grid(shape, dtype=np.int8):
+    """Creates a compact occupancy grid map for `update_occupancy_map`,
+    saturating at LOG_ODD_MIN and LOG_ODD_MAX.
+
+    Args:
+        shape: Shape of the map (height, width).
+        dtype: np.int8 (fixed point) or np.float16, see `LogOddsGrid`.
+
+    """
+    return LogOddsGrid(shape, (LOG_ODD_MIN, LOG_ODD_MAX), dtype)
+
+
+def update_log_odds_grid(grid, pose, ys, xs, cells):
+    """Apply the outcome of the inverse sensor model to a `LogOddsGrid`.
+
+    Unlike for arrays, cells outside the grid are ignored instead of
+    wrapping around. Updates saturate cell by cell and only the window
+    spanned by `ys` and `xs` is touched.
+
+    Args:
+        grid: Occupancy grid map to update in place.
+        pose: Robots pose, its cell is marked free.
+        ys: Row indices covered by `cells`.
+        xs: Column indices covered by `cells`.
+        cells: Output of `inverse_range_sensor_model_batch`.
+
+    """
+    height, width = grid.shape
+    if 0 <= pose[1] < height and 0 <= pose[0] < width:
+        grid.add((slice(pose[1], pose[1] + 1), slice(pose[0], pose[0] + 1)), -LOG_ODD_FREE)
+
+    rows = (ys >= 0) & (ys < height)
+    cols = (xs >= 0) & (xs < width)
+    if not rows.any() or not cols.any():
+        return
+
+    ys, xs, cells = ys[rows], xs[cols], cells[rows][:, cols]
+    # Increments for free (-1), unknown (0) and occupied (1) cells.
+    increments = grid.to_units([-LOG_ODD_FREE, 0, LOG_ODD_OCCU])
+    grid.add_units((slice(ys[0], ys[-1] + 1), slice(xs[0], xs[-1] + 1)), increments[cells + 1])
+
+
+def update_tiled_grid(grid, pose, ys, xs, cells):
+    """Apply the outcome of the inverse sensor model to a `TiledGrid` in place.
+
+    Cells are addressed absolutely, so nothing wraps around, poses may
+    be anywhere and the grid grows to cover the sonar cone. Only the
+    window spanned by the pose, `ys` and `xs` is read, updated, clipped
+    and written back.
+
+    Args:
+        grid: Occupancy grid map to update in place.
+        pose: Robots pose, its cell is marked free.
+        ys: Row indices covered by `cells`.
+        xs: Column indices covered by `cells`.
+        cells: Output of `inverse_range_sensor_model_batch`.
+
+    Returns:
+        The updated region (min_y, max_y, min_x, max_x), maxima exclusive.
+
+    """
+    x, y = int(pose[0]), int(pose[1])
+    min_y, max_y, min_x, max_x = y, y + 1, x, x + 1
+    if ys.size and xs.size:
+        min_y, max_y = min(min_y, ys[0]), max(max_y, ys[-1] + 1)
+        min_x, max_x = min(min_x, xs[0]), max(max_x, xs[-1] + 1)
+
+    window = (slice(min_y, max_y), slice(min_x, max_x))
+    values = grid[window]
+    values[y - min_y, x - min_x] -= LOG_ODD_FREE
+    apply_log_odds(values, ys - min_y, xs - min_x, cells)
+    grid[window] = np.clip(values, LOG_ODD_MIN, LOG_ODD_MAX)
+
+    return min_y, max_y, min_x, max_x
+
+
+def update_occupancy_map(gridmap, pose, measurement, sonar_bearing_angle, sonar_opening_angle, z_max,
+                         return_region=False, out=None):
     """Update occupancy grid map with new measurement.
 
     Args:
-        gridmap: Occupancy grid map to update (2D)
+        gridmap: Occupancy grid map to update (2D array), or a `LogOddsGrid`
+                 or `TiledGrid` which is updated in place, see
+                 `update_log_odds_grid` and `update_tiled_grid`.
         pose: Robots current pose
         measurement: Distance measurement from sonar
         sonar_bearing_angle: Bearing angle of the sonar, relative to robot (rad).
         sonar_opening_angle: Opening angle of the sonar (rad).
         z_max: Maximum range of the sonar.
-
+        return_region: Also return the region of the map which may have changed.
+        out: Array to store the updated map in, pass `gridmap` itself to
+             update it in place. Only cells within the changed region are
+             clipped, so all other cells must already be within
+             LOG_ODD_MIN and LOG_ODD_MAX. If not given, `gridmap` is
+             modified and a clipped copy of it is returned.
 
     Returns:
-        An updated version of the occupancy grid map.
+        An updated version of the occupancy grid map (`out`, if given). If
+        `return_region` is set, a tuple of the map and the changed region
+        (min_y, max_y, min_x, max_x), see `dirty_region`.
 
     """
 
@@ -120,30 +280,155 @@ def update_occupancy_map(gridmap, pose, measurement, sonar_bearing_angle, sonar_
 
     max_x, min_x, max_y, min_y = fov_bounding_box(pose, B, C)
 
-    # gridmap[min_y:max_y, min_x:max_x] = 10
-    # print(max_y, min_y)
-    if pose[1] <= gridmap.shape[0] and pose[0] <= gridmap.shape[1]:
-        gridmap[pose[1], pose[0]] -= LOG_ODD_FREE
-    for y in range(min_y, min(max_y, gridmap.shape[0])):
-        for x in range(min_x, min(max_x, gridmap.shape[1])):
-            p = inverse_range_sensor_model(
-                (x, y),
-                pose,
-                sonar_bearing_angle,
-                sonar_opening_angle,
-                z_max,
-                measurement)
-
-            if p == -1:
-                gridmap[y, x] -= LOG_ODD_FREE
-
-            if p == 1:
-                gridmap[y, x] += LOG_ODD_OCCU
-
-            if p == 0:
-                pass
-
-    return np.clip(gridmap, a_max=LOG_ODD_MAX, a_min=LOG_ODD_MIN)
+    is_log_odds_grid = isinstance(gridmap, LogOddsGrid)
+    is_tiled_grid = isinstance(gridmap, TiledGrid)
+    if out is not None and out is not gridmap:
+        if is_log_odds_grid or is_tiled_grid:
+            raise ValueError(f"A {type(gridmap).__name__} can only be updated in place")
+        np.copyto(out, gridmap)
+        gridmap = out
+
+    if is_tiled_grid:
+        ys = np.arange(min_y, max_y)
+        xs = np.arange(min_x, max_x)
+    else:
+        # gridmap[min_y:max_y, min_x:max_x] = 10
+        # print(max_y, min_y)
+        if not is_log_odds_grid and pose[1] <= gridmap.shape[0] and pose[0] <= gridmap.shape[1]:
+            gridmap[pose[1], pose[0]] -= LOG_ODD_FREE
+
+        ys = np.arange(min_y, min(max_y, gridmap.shape[0]))
+        xs = np.arange(min_x, min(max_x, gridmap.shape[1]))
+    p = inverse_range_sensor_model_batch(
+        xs[np.newaxis, :],
+        ys[:, np.newaxis],
+        pose,
+        sonar_bearing_angle,
+        sonar_opening_angle,
+        z_max,
+        measurement)
+
+    if is_tiled_grid:
+        region = update_tiled_grid(gridmap, pose, ys, xs, p)
+    elif is_log_odds_grid:
+        region = dirty_region(gridmap.shape, pose, ys, xs)
+        update_log_odds_grid(gridmap, pose, ys, xs, p)
+    else:
+        region = dirty_region(gridmap.shape, pose, ys, xs)
+        apply_log_odds(gridmap, ys, xs, p)
+        if out is None:
+            gridmap = np.clip(gridmap, a_max=LOG_ODD_MAX, a_min=LOG_ODD_MIN)
+        else:
+            min_y, max_y, min_x, max_x = region
+            window = gridmap[min_y:max_y, min_x:max_x]
+            np.clip(window, LOG_ODD_MIN, LOG_ODD_MAX, out=window)
+
+    if return_region:
+        return gridmap, region
+    return gridmap
+
+
+def dirty_region(shape, pose, ys, xs):
+    """Region of the map touched by an update of the cells `ys` x `xs` at pose.
+
+    Args:
+        shape: Shape of the map.
+        pose: Robots pose, its cell is updated as well.
+        ys: Row indices of the updated cells.
+        xs: Column indices of the updated cells.
+
+    Returns:
+        The region (min_y, max_y, min_x, max_x) within the map, the maxima
+        are exclusive. Negative indices wrap around, so the region spans
+        the whole axis in that case. The region is empty if
+        min_y == max_y or min_x == max_x.
+
+    """
+    def axis_range(indices, position, size):
+        position = int(position)
+        if position < 0 or (indices.size and indices[0] < 0):
+            return 0, size
+        low, high = position, position + 1
+        if indices.size:
+            low, high = min(low, indices[0]), max(high, indices[-1] + 1)
+        return min(max(low, 0), size), min(max(high, 0), size)
+
+    min_y, max_y = axis_range(ys, pose[1], shape[0])
+    min_x, max_x = axis_range(xs, pose[0], shape[1])
+    return min_y, max_y, min_x, max_x
+
+
+def update_occupancy_maps(gridmaps, poses, measurements, sonar_bearing_angle,
+                          sonar_opening_angle, z_max, indices=None):
+    """Update the occupancy grid maps of many robots, in place.
+
+    Batched version of `update_occupancy_map` for one sonar of each robot.
+    Each robot updates its own map. Cells outside the map are ignored.
+
+    Args:
+        gridmaps: Occupancy grid maps to update (robots x height x width).
+        poses: Tuple of arrays (x, y, theta) with the robots poses in cells.
+        measurements: Distance measurement of each robots sonar.
+        sonar_bearing_angle: Bearing angle of the sonar, relative to robot (rad).
+        sonar_opening_angle: Opening angle of the sonar (rad).
+        z_max: Maximum range of the sonar.
+        indices: Index of the map to update for each pose, defaults to
+                 one pose per map. An index may occur more than once, the
+                 updates of its poses add up before the map is clipped.
+
+    """
+    _, height, width = gridmaps.shape
+    x_r, y_r, theta_r = (np.asarray(value) for value in poses)
+    measurements = np.asarray(measurements, dtype=float)
+    if indices is None:
+        indices = np.arange(len(gridmaps))
+
+    measurements = np.where((measurements == -1) | (measurements == 0),
+                            z_max, measurements)
+
+    B = get_occupied_cell_from_distance(None, (x_r, y_r, theta_r),
+                                        measurements + 5, sonar_bearing_angle - np.deg2rad(10))
+    C = get_occupied_cell_from_distance(None, (x_r, y_r, theta_r),
+                                        measurements + 5, sonar_bearing_angle + np.deg2rad(10))
+
+    max_x = np.floor(np.maximum(x_r, np.maximum(B[0], C[0]))).astype(np.intp)
+    min_x = np.floor(np.minimum(x_r, np.minimum(B[0], C[0]))).astype(np.intp)
+    max_y = np.floor(np.maximum(y_r, np.maximum(B[1], C[1]))).astype(np.intp)
+    min_y = np.floor(np.minimum(y_r, np.minimum(B[1], C[1]))).astype(np.intp)
+
+    on_map = (x_r >= 0) & (x_r < width) & (y_r >= 0) & (y_r < height)
+    pose_cells = (indices[on_map], y_r[on_map], x_r[on_map])
+    np.subtract.at(gridmaps, pose_cells, LOG_ODD_FREE)
+
+    # Evaluate a window big enough for the largest bounding box and mask
+    # everything outside each robots own bounding box.
+    xs = min_x[:, np.newaxis] + np.arange(max(np.max(max_x - min_x, initial=0), 0))
+    ys = min_y[:, np.newaxis] + np.arange(max(np.max(max_y - min_y, initial=0), 0))
+    valid_x = (xs >= 0) & (xs < np.minimum(max_x, width)[:, np.newaxis])
+    valid_y = (ys >= 0) & (ys < np.minimum(max_y, height)[:, np.newaxis])
+
+    cells = inverse_range_sensor_model_batch(
+        xs[:, np.newaxis, :],
+        ys[:, :, np.newaxis],
+        (x_r[:, np.newaxis, np.newaxis],
+         y_r[:, np.newaxis, np.newaxis],
+         theta_r[:, np.newaxis, np.newaxis]),
+        sonar_bearing_angle,
+        sonar_opening_angle,
+        z_max,
+        measurements[:, np.newaxis, np.newaxis])
+    cells[~(valid_y[:, :, np.newaxis] & valid_x[:, np.newaxis, :])] = 0
+
+    # Cells are unique per robot, but robots may share a map: accumulate
+    # unbuffered, so updates of the same cell don't overwrite each other.
+    robots, rows, cols = np.nonzero(cells)
+    touched = (indices[robots], ys[robots, rows], xs[robots, cols])
+    np.add.at(gridmaps, touched, np.where(cells[robots, rows, cols] == 1,
+                                            LOG_ODD_OCCU, -LOG_ODD_FREE))
+
+    for cells_to_clip in (pose_cells, touched):
+        gridmaps[cells_to_clip] = np.clip(
+            gridmaps[cells_to_clip], a_max=LOG_ODD_MAX, a_min=LOG_ODD_MIN)
 
 
 def fov_bounding_box(pose, B, C):
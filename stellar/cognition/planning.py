@@ -2,9 +2,16 @@
 Contains path planning logic.
 """
 import math
+import sys
 import numpy as np
 from heapq import heappush, heappop
 
+from stellar.models.gridmap import TiledGrid
+
+# Cells around start and goal planned on first on a `TiledGrid`, doubled
+# until a path is found or the window spans all allocated tiles.
+PLANNING_WINDOW_MARGIN = 32
+
 
 def heuristics(a, b):
     """Heuristics function using the Euclidian Distance."""
@@ -31,6 +38,28 @@ def motion_model_4():
     ]
 
 
+def get_planning_window(grid, *nodes, margin=None):
+    """Region (min_y, max_y, min_x, max_x) of a `TiledGrid` spanning its
+    allocated tiles and the given nodes (x, y), maxima exclusive.
+
+    With a margin, the region only spans the nodes plus margin cells in
+    each direction, cut to the region without margin.
+    """
+    xs = [int(node[0]) for node in nodes]
+    ys = [int(node[1]) for node in nodes]
+    if margin is not None:
+        min_y, max_y, min_x, max_x = get_planning_window(grid, *nodes)
+        return (max(min(ys) - margin, min_y), min(max(ys) + margin + 1, max_y),
+                max(min(xs) - margin, min_x), min(max(xs) + margin + 1, max_x))
+
+    if grid.tiles:
+        min_y, max_y, min_x, max_x = grid.bounds
+        xs += [min_x, max_x - 1]
+        ys += [min_y, max_y - 1]
+
+    return min(ys), max(ys) + 1, min(xs), max(xs) + 1
+
+
 class AStarPlanner:
 
     def __init__(self):
@@ -39,8 +68,18 @@ class AStarPlanner:
     def plan(self, occupancy_grid_map, start_node, goal_node):
         """Plans a path through the occupancy grid map.
 
+        Closed set and cost-so-far are kept in arrays of the same shape as
+        the map, so membership tests are O(1). A node is only pushed onto
+        the frontier if it improves its known cost, which suppresses most
+        duplicate entries (lazy decrease-key).
+
+        A `TiledGrid` is planned on as a dense window around start and
+        goal, see `get_planning_window`. The window grows by doubling
+        PLANNING_WINDOW_MARGIN until a path is found, or it spans all
+        allocated tiles. The path is the shortest within the window only.
+
         Args:
-            occupancy_grid_map: The occupancy grid map.
+            occupancy_grid_map: The occupancy grid map, an array or a TiledGrid.
             start_node: Coordinates of the start node.
             goal_ndoe: Coordinates of the goal node.
 
@@ -49,31 +88,53 @@ class AStarPlanner:
             could be constructed.
 
         """
+        if isinstance(occupancy_grid_map, TiledGrid):
+            full_window = get_planning_window(occupancy_grid_map, start_node, goal_node)
+            margin = PLANNING_WINDOW_MARGIN
+            while True:
+                window = get_planning_window(occupancy_grid_map, start_node, goal_node,
+                                             margin=margin)
+                min_y, max_y, min_x, max_x = window
+                path = self.plan(occupancy_grid_map[min_y:max_y, min_x:max_x],
+                                 (start_node[0] - min_x, start_node[1] - min_y),
+                                 (goal_node[0] - min_x, goal_node[1] - min_y))
+                if path is not None:
+                    return [(x + min_x, y + min_y) for x, y in path]
+                if window == full_window:
+                    return None
+                margin *= 2
+
+        height, width = occupancy_grid_map.shape[:2]
+        goal_node = tuple(goal_node)
+        start_node = tuple(start_node)
+
+        # Heuristic of all cells at once, instead of one call per expansion.
+        ys, xs = np.mgrid[0:height, 0:width]
+        heuristic = np.hypot(xs - goal_node[0], ys - goal_node[1])
+        free = (occupancy_grid_map <= 0)
+
+        closed = np.zeros((height, width), dtype=bool)
+        costs = np.full((height, width), np.inf)
+
         # Node; Cost to Goal; Node cost, previous node
         start_node_costs = 0
         node_to_goal = heuristics(start_node, goal_node) + start_node_costs
         frontier = [(node_to_goal, start_node_costs, start_node, None)]
-        visited = []
 
         history = {}
 
         possible_movements = motion_model_4()
 
-        # Safety guard (TODO: Remove after DEV)
-        i = 0
-        break_if_count_reached = 10000
-        while frontier or i >= break_if_count_reached:
-            i += 1
-
-            element = heappop(frontier)
-            total_cost, cost, position, previous = element
+        while frontier:
+            total_cost, cost, position, previous = heappop(frontier)
+            x, y = int(position[0]), int(position[1])
 
             # If we have already traversed this node (x,y), then skip it
-            if position in visited:
+            if closed[y, x]:
                 continue
 
             # Mark this position as visited
-            visited.append(position)
+            closed[y, x] = True
 
             history[position] = previous
 
@@ -82,28 +143,25 @@ class AStarPlanner:
                 break
 
             for dx, dy, dcost in possible_movements:
-                xn = position[0] + dx
-                yn = position[1] + dy
+                xn = x + dx
+                yn = y + dy
 
-                if xn < 0 or yn < 0:
+                if xn < 0 or yn < 0 or yn >= height or xn >= width:
                     continue
 
-                if (xn, yn) in visited:
+                # Check if that cell is free and not yet traversed!
+                if closed[yn, xn] or not free[yn, xn]:
                     continue
 
-                if yn >= occupancy_grid_map.shape[0] or xn >= occupancy_grid_map.shape[1]:
+                new_cost = cost + dcost
+                if new_cost >= costs[yn, xn]:
                     continue
+                costs[yn, xn] = new_cost
 
-                # Check if that cell is free!
-                cell = occupancy_grid_map[yn][xn]
-                if cell <= 0:
-                    potential_cost = 0  # abs(cell)  # * 3
-                    new_cost = cost + dcost + potential_cost
-                    new_total_cost_to_goal = new_cost + \
-                        heuristics((xn, yn), goal_node) + potential_cost
-
-                    heappush(
-                        frontier, (new_total_cost_to_goal, new_cost, (xn, yn), position))
+                heappush(frontier, (new_cost + heuristic[yn, xn], new_cost,
+                                    (position[0] + dx, position[1] + dy), position))
+        else:
+            return None
 
         path = []
         while position:
@@ -112,6 +170,35 @@ class AStarPlanner:
 
         return list(reversed(path))
 
+    def plan_route(self, occupancy_grid_map, start_node, waypoints):
+        """Plans a path from the start node through the waypoints in order.
+
+        Unreachable waypoints are reported and skipped, the next waypoint is
+        planned from the last one reached.
+
+        Args:
+            occupancy_grid_map: The occupancy grid map, an array or a TiledGrid.
+            start_node: Coordinates of the start node.
+            waypoints: Coordinates of the waypoints.
+
+        Returns:
+            A list of coordinates of the planned path.
+
+        """
+        path = []
+        for waypoint in waypoints:
+            print(start_node, "=>", waypoint)
+            segment = self.plan(occupancy_grid_map, start_node, waypoint)
+            if segment is None:
+                print(f"No path from {start_node} to {waypoint}, skipping the waypoint",
+                      file=sys.stderr)
+                continue
+
+            path.extend(segment)
+            start_node = waypoint
+
+        return path
+
     def smoothen(self, occupancy_grid_map, path):
         """Smoothens the planned path.
 
@@ -57,7 +57,6 @@ def cte(robot, reference, t, plt=None):
     # t = np.argmin([(robot.x - cx, robot.y - cy) for cx, cy in reference])
     # get nearest point out of trajectory reference list
     reference_point = get_nearest_point(robot, reference)
-    print(robot.y - reference_point[1])
     if robot.x < 150 and not GOO:
         return (reference_point[0] - robot.x + robot.y - reference_point[1])
     else:
@@ -72,9 +71,4 @@ def get_nearest_point(robot, reference_trajectory):
     a = [edist(k, r) for k in list(reference_trajectory)]
     i = np.argmin(a)
 
-    p1 = reference_trajectory[i]
-    p2 = reference_trajectory[i+5]
-
-    aaa = np.arctan2(p2[1] - p1[1], p2[0] - p1[0])
-    print(f"l => {aaa:.4f}, {p1}, {p2}")
     return reference_trajectory[i]
@@ -1,7 +1,38 @@
+import json
 import socket
+import struct
+import sys
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, fall back to JSON.
+    msgpack = None
 
 hash_cache: dict = {}
 
+# Each frame is prefixed with its length as unsigned 32 bit integer.
+FRAME_HEADER = struct.Struct('!I')
+# Larger frames close the connection, instead of allocating up to 4 GiB.
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# Codecs, identified by the byte a sender announces after connecting.
+CODECS = {
+    b'j': (lambda message: json.dumps(message).encode('utf-8'),
+           lambda payload: json.loads(payload.decode('utf-8'))),
+}
+if msgpack is not None:
+    CODECS[b'm'] = (msgpack.packb, msgpack.unpackb)
+
+DEFAULT_CODEC = b'm' if b'm' in CODECS else b'j'
+# Understood by every listener, used if the announced codec is rejected.
+FALLBACK_CODEC = b'j'
+
+# Listener's reply to the announced codec.
+CODEC_ACCEPTED = b'+'
+CODEC_REJECTED = b'-'
+# Seconds a sender waits for the reply.
+HANDSHAKE_TIMEOUT = 2.0
+
 
 def get_socket_and_address(target: str):
     # AF_UNIX is a lightweight method for interprocess communication,
@@ -44,3 +75,41 @@ def get_hash(string: str):
 
     hash_cache[string] = hash
     return hash
+
+
+def send_frame(connection: socket, payload: bytes):
+    connection.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def receive_frame(connection: socket, max_size: int = MAX_FRAME_SIZE):
+    """
+    Receives a single frame. Returns None if the connection was closed or
+    the frame is larger than max_size, in which case the connection has to
+    be closed.
+    """
+    header = receive_exactly(connection, FRAME_HEADER.size)
+    if header is None:
+        return None
+
+    length, = FRAME_HEADER.unpack(header)
+    if length > max_size:
+        print(f"Rejected frame of {length} bytes, at most {max_size} are allowed",
+              file=sys.stderr)
+        return None
+    return receive_exactly(connection, length)
+
+
+def receive_exactly(connection: socket, size: int):
+    """
+    Receives exactly size bytes. Returns None if the connection was closed.
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = connection.recv_into(view[received:])
+        if count == 0:
+            return None
+        received += count
+
+    return bytes(buffer)
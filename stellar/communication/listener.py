@@ -1,9 +1,12 @@
 import json
+import os
 import socket
-from threading import Thread
+import sys
+from threading import Lock, Thread
 from typing import Any, Callable
 
-from communication.common import get_socket_and_address
+from communication.common import CODEC_ACCEPTED, CODEC_REJECTED, CODECS, MAX_FRAME_SIZE, \
+    get_socket_and_address, receive_exactly, receive_frame
 
 
 class MessageListener:
@@ -13,33 +16,100 @@ class MessageListener:
 
     def __init__(self, sender_id: str, callback: Callable[[dict], Any]):
         self.handler = callback
+        # Connections are received on threads of their own, but the
+        # handler is called for one message at a time.
+        self.handler_lock = Lock()
+        self.connections = set()
 
-        self.listener_socket, address = get_socket_and_address(sender_id)
-        self.listener_socket.bind(address)
+        self.listener_socket, self.address = get_socket_and_address(sender_id)
+        if self.listener_socket.family != socket.AF_INET and os.path.exists(self.address):
+            os.remove(self.address)  # Left over by a previous listener.
+        self.listener_socket.bind(self.address)
         self.listener_socket.listen()
 
     @staticmethod
-    def receive_all(connection: socket) -> str:
-        all_data = []
+    def receive_all(connection: socket, max_size: int = MAX_FRAME_SIZE):
+        """
+        Receives until the sender closes the connection. Returns None if
+        more than max_size bytes are sent.
+        """
+        all_data = bytearray()
 
         while True:
             received = connection.recv(8192)
-            if received:
-                all_data.append(received.decode('utf-8'))
-            else:
+            if not received:
                 break
+            all_data += received
+            if len(all_data) > max_size:
+                print(f"Rejected message of more than {max_size} bytes", file=sys.stderr)
+                return None
 
-        return ''.join(all_data)
+        return all_data.decode('utf-8')
 
     def run(self):
         while self.is_running:
-            connection, _ = self.listener_socket.accept()
-            received_data = self.receive_all(connection)
-            self.handler(json.loads(received_data))
-            connection.close()
+            try:
+                connection, _ = self.listener_socket.accept()
+            except OSError:
+                break  # Socket was closed by stop().
+
+            Thread(target=self.receive_messages,
+                   args=(connection,), daemon=True).start()
+
+    def receive_messages(self, connection: socket):
+        """
+        Handles all messages of a connection, until the sender closes it.
+        """
+        self.connections.add(connection)
+        try:
+            with connection:
+                self.receive_frames(connection)
+        finally:
+            self.connections.discard(connection)
+
+    def receive_frames(self, connection: socket):
+        codec = receive_exactly(connection, 1)
+        if codec is None:
+            return
+
+        if codec == b'{':
+            # Legacy sender: a single JSON message per connection.
+            data = self.receive_all(connection, MAX_FRAME_SIZE - len(codec))
+            if data is not None:
+                self.handle(json.loads(codec.decode('utf-8') + data))
+            return
+
+        if codec not in CODECS:
+            print(f"Rejected connection with unknown codec {codec!r}", file=sys.stderr)
+            connection.sendall(CODEC_REJECTED)
+            return
+
+        connection.sendall(CODEC_ACCEPTED)
+        _, decode = CODECS[codec]
+        while self.is_running:
+            payload = receive_frame(connection)
+            if payload is None:
+                break
+            self.handle(decode(payload))
+
+    def handle(self, message: dict):
+        with self.handler_lock:
+            self.handler(message)
 
     def stop(self):
         self.is_running = False
+        try:
+            # Wakes up the blocking accept() in run().
+            self.listener_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.listener_socket.close()
+
+        for connection in list(self.connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
 
 
 def listen_to(sender_id: str, listener: Callable[[dict], Any]) -> MessageListener:
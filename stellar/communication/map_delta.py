@@ -0,0 +1,145 @@
+"""
+Incremental publishing of occupancy grid maps.
+
+Instead of the whole map, only the tiles which changed since the last
+message are sent, quantized to int8 log odds. Every few messages, all
+tiles are sent, so receivers which missed a message or joined late
+catch up.
+"""
+import base64
+
+import numpy as np
+
+# Side length of the square tiles the map is split into.
+TILE_SIZE = 16
+# Quantization: int8 units per log odd, i.e. a resolution of 0.04
+# and a range of [-5.12, 5.08] log odds.
+QUANTIZATION_SCALE = 25.0
+# Send all tiles every n encoded updates.
+KEYFRAME_INTERVAL = 50
+
+
+def quantize(log_odds):
+    """Quantizes log odds to int8."""
+    return np.clip(np.rint(log_odds * QUANTIZATION_SCALE), -128, 127).astype(np.int8)
+
+
+def dequantize(quantized, scale: float = QUANTIZATION_SCALE):
+    """Converts quantized log odds back to float32."""
+    return quantized.astype(np.float32) / np.float32(scale)
+
+
+class MapDeltaEncoder:
+    """
+    Encodes the changes of an occupancy grid map as messages of changed tiles.
+
+    Regions changed by mapping updates are marked with `mark_dirty`. Only
+    tiles within them are compared with what was published before.
+    """
+
+    def __init__(self, shape, tile_size: int = TILE_SIZE,
+                 keyframe_interval: int = KEYFRAME_INTERVAL):
+        self.shape = tuple(shape)
+        self.tile_size = tile_size
+        self.keyframe_interval = keyframe_interval
+        self.published = np.zeros(self.shape, dtype=np.int8)
+        self.dirty = None
+        self.sequence = 0
+        self.updates = 0
+
+    def mark_dirty(self, region):
+        """Marks the region (min_y, max_y, min_x, max_x) as possibly changed."""
+        min_y, max_y, min_x, max_x = region
+        if min_y >= max_y or min_x >= max_x:
+            return
+
+        if self.dirty is not None:
+            min_y, min_x = min(min_y, self.dirty[0]), min(min_x, self.dirty[2])
+            max_y, max_x = max(max_y, self.dirty[1]), max(max_x, self.dirty[3])
+        self.dirty = (min_y, max_y, min_x, max_x)
+
+    def encode(self, gridmap):
+        """
+        Encodes the tiles of gridmap which changed since the last message.
+
+        Returns:
+            A message with the sequence number, map shape, tile size,
+            quantization scale, whether all tiles are included and the
+            tiles as [row, column, base64 encoded int8 data]. None if
+            nothing changed.
+        """
+        is_keyframe = self.updates % self.keyframe_interval == 0
+        self.updates += 1
+
+        if is_keyframe:
+            region = (0, self.shape[0], 0, self.shape[1])
+        elif self.dirty is not None:
+            region = self.dirty
+        else:
+            return None
+        self.dirty = None
+
+        size = self.tile_size
+        min_row, max_row = region[0] // size, -(-region[1] // size)
+        min_col, max_col = region[2] // size, -(-region[3] // size)
+
+        tiles = []
+        for row in range(min_row, max_row):
+            for col in range(min_col, max_col):
+                window = (slice(row * size, (row + 1) * size),
+                          slice(col * size, (col + 1) * size))
+                tile = quantize(gridmap[window])
+                if is_keyframe or np.any(tile != self.published[window]):
+                    self.published[window] = tile
+                    tiles.append([row, col, base64.b64encode(tile.tobytes()).decode('ascii')])
+
+        if not tiles:
+            return None
+
+        self.sequence += 1
+        return {
+            'sequence': self.sequence,
+            'shape': list(self.shape),
+            'tile_size': size,
+            'scale': QUANTIZATION_SCALE,
+            'full': is_keyframe,
+            'tiles': tiles
+        }
+
+
+class MapDeltaDecoder:
+    """Rebuilds an occupancy grid map from the messages of a MapDeltaEncoder."""
+
+    def __init__(self):
+        self.quantized = None
+        self.scale = QUANTIZATION_SCALE
+        self.sequence = 0
+        # False until all tiles have been received, or after a message got lost.
+        self.is_complete = False
+
+    def apply(self, message: dict):
+        shape = tuple(message['shape'])
+        if self.quantized is None or self.quantized.shape != shape:
+            self.quantized = np.zeros(shape, dtype=np.int8)
+            self.is_complete = False
+
+        if message['full']:
+            self.is_complete = True
+        elif message['sequence'] != self.sequence + 1:
+            self.is_complete = False  # Wait for the next keyframe.
+
+        size = message['tile_size']
+        for row, col, data in message['tiles']:
+            window = self.quantized[row * size:(row + 1) * size,
+                                    col * size:(col + 1) * size]
+            window[...] = np.frombuffer(base64.b64decode(data),
+                                        dtype=np.int8).reshape(window.shape)
+
+        self.scale = message['scale']
+        self.sequence = message['sequence']
+
+    def get_map(self):
+        """Returns the rebuilt map as float32 log odds, or None before the first message."""
+        if self.quantized is None:
+            return None
+        return dequantize(self.quantized, self.scale)
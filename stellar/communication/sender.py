@@ -1,21 +1,96 @@
-import json
+import socket
+from threading import Lock
 
-from communication.common import get_socket_and_address
+from communication.common import CODEC_ACCEPTED, CODECS, DEFAULT_CODEC, FALLBACK_CODEC, HANDSHAKE_TIMEOUT, \
+    get_socket_and_address, receive_exactly, send_frame
 
+# Open connections, their codec and the requested codec, by sender id.
+connections: dict = {}
+connections_lock = Lock()
 
-def send_message(sender_id: str, message: dict) -> bool:
+
+def send_message(sender_id: str, message: dict, codec: bytes = None) -> bool:
     """
     Sends a message to whoever is listening.
     Returns False if nobody is listening, True otherwise.
+
+    The connection is kept open for further messages. The codec is
+    announced once per connection, it defaults to the codec of the open
+    connection or DEFAULT_CODEC. If the listener rejects it, e.g. as
+    msgpack isn't installed there, FALLBACK_CODEC is used instead.
     """
 
-    socket, address = get_socket_and_address(sender_id)
+    with connections_lock:
+        return send_frame_to(sender_id, message, codec)
+
+
+def send_frame_to(sender_id: str, message: dict, codec: bytes) -> bool:
+    if codec is not None and sender_id in connections and connections[sender_id][2] != codec:
+        close_connection(sender_id)
+
+    # If the listener went away, reconnect once.
+    for _ in range(2):
+        connection = get_connection(sender_id, codec or DEFAULT_CODEC)
+        if connection is None:
+            return False  # Nobody's listening right now.
+
+        sender_socket, connection_codec, _ = connection
+        encode, _ = CODECS[connection_codec]
+        try:
+            send_frame(sender_socket, encode(message))
+            return True
+        except OSError:
+            close_connection(sender_id)
+
+    return False
+
+
+def get_connection(sender_id: str, codec: bytes):
+    """
+    Returns the open connection to the listener of sender_id, connecting
+    if necessary. Returns None if nobody is listening.
+    """
+    if sender_id not in connections:
+        for candidate in dict.fromkeys((codec, FALLBACK_CODEC)):
+            try:
+                sender_socket = connect(sender_id, candidate)
+            except OSError:
+                return None
+
+            if sender_socket is not None:
+                connections[sender_id] = (sender_socket, candidate, codec)
+                break
+        else:
+            return None
+
+    return connections[sender_id]
+
+
+def connect(sender_id: str, codec: bytes):
+    """
+    Connects to the listener of sender_id and announces codec. Returns the
+    socket, or None if the listener rejected the codec. Raises OSError if
+    nobody is listening.
+    """
+    sender_socket, address = get_socket_and_address(sender_id)
     try:
-        with socket as sender_socket:
-            sender_socket.connect(address)
-            sender_socket.sendall(json.dumps(message).encode('utf-8'))
+        sender_socket.connect(address)
+        sender_socket.sendall(codec)
+        sender_socket.settimeout(HANDSHAKE_TIMEOUT)
+        reply = receive_exactly(sender_socket, 1)
+        sender_socket.settimeout(None)
+    except OSError:
+        sender_socket.close()
+        raise
+
+    if reply != CODEC_ACCEPTED:
+        sender_socket.close()
+        return None
+
+    return sender_socket
 
-    except:
-        return False  # Nobody's listening right now.
 
-    return True
+def close_connection(sender_id: str):
+    connection = connections.pop(sender_id, None)
+    if connection is not None:
+        connection[0].close()
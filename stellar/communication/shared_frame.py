@@ -0,0 +1,152 @@
+"""
+Shares the latest camera frame between processes without copying it
+through sockets or the disk.
+
+The shared memory block starts with a header (sequence number, number of
+slots, slot size, random id of the buffer), followed by a ring of slots.
+Each slot starts with the shape of its frame, followed by the pixel data.
+The writer fills the slot after the latest one and only then publishes
+the incremented sequence number, so readers never see a partially written
+latest frame.
+
+A reader stays attached to the buffer it opened, even after the writer
+closed or recreated it. The id tells whether the name still refers to it,
+see `SharedFrameBuffer.is_current`.
+"""
+import os
+import struct
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+
+CAMERA_FEED_NAME = 'stellar_camera_feed'
+
+HEADER = struct.Struct('=QIIQ')      # sequence, slots, slot size, id
+SLOT_HEADER = struct.Struct('=III')  # height, width, channels
+
+# Names of the buffers created by this process.
+created_names: set = set()
+
+
+def open_shared_memory(name: str, create: bool = False, size: int = 0):
+    if create:
+        memory = shared_memory.SharedMemory(name, create=True, size=size)
+        created_names.add(name)
+        return memory
+
+    if name in created_names:
+        return shared_memory.SharedMemory(name)
+
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+
+    memory = shared_memory.SharedMemory(name)
+    if os.name == 'posix':
+        # Before 3.13, the resource tracker unlinks attached memory when the
+        # reader exits, taking the buffer away from the writer. It tracks the
+        # name with the leading slash POSIX shared memory names start with,
+        # which `memory.name` strips.
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister('/' + memory.name, 'shared_memory')
+    return memory
+
+
+class SharedFrameBuffer:
+    """Ring buffer holding the latest frames in shared memory."""
+
+    def __init__(self, memory: shared_memory.SharedMemory, is_owner: bool):
+        self.memory = memory
+        self.is_owner = is_owner
+        _, self.slots, self.slot_size, self.id = HEADER.unpack_from(memory.buf, 0)
+
+    @staticmethod
+    def create(name: str, max_shape, slots: int = 3):
+        """
+        Creates a new buffer for frames of at most max_shape (height, width, channels).
+        """
+        slot_size = SLOT_HEADER.size + int(np.prod(max_shape))
+        size = HEADER.size + slots * slot_size
+        try:
+            memory = open_shared_memory(name, create=True, size=size)
+        except FileExistsError:
+            # Left over by a writer that did not shut down cleanly.
+            shared_memory.SharedMemory(name).unlink()
+            memory = open_shared_memory(name, create=True, size=size)
+        HEADER.pack_into(memory.buf, 0, 0, slots, slot_size,
+                         int.from_bytes(os.urandom(8), 'little'))
+        return SharedFrameBuffer(memory, is_owner=True)
+
+    @staticmethod
+    def attach(name: str):
+        """
+        Attaches to an existing buffer. Raises FileNotFoundError if it
+        has not been created (yet).
+        """
+        return SharedFrameBuffer(open_shared_memory(name), is_owner=False)
+
+    def is_current(self) -> bool:
+        """
+        Whether the name still refers to this buffer, i.e. the writer
+        neither closed nor recreated it since it was attached.
+        """
+        try:
+            memory = open_shared_memory(self.memory.name)
+        except FileNotFoundError:
+            return False
+
+        try:
+            return HEADER.unpack_from(memory.buf, 0)[3] == self.id
+        finally:
+            memory.close()
+
+    @property
+    def sequence(self) -> int:
+        """Number of frames written so far."""
+        return HEADER.unpack_from(self.memory.buf, 0)[0]
+
+    def get_slot_offset(self, sequence: int) -> int:
+        return HEADER.size + (sequence % self.slots) * self.slot_size
+
+    def write(self, frame: np.ndarray):
+        """Publishes frame (uint8) as the latest frame."""
+        frame = np.asarray(frame, dtype=np.uint8)
+        shape = frame.shape + (1,) * (3 - frame.ndim)
+        if frame.nbytes > self.slot_size - SLOT_HEADER.size:
+            raise ValueError(
+                f"Frame of shape {frame.shape} exceeds the buffer's slot size.")
+
+        sequence = self.sequence + 1
+        offset = self.get_slot_offset(sequence)
+        SLOT_HEADER.pack_into(self.memory.buf, offset, *shape)
+        pixels = np.ndarray(shape, dtype=np.uint8, buffer=self.memory.buf,
+                            offset=offset + SLOT_HEADER.size)
+        pixels[...] = frame.reshape(shape)
+
+        HEADER.pack_into(self.memory.buf, 0, sequence,
+                         self.slots, self.slot_size, self.id)
+
+    def read(self, last_sequence: int = 0):
+        """
+        Returns the sequence number and a copy of the latest frame, or
+        (last_sequence, None) if there is no frame newer than last_sequence.
+        """
+        while True:
+            sequence = self.sequence
+            if sequence == last_sequence or sequence == 0:
+                return last_sequence, None
+
+            offset = self.get_slot_offset(sequence)
+            shape = SLOT_HEADER.unpack_from(self.memory.buf, offset)
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=self.memory.buf,
+                               offset=offset + SLOT_HEADER.size).copy()
+
+            # Retry if the writer went around the ring while we copied.
+            if self.sequence - sequence < self.slots - 1:
+                return sequence, frame
+
+    def close(self):
+        self.memory.close()
+        if self.is_owner:
+            self.memory.unlink()
+            created_names.discard(self.memory.name)
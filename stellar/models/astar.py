@@ -9,11 +9,14 @@ See Wikipedia article (https://en.wikipedia.org/wiki/A*_search_algorithm)
 
 """
 
+import heapq
 import math
 
 import matplotlib.pyplot as plt
+import numpy as np
+from scipy.spatial import cKDTree
 
-show_animation = True
+show_animation = False
 
 
 class AStarPlanner:
@@ -33,6 +36,21 @@ class AStarPlanner:
         self.calc_obstacle_map(ox, oy)
         self.motion = self.get_motion_model()
 
+    @staticmethod
+    def from_gridmap(gridmap, reso, rr, threshold=0.0):
+        """
+        Initialize a planner with the cells of an occupancy grid map
+        above threshold as obstacles, positions are in cells.
+
+        gridmap: 2D array or TiledGrid, which may span negative cells
+        """
+        if hasattr(gridmap, 'get_occupied_cells'):
+            oy, ox = gridmap.get_occupied_cells(threshold)
+        else:
+            oy, ox = np.nonzero(np.asarray(gridmap) > threshold)
+
+        return AStarPlanner(ox, oy, reso, rr)
+
     class Node:
         def __init__(self, x, y, cost, pind):
             self.x = x  # index of grid
@@ -64,15 +82,22 @@ class AStarPlanner:
                           self.calc_xyindex(gy, self.miny), 0.0, -1)
 
         open_set, closed_set = dict(), dict()
-        open_set[self.calc_grid_index(nstart)] = nstart
+        n_id = self.calc_grid_index(nstart)
+        open_set[n_id] = nstart
+
+        # Open nodes ordered by f-cost. Entries are not removed when a node
+        # improves or gets closed, outdated ones are skipped when popped.
+        f_costs = {n_id: self.calc_heuristic(ngoal, nstart)}
+        open_heap = [(f_costs[n_id], n_id)]
 
         while 1:
             if len(open_set) == 0:
                 print("Open set is empty..")
                 break
 
-            c_id = min(
-                open_set, key=lambda o: open_set[o].cost + self.calc_heuristic(ngoal, open_set[o]))
+            f_cost, c_id = heapq.heappop(open_heap)
+            if c_id not in open_set or f_cost > f_costs[c_id]:
+                continue
             current = open_set[c_id]
 
             # show graph
@@ -111,12 +136,13 @@ class AStarPlanner:
                 if n_id in closed_set:
                     continue
 
-                if n_id not in open_set:
-                    open_set[n_id] = node  # discovered a new node
-                else:
-                    if open_set[n_id].cost > node.cost:
-                        # This path is the best until now. record it
-                        open_set[n_id] = node
+                if n_id not in open_set or open_set[n_id].cost > node.cost:
+                    # discovered a new node or this path is the best
+                    # until now. record it
+                    open_set[n_id] = node
+                    f_costs[n_id] = node.cost + \
+                        self.calc_heuristic(ngoal, node)
+                    heapq.heappush(open_heap, (f_costs[n_id], n_id))
 
         rx, ry = self.calc_final_path(ngoal, closed_set)
 
@@ -172,7 +198,7 @@ class AStarPlanner:
             return False
 
         # collision check
-        if self.obmap[node.x][node.y]:
+        if self.obmap[node.x, node.y]:
             return False
 
         return True
@@ -193,22 +219,18 @@ class AStarPlanner:
         print("xwidth:", self.xwidth)
         print("ywidth:", self.ywidth)
 
-        self.xwidth = self.xwidth.astype('int')
-        self.ywidth = self.ywidth.astype('int')
-
-        # obstacle map generation
-        self.obmap = [[False for i in range(self.ywidth)]
-                      for i in range(self.xwidth)]
-        for ix in range(self.xwidth):
-            print(ix)
-            x = self.calc_grid_position(ix, self.minx)
-            for iy in range(self.ywidth):
-                y = self.calc_grid_position(iy, self.miny)
-                for iox, ioy in zip(ox, oy):
-                    d = math.hypot(iox - x, ioy - y)
-                    if d <= self.rr:
-                        self.obmap[ix][iy] = True
-                        break
+        self.xwidth = int(self.xwidth)
+        self.ywidth = int(self.ywidth)
+
+        # obstacle map generation: a cell is blocked if its nearest
+        # obstacle is within the robot radius.
+        obstacles = cKDTree(np.column_stack((ox, oy)))
+        x = self.calc_grid_position(np.arange(self.xwidth), self.minx)
+        y = self.calc_grid_position(np.arange(self.ywidth), self.miny)
+        grid_x, grid_y = np.meshgrid(x, y, indexing='ij')
+        distances, _ = obstacles.query(
+            np.column_stack((grid_x.ravel(), grid_y.ravel())))
+        self.obmap = (distances <= self.rr).reshape(self.xwidth, self.ywidth)
 
     @staticmethod
     def get_motion_model():
@@ -273,4 +295,5 @@ def main():
 
 
 if __name__ == '__main__':
+    show_animation = True
     main()
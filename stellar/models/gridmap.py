@@ -5,7 +5,7 @@ Credits to https://github.com/richardos/occupancy-grid-a-star
 import numpy as np
 import matplotlib.pyplot as plt
 
-from stellar.utils import png_to_ogm
+from stellar.utils import load_ogm
 
 
 class OccupancyGridMap:
@@ -52,8 +52,7 @@ class OccupancyGridMap:
             An initialized OccupancyGridMap.
 
         """
-        ogm_data = png_to_ogm(filename, normalized=True)
-        ogm_data_arr = np.array(ogm_data)
+        ogm_data_arr = load_ogm(filename, normalized=True)
         #where_0 = np.where(ogm_data_arr == 0)
         #where_1 = np.where(ogm_data_arr == 1)
 
@@ -61,3 +60,292 @@ class OccupancyGridMap:
         #ogm_data_arr[where_1] = 0
 
         return OccupancyGridMap(ogm_data_arr, cell_size)
+
+
+# Fixed point scale of int8 log odds grids, i.e. a resolution of 0.05.
+# The log odds increments and limits of mapping (1, 0.4, 5, -2.5)
+# are multiples of it, so updates don't accumulate rounding errors.
+LOG_ODDS_INT8_SCALE = 20
+
+
+class LogOddsGrid:
+    """
+    Occupancy grid map of log odds, stored compactly as int8 fixed point
+    or float16 values instead of float64.
+
+    Updates are applied in place to a window of the grid and saturate
+    at the limits, so no other cell is touched. Log odds, probabilities
+    and occupancy are only computed on request, for the whole grid or
+    a window of it. Indexing the grid yields float log odds.
+    """
+
+    def __init__(self, shape, limits, dtype=np.int8, scale: float = None):
+        """
+        Args:
+            shape: Shape of the grid (height, width).
+            limits: Minimum and maximum log odds, updates saturate at them.
+            dtype: np.int8 (fixed point) or np.float16.
+            scale: Stored units per log odd, defaults to LOG_ODDS_INT8_SCALE
+                   for int8 and 1 for float16.
+
+        """
+        dtype = np.dtype(dtype)
+        if dtype not in (np.int8, np.float16):
+            raise ValueError(f"Unsupported log odds grid dtype: {dtype}")
+        if scale is None:
+            scale = LOG_ODDS_INT8_SCALE if dtype == np.int8 else 1
+
+        self.scale = scale
+        self.limits = (limits[0] * scale, limits[1] * scale)
+        if dtype == np.int8:
+            self.limits = (int(np.ceil(self.limits[0])), int(np.floor(self.limits[1])))
+            if self.limits[0] < -128 or self.limits[1] > 127:
+                raise ValueError(f"Limits {limits} don't fit int8 with scale {scale}")
+
+        self.data = np.zeros(shape, dtype=dtype)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def add(self, window, log_odds):
+        """
+        Adds log odds to the cells of window in place, saturating at the limits.
+
+        Args:
+            window: Basic index (e.g. a tuple of slices) of the cells to update.
+            log_odds: Log odds to add, broadcastable to the window.
+
+        """
+        self.add_units(window, self.to_units(log_odds))
+
+    def add_units(self, window, units):
+        """Same as `add`, for increments already converted with `to_units`."""
+        target = self.data[window]
+        result = target.astype(units.dtype)
+        result += units
+        # Cheaper than np.clip for small windows.
+        np.maximum(result, self.limits[0], out=result)
+        np.minimum(result, self.limits[1], out=result)
+        target[...] = result
+
+    def to_units(self, log_odds):
+        """
+        Converts log odds to stored units, as int16 (int8 grids) or float32
+        array, wide enough to add them without overflow.
+        """
+        units = np.multiply(log_odds, self.scale, dtype=np.float32)
+        if self.data.dtype == np.int8:
+            return np.rint(units).astype(np.int16)
+        return units
+
+    def log_odds(self, window=...):
+        """Returns the log odds of window (default: all cells) as float32."""
+        return self.data[window].astype(np.float32) / np.float32(self.scale)
+
+    def probability(self, window=...):
+        """Returns the probability of the cells of window to be occupied."""
+        return 1 - 1 / (1 + np.exp(self.log_odds(window)))
+
+    def occupied(self, threshold: float = 0.0, window=...):
+        """Returns for each cell of window whether its log odds exceed threshold."""
+        return self.data[window] > threshold * self.scale
+
+    def __getitem__(self, key):
+        return self.log_odds(key)
+
+    def __array__(self, dtype=None, copy=None):
+        log_odds = self.log_odds()
+        return log_odds if dtype is None else log_odds.astype(dtype)
+
+
+# Side length of the square tiles of a TiledGrid.
+TILE_SIZE = 64
+
+
+class TiledGrid:
+    """
+    Unbounded grid map, allocated lazily in square tiles kept in a dict.
+
+    Cells are addressed by absolute coordinates, negative ones included,
+    and the grid grows on demand: writing a cell allocates its tile,
+    reading a cell of a missing tile yields the fill value. Memory is only
+    used for tiles which were written to.
+
+    Indexing works like NumPy for integers, slices (without step) and
+    integer arrays, except that indices never wrap around and results are
+    always copies. Slices without start or stop end at the bounds of the
+    allocated tiles.
+    """
+
+    def __init__(self, dtype=np.float64, fill_value=0, tile_size: int = TILE_SIZE):
+        """
+        Args:
+            dtype: Data type of the cells.
+            fill_value: Value of cells which were never written.
+            tile_size: Side length of the tiles.
+
+        """
+        self.dtype = np.dtype(dtype)
+        self.fill_value = fill_value
+        self.tile_size = tile_size
+        # (tile row, tile column) -> tile
+        self.tiles: dict = {}
+
+    @staticmethod
+    def from_array(array, fill_value=0, tile_size: int = TILE_SIZE):
+        """Creates a TiledGrid of a 2D array, only tiles differing from fill_value are allocated."""
+        array = np.asarray(array)
+        grid = TiledGrid(array.dtype, fill_value, tile_size)
+        for key, tile_window, window in grid.get_tile_windows(0, array.shape[0], 0, array.shape[1]):
+            if np.any(array[window] != fill_value):
+                grid.get_tile(key)[tile_window] = array[window]
+
+        return grid
+
+    @property
+    def bounds(self):
+        """Region (min_y, max_y, min_x, max_x) spanned by the allocated tiles, maxima exclusive."""
+        if not self.tiles:
+            return (0, 0, 0, 0)
+
+        rows, cols = zip(*self.tiles)
+        size = self.tile_size
+        return (min(rows) * size, (max(rows) + 1) * size,
+                min(cols) * size, (max(cols) + 1) * size)
+
+    @property
+    def shape(self):
+        """Shape of the bounds, i.e. of the grid as array."""
+        min_y, max_y, min_x, max_x = self.bounds
+        return (max_y - min_y, max_x - min_x)
+
+    @property
+    def nbytes(self):
+        return sum(tile.nbytes for tile in self.tiles.values())
+
+    def get_tile(self, key):
+        """Returns the tile (row, column), allocating it if necessary."""
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = np.full((self.tile_size, self.tile_size), self.fill_value, dtype=self.dtype)
+            self.tiles[key] = tile
+        return tile
+
+    def get_tile_windows(self, min_y, max_y, min_x, max_x):
+        """
+        Yields (tile key, window within the tile, window within the region)
+        for all tiles overlapping the region (min_y, max_y, min_x, max_x).
+        """
+        size = self.tile_size
+        for row in range(min_y // size, -(-max_y // size)):
+            y1, y2 = max(min_y, row * size), min(max_y, (row + 1) * size)
+            for col in range(min_x // size, -(-max_x // size)):
+                x1, x2 = max(min_x, col * size), min(max_x, (col + 1) * size)
+                yield ((row, col),
+                       (slice(y1 - row * size, y2 - row * size), slice(x1 - col * size, x2 - col * size)),
+                       (slice(y1 - min_y, y2 - min_y), slice(x1 - min_x, x2 - min_x)))
+
+    def get_occupied_cells(self, threshold: float = 0.0):
+        """Returns the coordinates (ys, xs) of all cells with values above threshold."""
+        ys, xs = [np.zeros(0, dtype=np.intp)], [np.zeros(0, dtype=np.intp)]
+        for (row, col), tile in self.tiles.items():
+            tile_ys, tile_xs = np.nonzero(tile > threshold)
+            ys.append(tile_ys + row * self.tile_size)
+            xs.append(tile_xs + col * self.tile_size)
+
+        return np.concatenate(ys), np.concatenate(xs)
+
+    def take(self, ys, xs):
+        """Returns the values of the cells at the integer arrays ys and xs."""
+        ys, xs = np.broadcast_arrays(np.asarray(ys, dtype=np.intp), np.asarray(xs, dtype=np.intp))
+        values = np.full(ys.shape, self.fill_value, dtype=self.dtype)
+        for (row, col), mask, tile_ys, tile_xs in self.group_by_tile(ys, xs):
+            tile = self.tiles.get((row, col))
+            if tile is not None:
+                values[mask] = tile[tile_ys, tile_xs]
+
+        return values
+
+    def put(self, ys, xs, values):
+        """Sets the values of the cells at the integer arrays ys and xs."""
+        ys, xs = np.broadcast_arrays(np.asarray(ys, dtype=np.intp), np.asarray(xs, dtype=np.intp))
+        values = np.broadcast_to(np.asarray(values, dtype=self.dtype), ys.shape)
+        for key, mask, tile_ys, tile_xs in self.group_by_tile(ys, xs):
+            self.get_tile(key)[tile_ys, tile_xs] = values[mask]
+
+    def group_by_tile(self, ys, xs):
+        """Yields (tile key, mask, ys within tile, xs within tile) for all tiles hit by the cells."""
+        size = self.tile_size
+        rows, cols = ys // size, xs // size
+        for row, col in set(zip(rows.ravel().tolist(), cols.ravel().tolist())):
+            mask = (rows == row) & (cols == col)
+            yield (row, col), mask, ys[mask] - row * size, xs[mask] - col * size
+
+    def parse_key(self, key):
+        """Returns (min_y, max_y, min_x, max_x, shape of the result) of a basic index."""
+        if not isinstance(key, tuple) or len(key) != 2:
+            raise IndexError("A TiledGrid is indexed by (row, column)")
+
+        is_open = any(isinstance(index, slice) and (index.start is None or index.stop is None)
+                      for index in key)
+        bounds = self.bounds if is_open else (None,) * 4
+        min_y, max_y = self.parse_axis(key[0], *bounds[:2])
+        min_x, max_x = self.parse_axis(key[1], *bounds[2:])
+
+        shape = []
+        if isinstance(key[0], slice):
+            shape.append(max_y - min_y)
+        if isinstance(key[1], slice):
+            shape.append(max_x - min_x)
+        return min_y, max_y, min_x, max_x, tuple(shape)
+
+    @staticmethod
+    def parse_axis(index, low, high):
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                raise IndexError("TiledGrid slices don't support steps")
+            start = low if index.start is None else int(index.start)
+            stop = high if index.stop is None else int(index.stop)
+            return start, max(start, stop)
+        if isinstance(index, (int, np.integer)):
+            return int(index), int(index) + 1
+
+        raise IndexError(f"Unsupported TiledGrid index: {index!r}")
+
+    @staticmethod
+    def is_array_key(key):
+        return isinstance(key, tuple) and any(
+            isinstance(index, (list, np.ndarray)) for index in key)
+
+    def __getitem__(self, key):
+        if self.is_array_key(key):
+            return self.take(*key)
+
+        min_y, max_y, min_x, max_x, shape = self.parse_key(key)
+        values = np.full((max_y - min_y, max_x - min_x), self.fill_value, dtype=self.dtype)
+        for tile_key, tile_window, window in self.get_tile_windows(min_y, max_y, min_x, max_x):
+            tile = self.tiles.get(tile_key)
+            if tile is not None:
+                values[window] = tile[tile_window]
+
+        return values.reshape(shape) if shape else values[0, 0]
+
+    def __setitem__(self, key, values):
+        if self.is_array_key(key):
+            self.put(*key, values)
+            return
+
+        min_y, max_y, min_x, max_x, shape = self.parse_key(key)
+        values = np.broadcast_to(np.asarray(values, dtype=self.dtype), shape).reshape(
+            max_y - min_y, max_x - min_x)
+        for tile_key, tile_window, window in self.get_tile_windows(min_y, max_y, min_x, max_x):
+            self.get_tile(tile_key)[tile_window] = values[window]
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[:, :]
+        return values if dtype is None else values.astype(dtype)
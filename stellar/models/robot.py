@@ -88,3 +88,93 @@ class Robot:
 
     def __str__(self):
         return f"Robot[x: {self.x}, y: {self.y}, theta: {self.theta}]"
+
+
+class RobotBatch:
+    """
+    Vectorized model for many robots at once.
+
+    Behaves like a collection of `Robot` instances, but stores the poses
+    as NumPy arrays, so all robots are moved with a single operation.
+    """
+
+    def __init__(self, size: int):
+        """
+        Initalize `size` robots with the starting values of (0, 0, 0) for
+        position (x, y) and orientation (theta).
+        """
+        self.x = np.zeros(size)
+        self.y = np.zeros(size)
+        self.theta = np.zeros(size)
+        self.total_distance_covered = np.zeros(size)
+
+    def __len__(self):
+        return len(self.x)
+
+    def in_goal(self, goal, proximity=0.0, min_distance=-1.0):
+        """
+        Check which robots have reached their goal.
+
+        Args:
+            goal: x- and y coordinates of the goal position.
+            proximity: Proximity to the goal position.
+            min_distance: Minimum distance covered by the robot before
+                          being eligible for being in goal position.
+
+        Returns:
+            A boolean array, True for each robot in goal.
+        """
+        goal_x, goal_y = goal
+
+        x_in_goal = (goal_x - proximity <= self.x) & (self.x <= goal_x + proximity)
+        y_in_goal = (goal_y - proximity <= self.y) & (self.y <= goal_y + proximity)
+
+        return (self.total_distance_covered >= min_distance) & x_in_goal & y_in_goal
+
+    def pose_in_grid(self, scale):
+        """Converts the poses to the current positions in the gridmap."""
+        xr = (self.x / scale).astype(int)
+        yr = (self.y / scale).astype(int)
+
+        return (xr, yr, self.theta.copy())
+
+    def move(self, distance, direction, max_steering=np.pi / 2):
+        """Instruct the robots to move.
+
+        Args:
+            distance: Number of steps (i.e. cells) to move, per robot or for all.
+            direction: Direction of movement (in radians), per robot or for all.
+
+        """
+        direction = np.clip(direction, -max_steering, max_steering)
+        distance = np.maximum(distance, 0.0)
+
+        self.total_distance_covered += distance
+
+        self.theta = (self.theta + direction) % (2.0 * np.pi)
+        self.x = self.x + (np.cos(self.theta) * distance)
+        self.y = self.y + (np.sin(self.theta) * distance)
+
+    def set(self, x, y, theta):
+        """Change the robots current poses.
+
+        Args:
+            x: New x coordinates, per robot or for all.
+            y: New y coordinates, per robot or for all.
+            theta: New theta (orientation) in radians, per robot or for all.
+
+        """
+        size = len(self)
+        self.x = np.broadcast_to(np.asarray(x, dtype=float), size).copy()
+        self.y = np.broadcast_to(np.asarray(y, dtype=float), size).copy()
+        self.theta = np.broadcast_to(np.asarray(theta, dtype=float), size).copy()
+
+    def __getitem__(self, index) -> Robot:
+        robot = Robot()
+        robot.set(self.x[index], self.y[index], self.theta[index])
+        robot.total_distance_covered = float(
+            self.total_distance_covered[index])
+        return robot
+
+    def __str__(self):
+        return f"RobotBatch[size: {len(self)}]"
@@ -1,27 +1,11 @@
-const pullIntervalMs = 100;
+// The map is fetched separately, at most this often.
+const MAP_REFRESH_INTERVAL_MS = 1000;
 
-let isReady = true;
-setInterval(() => {
-    if (isReady) {
-        isReady = false;
-        requestDebugData((event) => {
-            const target = event.target;
-            if (target.readyState != 4 || target.status != 200) {
-                return;
-            }
-
-            updateUI(JSON.parse(target.response));
-            isReady = true;
-        });
-    }
-}, pullIntervalMs);
-
-function requestDebugData(callback) {
-    const xhttp = new XMLHttpRequest();
-    xhttp.onreadystatechange = callback;
-    xhttp.open('GET', '/debug-data', true);
-    xhttp.send();
-}
+// The server pushes debug data whenever it receives an update.
+const debugStream = new EventSource('/debug-stream');
+debugStream.onmessage = (event) => {
+    updateUI(JSON.parse(event.data));
+};
 
 function updateUI(data) {
     if (!data) {
@@ -30,8 +14,6 @@ function updateUI(data) {
 
     updateTime(data.time);
     updateBattery(data.battery);
-    updateMap(data.map);
-    updateCameraFeed(data.cameraFeed);
     updateMotor(data.sensorMech.motor);
     updateSteering(data.sensorMech.steering);
     updateCPU(data.sensorElec.cpu);
@@ -47,15 +29,20 @@ function updateBattery(battery) {
     document.getElementById('battery').innerText = `Battery: ${battery}%`;
 }
 
-function updateMap(map) {
-    // TODO
+function updateMap() {
+    // Drawn once loaded, so the previous map stays visible meanwhile. The
+    // server responds with 404 until it has received a complete map.
+    const image = new Image();
+    image.onload = () => {
+        const canvas = document.getElementById('map');
+        canvas.width = image.width;
+        canvas.height = image.height;
+        canvas.getContext('2d').drawImage(image, 0, 0);
+    };
+    image.src = `/map.png?t=${Date.now()}`;
 }
 
-function updateCameraFeed(cameraFeed) {
-    if (cameraFeed) {
-        document.getElementById('camera-feed').src = "data:image/jpg;base64," + cameraFeed;
-    }
-}
+setInterval(updateMap, MAP_REFRESH_INTERVAL_MS);
 
 function updateMotor(motor) {
     document.getElementById('motor-value').innerText = `${motor} RPM`;
@@ -1,15 +1,25 @@
-import base64
+import argparse
+import gzip
 import json
+import mimetypes
 import os.path
 import pathlib
 import sys
+import time
+import urllib.parse
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Condition, Lock
+
+import cv2
+import numpy as np
 
 DIRECTORY = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.dirname(DIRECTORY))
 # workaround for autopep8 moving imports to the top.
 if 'listen_to' not in sys.modules:
     from communication.listener import listen_to, MessageListener
+    from communication.shared_frame import CAMERA_FEED_NAME, SharedFrameBuffer
+    from communication.map_delta import MapDeltaDecoder
 
 
 host_name = 'localhost'
@@ -17,73 +27,400 @@ server_port = 8080
 
 root_path = os.path.join(pathlib.Path(__file__).parent, 'debug-ui')
 
+# Assets smaller than this are not worth compressing.
+GZIP_MIN_SIZE = 256
+
+# Static assets by absolute path, reloaded when the file is modified.
+assets: dict = {}
+assets_lock = Lock()
+
+# How often (s) an idle debug stream sends a comment, to detect closed connections.
+DEBUG_STREAM_KEEPALIVE_INTERVAL = 15
+
 debug_data: dict = None
 message_listener: MessageListener
+map_listener: MessageListener
+
+# The occupancy grid map, rebuilt from the changes published by mapping.
+map_decoder = MapDeltaDecoder()
+map_png: tuple = (0, None)
+map_lock = Lock()
+
+# The camera stream sends at most this many frames per second.
+CAMERA_STREAM_MAX_FPS = 15
+# JPEG quality of the camera stream, from 0 to 100.
+CAMERA_STREAM_QUALITY = 80
+CAMERA_STREAM_BOUNDARY = 'frame'
+# Check whether perception restarted or closed the camera feed, if it
+# didn't share a new frame for this many seconds.
+CAMERA_FEED_STALE_TIMEOUT = 2
+
+
+class DebugStream:
+    """
+    Fans debug data out to all connected clients. Every update is serialized
+    once, no matter how many clients there are. Clients which are too slow
+    skip to the latest update.
+    """
+
+    def __init__(self):
+        self.condition = Condition()
+        self.sequence = 0
+        self.data = b'null'
+        self.event = None
+
+    def publish(self, data: dict):
+        """Serializes data as JSON and wakes all waiting clients."""
+        serialized = json.dumps(data, default=str).encode('utf-8')
+        with self.condition:
+            self.sequence += 1
+            self.data = serialized
+            self.event = b'data: ' + serialized + b'\n\n'
+            self.condition.notify_all()
+
+    def wait(self, sequence: int, timeout: float = None) -> tuple:
+        """
+        Blocks until there is an update newer than sequence.
+
+        Returns:
+            The sequence and the server-sent event of the latest update,
+            or (sequence, None) if there was none within timeout.
+        """
+        with self.condition:
+            if self.condition.wait_for(lambda: self.sequence > sequence, timeout):
+                return self.sequence, self.event
+            return sequence, None
+
+
+debug_stream = DebugStream()
+
+
+class CameraStream:
+    """
+    Encodes the annotated camera frames shared by perception as JPEG.
+    Every frame is encoded once, no matter how many clients are streaming,
+    and at most CAMERA_STREAM_MAX_FPS frames are encoded per second.
+    """
+
+    def __init__(self, name: str = CAMERA_FEED_NAME):
+        self.name = name
+        self.lock = Lock()
+        self.feed = None
+        self.feed_sequence = 0
+        self.feed_read_at = None
+        self.sequence = 0
+        self.jpeg = None
+        self.encoded_at = None
+        self.is_closed = False
+
+    def get_jpeg(self) -> tuple:
+        """
+        Returns the sequence and JPEG of the latest frame, encoding it if it is new.
+        Returns (0, None) if perception didn't share any frame yet.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self.is_closed:
+                return self.sequence, None
+            if self.encoded_at is None or now - self.encoded_at >= 1 / CAMERA_STREAM_MAX_FPS:
+                frame = self.read_frame()
+                if frame is not None:
+                    _, jpeg = cv2.imencode(
+                        '.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, CAMERA_STREAM_QUALITY])
+                    self.jpeg = jpeg.tobytes()
+                    self.sequence += 1
+                    self.encoded_at = now
+
+            return self.sequence, self.jpeg
+
+    def read_frame(self):
+        """Returns the latest shared frame, or None if there is no new one."""
+        now = time.monotonic()
+        if self.feed is not None and now - self.feed_read_at >= CAMERA_FEED_STALE_TIMEOUT:
+            self.feed_read_at = now
+            if not self.feed.is_current():
+                self.detach()  # Perception restarted or shut down.
+        if self.feed is not None and self.feed.sequence < self.feed_sequence:
+            self.detach()  # The writer started over.
+
+        if self.feed is None:
+            try:
+                self.feed = SharedFrameBuffer.attach(self.name)
+            except FileNotFoundError:
+                return None  # Perception didn't share any frame yet.
+            self.feed_sequence = 0
+            self.feed_read_at = now
+
+        self.feed_sequence, frame = self.feed.read(self.feed_sequence)
+        if frame is not None:
+            self.feed_read_at = now
+        return frame
+
+    def detach(self):
+        self.feed.close()
+        self.feed = None
+
+    def wait(self, sequence: int) -> tuple:
+        """
+        Blocks until a frame newer than sequence is available, returns its sequence and JPEG.
+        Returns (sequence, None) once the stream is closed.
+        """
+        while not self.is_closed:
+            latest, jpeg = self.get_jpeg()
+            if latest > sequence:
+                return latest, jpeg
+            time.sleep(1 / CAMERA_STREAM_MAX_FPS)
+        return sequence, None
+
+    def close(self):
+        """Ends all streams and detaches from the shared frames."""
+        with self.lock:
+            self.is_closed = True
+            if self.feed is not None:
+                self.detach()
+
+
+camera_stream = CameraStream()
+
+
+class Asset:
+    """A static file of the debug UI, held in memory with its gzip compressed body."""
+
+    def __init__(self, path: str, mtime_ns: int, body: bytes):
+        self.mtime_ns = mtime_ns
+        self.body = body
+        self.etag = '"{:x}-{:x}"'.format(mtime_ns, len(body))
+
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type in ('application/javascript', 'application/json'):
+            self.content_type += '; charset=utf-8'
+
+        self.gzip_body = None
+        if len(body) >= GZIP_MIN_SIZE:
+            compressed = gzip.compress(body, 9, mtime=0)
+            if len(compressed) < len(body):
+                self.gzip_body = compressed
+
+    def matches(self, if_none_match: str) -> bool:
+        """
+        Whether an If-None-Match header lists the ETag of the asset, or is *.
+        Compares weakly, i.e. ignores the W/ prefix of weak ETags.
+        """
+        for etag in if_none_match.split(','):
+            etag = etag.strip()
+            if etag.startswith('W/'):
+                etag = etag[2:]
+            if etag in ('*', self.etag):
+                return True
+        return False
+
+
+def get_asset(path: str) -> Asset:
+    """
+    Returns the asset at absolute path, reading it from disk only if it's
+    not cached yet or has been modified since. Raises OSError if there is no such file.
+    """
+    mtime_ns = os.stat(path).st_mtime_ns
+    with assets_lock:
+        asset = assets.get(path)
+        if asset is not None and asset.mtime_ns == mtime_ns:
+            return asset
+
+    with open(path, 'rb') as f:
+        asset = Asset(path, mtime_ns, f.read())
+    with assets_lock:
+        assets[path] = asset
+    return asset
 
 
 class RequestHandler(BaseHTTPRequestHandler):
     routes = {
         '/': lambda self: self.send_file('/index.html'),
-        '/debug-data': lambda self: self.send_debug_data()
+        '/debug-data': lambda self: self.send_debug_data(),
+        '/debug-stream': lambda self: self.send_debug_stream(),
+        '/camera-stream': lambda self: self.send_camera_stream(),
+        '/map.png': lambda self: self.send_map()
     }
 
     def do_GET(self):
-        if self.path in self.routes:
-            self.routes[self.path](self)
+        route = urllib.parse.urlsplit(self.path).path
+        if route in self.routes:
+            self.routes[route](self)
         else:
             self.send_file(self.path)
 
     def get_absolute_path_from_relative(self, path):
-        return os.path.join(root_path, path[1:])
+        """
+        Returns the absolute path of a file of the debug UI,
+        or None if path points outside of it.
+        """
+        path = urllib.parse.unquote(urllib.parse.urlsplit(path).path)
+        root = os.path.abspath(root_path)
+        absolute_path = os.path.abspath(os.path.join(root, path.lstrip('/')))
+        if os.path.commonpath([root, absolute_path]) != root:
+            return None
+        return absolute_path
 
     def send_file(self, path):
+        """
+        Sends a file of the debug UI from the asset cache. Replies 304 if the
+        browser's copy is still valid and sends the gzip body if accepted.
+        """
         try:
-            file_to_open = self.get_absolute_path_from_relative(path)
-            content_to_send = open(file_to_open).read()
-            self.send_response(200)
-        except:
-            content_to_send = 'File not found'
-            self.send_response(404)
+            asset = get_asset(self.get_absolute_path_from_relative(path))
+        except (OSError, TypeError):
+            self.send_not_found()
+            return
 
+        if asset.matches(self.headers.get('If-None-Match', '')):
+            self.send_response(304)
+            self.send_header('ETag', asset.etag)
+            self.end_headers()
+            return
+
+        body = asset.body
+        self.send_response(200)
+        self.send_header('Content-Type', asset.content_type)
+        self.send_header('ETag', asset.etag)
+        self.send_header('Cache-Control', 'no-cache')
+        if asset.gzip_body is not None:
+            self.send_header('Vary', 'Accept-Encoding')
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = asset.gzip_body
+                self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(bytes(content_to_send, 'utf-8'))
+        self.wfile.write(body)
+
+    def send_not_found(self):
+        content_to_send = b'File not found'
+        self.send_response(404)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(content_to_send)))
+        self.end_headers()
+        self.wfile.write(content_to_send)
 
     def send_debug_data(self):
+        content_to_send = debug_stream.data
         self.send_response(200)
         self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(content_to_send)))
         self.end_headers()
-        self.wfile.write(
-            bytes(json.dumps(self.get_debug_data(), default=str), 'utf-8'))
+        self.wfile.write(content_to_send)
 
-    def get_debug_data(self):
-        global debug_data
-        if (debug_data is not None):
-            debug_data["cameraFeed"] = self.get_camera_data()
+    def send_debug_stream(self):
+        """
+        Streams debug data as server-sent events, one for every message received.
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
 
-        return debug_data
+        sequence = 0
+        try:
+            while True:
+                sequence, event = debug_stream.wait(
+                    sequence, DEBUG_STREAM_KEEPALIVE_INTERVAL)
+                self.wfile.write(event or b': keepalive\n\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client disconnected.
+
+    def send_camera_stream(self):
+        """
+        Streams the annotated camera frames as MJPEG (multipart/x-mixed-replace).
+        """
+        self.send_response(200)
+        self.send_header(
+            'Content-Type', f'multipart/x-mixed-replace; boundary={CAMERA_STREAM_BOUNDARY}')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
 
-    def get_camera_data(self):
+        sequence = 0
         try:
-            frame_path = self.get_absolute_path_from_relative(
-                "/current-frame.jpg")
-            return base64.b64encode(
-                open(frame_path, "rb").read()).decode("utf-8")
-        except Exception as e:
-            print(e)
-            return None
+            while True:
+                sequence, jpeg = camera_stream.wait(sequence)
+                if jpeg is None:
+                    return  # Server is shutting down.
+                self.wfile.write(
+                    f'--{CAMERA_STREAM_BOUNDARY}\r\n'
+                    f'Content-Type: image/jpeg\r\n'
+                    f'Content-Length: {len(jpeg)}\r\n\r\n'.encode('ascii'))
+                self.wfile.write(jpeg)
+                self.wfile.write(b'\r\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client disconnected.
+
+
+    def send_map(self):
+        """
+        Sends the occupancy grid map as grayscale PNG, occupied cells are dark.
+        """
+        content_to_send = get_map_png()
+        if content_to_send is None:
+            self.send_not_found()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(content_to_send)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(content_to_send)
+
+
+def get_map_png() -> bytes:
+    """
+    Returns the rebuilt map as PNG, encoded once per received change.
+    While changes are missing, i.e. until the next keyframe after a lost
+    message, the last complete map is returned. Returns None if no
+    complete map has been received yet.
+    """
+    global map_png
+
+    with map_lock:
+        if not map_decoder.is_complete:
+            return map_png[1]
+
+        log_odds = map_decoder.get_map()
+        if map_png[0] != map_decoder.sequence:
+            free = 1 / (1 + np.exp(log_odds))
+            # Row 0 is the bottom of the map.
+            image = np.flipud(np.rint(free * 255).astype(np.uint8))
+            map_png = (map_decoder.sequence, cv2.imencode('.png', image)[1].tobytes())
+
+        return map_png[1]
 
 
 def listen_to_socket():
-    global message_listener
+    global message_listener, map_listener
     message_listener = listen_to('perception/sensors', receive_debug_data)
+    map_listener = listen_to('cognition/mapping', receive_map_delta)
 
 
 def receive_debug_data(data: dict):
     global debug_data
     debug_data = data
+    debug_stream.publish(data)
+
+
+def receive_map_delta(delta: dict):
+    with map_lock:
+        map_decoder.apply(delta)
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stellar observatory')
+    parser.add_argument('--camera-fps', type=float, default=CAMERA_STREAM_MAX_FPS,
+                        help="Maximum frame rate of the camera stream.")
+    parser.add_argument('--camera-quality', type=int, default=CAMERA_STREAM_QUALITY,
+                        help="JPEG quality of the camera stream (0-100).")
+    args = parser.parse_args()
+    CAMERA_STREAM_MAX_FPS = args.camera_fps
+    CAMERA_STREAM_QUALITY = args.camera_quality
+
     listen_to_socket()
 
     try:
@@ -92,3 +429,6 @@ if __name__ == '__main__':
             server.serve_forever()
     except:
         message_listener.stop()
+        map_listener.stop()
+    finally:
+        camera_stream.close()
@@ -1,5 +1,9 @@
+import queue
+import time
+from threading import Lock, Thread
+from typing import Callable
+
 import cv2
-import numpy as np
 
 
 class PicamSimulator:
@@ -26,13 +30,205 @@ class PicamSimulator:
 
         return has_frame, frame
 
+    def get_frame_rate(self) -> float:
+        return self.stream.get(cv2.CAP_PROP_FPS)
+
     @staticmethod
     def rotate_frame(frame):
-        h, w = frame.shape[:2]
-        center = (w / 2, h / 2)
+        return cv2.rotate(frame, cv2.ROTATE_180)
+
+    def stop(self):
+        self.is_running = False
+
+
+class PipelineStats:
+    """Collects per-stage latencies and frame counts of a pipeline."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.started = time.perf_counter()
+        self.latencies = {}
+        self.counts = {}
+
+    def record(self, stage: str, seconds: float):
+        with self.lock:
+            total, count = self.latencies.get(stage, (0.0, 0))
+            self.latencies[stage] = (total + seconds, count + 1)
+
+    def count(self, event: str):
+        with self.lock:
+            self.counts[event] = self.counts.get(event, 0) + 1
+
+    def report(self) -> dict:
+        """
+        Returns the mean latency per stage (ms), the frame counts and the
+        achieved frame rate, i.e. detection results per second.
+        """
+        with self.lock:
+            elapsed = time.perf_counter() - self.started
+            return {
+                'latency_ms': {stage: total / count * 1000
+                               for stage, (total, count) in self.latencies.items()},
+                'frames': dict(self.counts),
+                'fps': self.counts.get('detected', 0) / elapsed if elapsed > 0 else 0.0
+            }
 
-        rotation_matrix = cv2.getRotationMatrix2D(center, 180, 1)
-        return cv2.warpAffine(frame, rotation_matrix, (w, h))
+
+class DetectionPipeline:
+    """
+    Streams frames from a PicamSimulator through a pool of detection workers.
+
+    A decode thread reads frames into a bounded queue. When the workers
+    can't keep up, the oldest queued frame is dropped, so workers always
+    pick up recent frames. Workers also drop frames that are older than
+    the latest published result. Results are published to a single slot
+    holding the most recent one.
+
+    Detectors that must see the frames in order, i.e. methods of objects
+    with a true `sequential` attribute like PylonTracker, get a single worker.
+    """
+
+    def __init__(self, camera: PicamSimulator, detect: Callable, workers: int = 2,
+                 max_queued_frames: int = None, realtime: bool = False):
+        """
+        Args:
+            camera:             Source of the frames.
+            detect:             Called with each frame, e.g. PylonDetector.find_pylons.
+            workers:            Number of detection workers, 1 for sequential detectors.
+            max_queued_frames:  Capacity of the frame queue, defaults to workers.
+            realtime:           Decode at the frame rate of the video instead
+                                of as fast as possible.
+        """
+        if getattr(getattr(detect, '__self__', None), 'sequential', False):
+            workers = 1
+
+        self.camera = camera
+        self.detect = detect
+        self.realtime = realtime
+        self.frames = queue.Queue(max_queued_frames or workers)
+        self.stats = PipelineStats()
+
+        self.result_lock = Lock()
+        self.latest_result = None
+
+        self.is_running = False
+        self.threads = [Thread(target=self.decode, daemon=True)] + \
+            [Thread(target=self.work, daemon=True) for _ in range(workers)]
+
+    def start(self):
+        self.is_running = True
+        for thread in self.threads:
+            thread.start()
+        return self
 
     def stop(self):
         self.is_running = False
+        self.camera.stop()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+    def get_latest_result(self):
+        """
+        Returns the most recent (frame index, frame, detection result),
+        or None if no frame has been processed yet.
+        """
+        with self.result_lock:
+            return self.latest_result
+
+    def decode(self):
+        frame_interval = 0.0
+        if self.realtime and self.camera.get_frame_rate() > 0:
+            frame_interval = 1.0 / self.camera.get_frame_rate()
+
+        index = 0
+        next_frame_time = time.perf_counter()
+        while self.is_running:
+            started = time.perf_counter()
+            has_frame, frame = self.camera.get_next_frame()
+            if not has_frame:
+                break
+
+            decoded = time.perf_counter()
+            self.stats.record('decode', decoded - started)
+            self.stats.count('decoded')
+            index += 1
+
+            self.put_frame((index, decoded, frame))
+
+            if frame_interval:
+                next_frame_time += frame_interval
+                time.sleep(max(0.0, next_frame_time - time.perf_counter()))
+
+        # Signal the end of the stream to all workers.
+        for _ in self.threads[1:]:
+            self.frames.put(None)
+
+    def put_frame(self, item):
+        while True:
+            try:
+                self.frames.put_nowait(item)
+                return
+            except queue.Full:
+                pass
+
+            try:
+                self.frames.get_nowait()
+                self.stats.count('dropped')
+            except queue.Empty:
+                pass
+
+    def work(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                return
+
+            index, decoded, frame = item
+            started = time.perf_counter()
+            self.stats.record('queue', started - decoded)
+
+            if self.is_outdated(index):
+                self.stats.count('dropped')
+                continue
+
+            result = self.detect(frame)
+            detected = time.perf_counter()
+            self.stats.record('detect', detected - started)
+            self.stats.record('total', detected - decoded)
+            self.stats.count('detected')
+
+            with self.result_lock:
+                if self.latest_result is None or self.latest_result[0] < index:
+                    self.latest_result = (index, frame, result)
+
+    def is_outdated(self, index: int) -> bool:
+        with self.result_lock:
+            return self.latest_result is not None and self.latest_result[0] > index
+
+
+if __name__ == '__main__':
+    import argparse
+    from pylon_detection import PylonDetector, PylonTracker
+
+    parser = argparse.ArgumentParser(description='Pylon detection pipeline')
+    parser.add_argument('video', help="Path to the video.")
+    parser.add_argument('--workers', type=int, default=2,
+                        help="Number of detection workers.")
+    parser.add_argument('--realtime', action='store_true',
+                        help="Decode at the frame rate of the video.")
+    parser.add_argument('--track', action='store_true',
+                        help="Search only around the pylons of the previous frame.")
+    args = parser.parse_args()
+
+    detect = PylonTracker().find_pylons if args.track else PylonDetector.find_pylons
+    pipeline = DetectionPipeline(PicamSimulator(args.video), detect,
+                                 workers=args.workers, realtime=args.realtime)
+    pipeline.start().join()
+
+    report = pipeline.stats.report()
+    for stage, latency in report['latency_ms'].items():
+        print(f"{stage:<10} {latency:8.2f} ms")
+    print(f"frames     {report['frames']}")
+    print(f"fps        {report['fps']:8.2f}")
@@ -0,0 +1,137 @@
+"""
+Runs pylon detection over whole datasets, i.e. directories of frames or videos.
+
+Frames are decoded on a thread pool (directories) or sequentially (videos),
+detected on a process pool and yielded in order as JSON serializable results.
+"""
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterator
+
+import cv2
+
+from stellar.perception import pylon_detection
+from stellar.perception.pylon_detection import PylonDetector
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def list_frames(directory: str) -> list:
+    """Returns the paths of all images in directory, sorted by name."""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def load_frame(path: str):
+    """Loads a frame, returns (frame id, decode time (s), HSV image)."""
+    started = time.perf_counter()
+    image = PylonDetector.load_image(path)
+    return os.path.basename(path), time.perf_counter() - started, image
+
+
+def read_directory(directory: str, threads: int = None) -> Iterator[tuple]:
+    """Yields (frame id, decode time (s), HSV image) for all images in directory."""
+    threads = threads or min(32, (os.cpu_count() or 1) + 4)
+    with ThreadPoolExecutor(threads) as pool:
+        # Submit lazily, so only a few decoded frames wait for detection.
+        pending = deque()
+        for path in list_frames(directory):
+            pending.append(pool.submit(load_frame, path))
+            if len(pending) >= 2 * threads:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def read_video(path: str, rotate: bool = False) -> Iterator[tuple]:
+    """
+    Yields (frame id, decode time (s), HSV image) for all frames of a video.
+    Frame ids are the frame numbers, starting at 1.
+    """
+    stream = cv2.VideoCapture(path)
+    if not stream.isOpened():
+        raise IOError(f"Can't open video: {path}")
+
+    index = 0
+    try:
+        while True:
+            started = time.perf_counter()
+            has_frame, frame = stream.read()
+            if not has_frame:
+                return
+
+            if rotate:
+                frame = cv2.rotate(frame, cv2.ROTATE_180)
+            image = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+            index += 1
+            yield index, time.perf_counter() - started, image
+    finally:
+        stream.release()
+
+
+def read_frames(source: str, threads: int = None, rotate: bool = False) -> Iterator[tuple]:
+    """Yields the frames of a directory or a video, see read_directory and read_video."""
+    if os.path.isdir(source):
+        return read_directory(source, threads)
+    return read_video(source, rotate)
+
+
+def configure(segregation_mode: str = None):
+    """Applies the detection settings, called in every worker process."""
+    pylon_detection.DO_CREATE_DEBUG_IMAGES = False
+    if segregation_mode:
+        pylon_detection.COLOR_SEGREGATION_MODE = segregation_mode
+
+
+def detect(image) -> tuple:
+    """Finds pylons in image, returns (pylons as dicts, detect time (s))."""
+    started = time.perf_counter()
+    pylons = PylonDetector.find_pylons(image)
+    elapsed = time.perf_counter() - started
+
+    return [{
+        'box': [int(pylon.position[0]), int(pylon.position[1]), int(pylon.width), int(pylon.height)],
+        'distance_cm': float(pylon.estimated_distance_cm),
+        'is_start_pylon': bool(pylon.is_start_pylon)
+    } for pylon in pylons], elapsed
+
+
+def detect_frames(frames: Iterator[tuple], processes: int = None,
+                  segregation_mode: str = None) -> Iterator[dict]:
+    """
+    Detects pylons in frames on a pool of processes.
+
+    Args:
+        frames:             (frame id, decode time (s), HSV image), e.g. from read_frames.
+        processes:          Number of detection processes, defaults to the number of CPUs.
+        segregation_mode:   Color segregation mode, defaults to COLOR_SEGREGATION_MODE.
+
+    Returns:
+        For each frame, in order, a dict with the frame id, the detected pylons
+        and the decode and detect times in ms.
+    """
+    processes = processes or os.cpu_count()
+    with ProcessPoolExecutor(processes, initializer=configure,
+                             initargs=(segregation_mode,)) as pool:
+        # Bound the frames in flight, so a fast reader doesn't fill up memory.
+        pending = deque()
+        for frame_id, decode_time, image in frames:
+            pending.append((frame_id, decode_time, pool.submit(detect, image)))
+            if len(pending) >= 2 * processes:
+                yield get_result(*pending.popleft())
+
+        while pending:
+            yield get_result(*pending.popleft())
+
+
+def get_result(frame_id, decode_time: float, future) -> dict:
+    pylons, detect_time = future.result()
+    return {
+        'frame': frame_id,
+        'pylons': pylons,
+        'decode_ms': decode_time * 1000,
+        'detect_ms': detect_time * 1000
+    }
@@ -1,10 +1,21 @@
+import atexit
 import math
-from typing import List
+import os
+import queue
+import sys
+import threading
+from typing import Callable, List
 
 import cv2
 import numpy as np
 
-DO_CREATE_DEBUG_IMAGES = True
+# Debug only: write the intermediate images of every detection step.
+# Images are handed to debug_image_hook, or by default queued to a background writer.
+DO_CREATE_DEBUG_IMAGES = False
+DEBUG_IMAGE_DIRECTORY = "tests/pylon_test_images_output"
+# How many debug images may wait to be written. When the writer can't keep up,
+# new images are dropped.
+DEBUG_IMAGE_QUEUE_SIZE = 64
 
 # The maximum size of the image to be processed.
 # Bigger images will be shrunk to match the size.
@@ -18,12 +29,21 @@ MIN_PYLON_SIZE = MAX_IMAGE_SIZE / 10
 # The range of width/height ratio a pylon can have.
 PYLON_RATIO_RANGE = (0.5, 0.65)
 
-# How far two pixels can be to be considered neighbors.
+# How colors are segregated:
+# 'mean-shift' uses mean shift filtering, which is accurate but slow.
+# 'median' uses a median blur and relies on the color thresholds, which is
+# several hundred times faster.
+COLOR_SEGREGATION_MODE = 'mean-shift'
+
+# Mean shift: How far two pixels can be to be considered neighbors.
 # Higher values increase computing time.
 COLOR_SEGREGATION_SPATIAL_RADIUS = 30
-# How far two colors can be to be considered similar.
+# Mean shift: How far two colors can be to be considered similar.
 COLOR_SEGREGATION_COLOR_RADIUS = 40
 
+# Median: Size of the blur kernel, must be odd.
+COLOR_SEGREGATION_MEDIAN_KERNEL_SIZE = 5
+
 # The thresholds used for Canny Edge Detection.
 # If the difference between two neighboring pixel colors is lower than WEAK, it is not an edge.
 # If the difference is higher than STRONG, it is considered an edge.
@@ -44,10 +64,74 @@ MARKING_COLOR_REGULAR_PYLON = [0, 255, 255]
 # Used for distance estimation. Determined through measurement.
 DISTANCE_ESTIMATE_MAGIC_NUMBER = 80.0 * 1105 / 3096
 
+# Tracking: How much a region of interest around a tracked pylon is expanded,
+# relative to the pylon size, to cover its movement between two frames.
+TRACKING_REGION_MARGIN = 0.5
+# Tracking: Scan the full image every n frames to pick up new pylons.
+TRACKING_FULL_SCAN_INTERVAL = 10
+
+# Per-channel lookup table for detecting pylon colors, see PylonDetector.get_pylon_color_lut.
+pylon_color_lut = None
+pylon_color_lut_thresholds = None
+
 # Debug only: used to give debug images unique names between different test of the same test run.
 run_id = 0
 step_id = 0
 
+# Debug only: called with (image, name) for every debug image, see PylonDetector.write_image_debug.
+debug_image_hook: Callable = None
+debug_image_writer = None
+
+
+class DebugImageWriter:
+    """
+    Writes debug images on a background thread, so writing them
+    doesn't slow down detection.
+
+    At most max_queued_images are waiting to be written,
+    further images are dropped until the writer catches up.
+    Images which can't be written are reported and skipped.
+    """
+
+    def __init__(self, directory: str, max_queued_images: int = DEBUG_IMAGE_QUEUE_SIZE):
+        self.directory = directory
+        self.images = queue.Queue(max_queued_images)
+        self.dropped = 0
+        self.failed = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, image, name: str):
+        """
+        Queues image to be written as name.png, returns False if it was dropped.
+        """
+        try:
+            # Copy, since the caller may still modify the image.
+            self.images.put_nowait((np.copy(image), name))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def run(self):
+        while True:
+            image, name = self.images.get()
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                PylonDetector.write_image(image, os.path.join(self.directory, f"{name}.png"))
+            except Exception as error:
+                # Keep consuming, or flush() would block forever.
+                self.failed += 1
+                print(f"Failed to write debug image {name}: {error!r}", file=sys.stderr)
+            finally:
+                self.images.task_done()
+
+    def flush(self):
+        """
+        Blocks until all queued images are written.
+        """
+        self.images.join()
+
 
 class Pylon:
     position = (0, 0)
@@ -86,17 +170,32 @@ class PylonDetector:
     @staticmethod
     def write_image_debug(image, name: str):
         """
-        Debug only: writes a debug image with specified name.
+        Debug only: hands a debug image with specified name to debug_image_hook,
+        which defaults to writing it to DEBUG_IMAGE_DIRECTORY in the background.
+        Does nothing unless DO_CREATE_DEBUG_IMAGES is set.
         """
         global step_id
 
         if not DO_CREATE_DEBUG_IMAGES:
             return
 
-        PylonDetector.write_image(
-            image, f"tests/pylon_test_images_output/{run_id}_{step_id}_{name}.png")
+        hook = debug_image_hook or PylonDetector.get_debug_image_writer().write
+        hook(image, f"{run_id}_{step_id}_{name}")
         step_id += 1
 
+    @staticmethod
+    def get_debug_image_writer() -> DebugImageWriter:
+        """
+        Debug only: returns the background writer for debug images,
+        which is started on first use and flushed on exit.
+        """
+        global debug_image_writer
+
+        if debug_image_writer is None:
+            debug_image_writer = DebugImageWriter(DEBUG_IMAGE_DIRECTORY)
+            atexit.register(debug_image_writer.flush)
+        return debug_image_writer
+
     @staticmethod
     def mark_pylons(image, pylons_found: List[Pylon]):
         """
@@ -137,11 +236,19 @@ class PylonDetector:
         return cv2.resize(image, (x_res_new, y_res_new))
 
     @staticmethod
-    def segregate_colors(image):
+    def segregate_colors(image, mode: str = None):
         """
         Segregates colors from image to simplify object recognition.
+        Mode defaults to COLOR_SEGREGATION_MODE.
         """
-        return cv2.pyrMeanShiftFiltering(image, COLOR_SEGREGATION_SPATIAL_RADIUS, COLOR_SEGREGATION_COLOR_RADIUS)
+        mode = mode or COLOR_SEGREGATION_MODE
+
+        if mode == 'mean-shift':
+            return cv2.pyrMeanShiftFiltering(image, COLOR_SEGREGATION_SPATIAL_RADIUS, COLOR_SEGREGATION_COLOR_RADIUS)
+        if mode == 'median':
+            return cv2.medianBlur(image, COLOR_SEGREGATION_MEDIAN_KERNEL_SIZE)
+
+        raise ValueError(f"Unknown color segregation mode: {mode}")
 
     @staticmethod
     def get_edges(image):
@@ -158,15 +265,47 @@ class PylonDetector:
 
     @staticmethod
     def detect_pylon_colors(image):
-        t_min, t_max = PYLON_COLOR_ORANGE_THRESHOLD
-        image_orange = PylonDetector.detect_color(image, t_min, t_max)
-        PylonDetector.write_image_debug(image_orange, "orange")
+        """
+        Produces a mask of all pixels matching any of the pylon colors
+        in a single lookup pass.
+        """
+        lut = PylonDetector.get_pylon_color_lut()
 
-        t_min, t_max = PYLON_COLOR_WHITE_THRESHOLD
-        image_white = PylonDetector.detect_color(image, t_min, t_max)
-        PylonDetector.write_image_debug(image_white, "white")
+        # Bit i of a channel is set if the value lies within threshold i.
+        bits = cv2.LUT(image, lut)
+        mask = cv2.bitwise_and(bits[:, :, 0], bits[:, :, 1])
+        cv2.bitwise_and(mask, bits[:, :, 2], dst=mask)
 
-        return np.clip(image_orange + image_white, 0, 255)
+        return cv2.compare(mask, 0, cv2.CMP_NE)
+
+    @staticmethod
+    def get_pylon_color_lut():
+        """
+        Returns a lookup table (256 x 1 x 3) for cv2.LUT, which maps each
+        channel value to a bit mask of the pylon color thresholds that
+        include it. The table is rebuilt when the thresholds change.
+        """
+        global pylon_color_lut, pylon_color_lut_thresholds
+
+        thresholds = [PYLON_COLOR_ORANGE_THRESHOLD, PYLON_COLOR_WHITE_THRESHOLD]
+        key = [threshold.tolist() for threshold in thresholds]
+        if key == pylon_color_lut_thresholds:
+            return pylon_color_lut
+
+        values = np.arange(256)
+        lut = np.zeros((256, 1, 3), dtype=np.uint8)
+        for bit, (t_min, t_max) in enumerate(thresholds):
+            in_range = (values >= t_min[:, np.newaxis]) & (values <= t_max[:, np.newaxis])
+
+            # H values are in range [0, 179], negative ones wrap around.
+            hue = in_range[0] | ((values >= 180 + t_min[0]) & (values <= 179))
+            in_range[0] = hue & (values <= 179)
+
+            for channel in range(3):
+                lut[in_range[channel], 0, channel] |= 1 << bit
+
+        pylon_color_lut, pylon_color_lut_thresholds = lut, key
+        return lut
 
     @staticmethod
     def detect_color(image, threshold_min, threshold_max):
@@ -210,6 +349,14 @@ class PylonDetector:
         image_resized = PylonDetector.resize_image(image, MAX_IMAGE_SIZE)
         PylonDetector.write_image_debug(image_resized, "resized")
 
+        return PylonDetector.get_pylon_map_resized(image_resized)
+
+    @staticmethod
+    def get_pylon_map_resized(image_resized):
+        """
+        Same as get_pylon_map, for an image (or a region of it) which
+        has already been resized.
+        """
         # Segregate colors for easier detection.
         image_segregated = PylonDetector.segregate_colors(image_resized)
         PylonDetector.write_image_debug(image_segregated, "seg")
@@ -236,34 +383,102 @@ class PylonDetector:
         return image_result
 
     @staticmethod
-    def get_potential_pylons(image) -> List[Pylon]:
+    def get_potential_pylons(image, regions: List[tuple] = None) -> List[Pylon]:
+        """
+        Finds pylon candidates in image. If regions (x, y, width, height)
+        are given, only these parts of the image are searched.
+        """
         PylonDetector.write_image_debug(image, "original")
 
-        pylon_map = PylonDetector.get_pylon_map(image)
-
-        _, _, stats, _ = cv2.connectedComponentsWithStats(pylon_map)
-
-        # Ignore first element (background)
-        # Keep only first 4 stats (position & dimension)
-        result = stats[1:, :4]
+        if regions is None:
+            pylon_map = PylonDetector.get_pylon_map(image)
+            factor = image.shape[0] / pylon_map.shape[0]
+            result = PylonDetector.get_component_stats(pylon_map)
+        else:
+            image_resized = PylonDetector.resize_image(image, MAX_IMAGE_SIZE)
+            PylonDetector.write_image_debug(image_resized, "resized")
+            factor = image.shape[0] / image_resized.shape[0]
+
+            results = [np.zeros((0, 4), dtype=np.int32)]
+            for region in PylonDetector.merge_regions(regions, factor, image_resized.shape):
+                x1, y1, x2, y2 = region
+                pylon_map = PylonDetector.get_pylon_map_resized(
+                    image_resized[y1:y2, x1:x2])
+                stats = PylonDetector.get_component_stats(pylon_map)
+                stats[:, :2] += (x1, y1)
+                results.append(stats)
+            result = np.concatenate(results)
+
+        return PylonDetector.scale_potential_pylons(result, factor)
 
+    @staticmethod
+    def scale_potential_pylons(stats, factor: float) -> List[Pylon]:
+        """
+        Scales component stats (x, y, width, height) of the resized image back
+        to the original image size and drops the components too small to be pylons.
+        """
         # Scale coordinates and dimensions back to original image size.
-        factor = image.shape[0] / pylon_map.shape[0]
         # Since array is uint8 but factor is float32, we can't use the *= operator.
-        result[:, :] = result[:, :] * factor
+        stats[:, :] = stats[:, :] * factor
 
         # Ignore pylons that are too small (probably just noise)
         min_size = MIN_PYLON_SIZE * factor
-        return [Pylon(p[0], p[1], p[2], p[3]) for p in result if p[2] >= min_size or p[3] >= min_size]
+        return [Pylon(p[0], p[1], p[2], p[3]) for p in stats if p[2] >= min_size or p[3] >= min_size]
 
     @staticmethod
-    def find_pylons(image) -> List[Pylon]:
+    def get_component_stats(pylon_map):
+        """
+        Returns position and dimension (x, y, width, height) of every
+        connected component in the pylon map.
+        """
+        _, _, stats, _ = cv2.connectedComponentsWithStats(pylon_map)
+
+        # Ignore first element (background)
+        # Keep only first 4 stats (position & dimension)
+        return stats[1:, :4]
+
+    @staticmethod
+    def merge_regions(regions: List[tuple], factor: float, shape: tuple) -> List[tuple]:
+        """
+        Scales regions (x, y, width, height) down by factor, clips them to shape
+        and merges overlapping ones, so no pixel is searched twice.
+        Returns the regions as (x1, y1, x2, y2).
+        """
+        height, width = shape[:2]
+        boxes = [(max(0, int(x / factor)), max(0, int(y / factor)),
+                  min(width, math.ceil((x + w) / factor)), min(height, math.ceil((y + h) / factor)))
+                 for x, y, w, h in regions]
+        boxes = [box for box in boxes if box[0] < box[2] and box[1] < box[3]]
+
+        merged = []
+        while boxes:
+            x1, y1, x2, y2 = boxes.pop()
+            overlapping = [box for box in boxes + merged
+                           if box[0] < x2 and x1 < box[2] and box[1] < y2 and y1 < box[3]]
+            if overlapping:
+                # Grow the box and check the others against it again.
+                for box in overlapping:
+                    (boxes if box in boxes else merged).remove(box)
+                    x1, y1 = min(x1, box[0]), min(y1, box[1])
+                    x2, y2 = max(x2, box[2]), max(y2, box[3])
+                boxes.append((x1, y1, x2, y2))
+            else:
+                merged.append((x1, y1, x2, y2))
+
+        return merged
+
+    @staticmethod
+    def find_pylons(image, regions: List[tuple] = None) -> List[Pylon]:
+        """
+        Finds pylons in image, optionally only within regions
+        (x, y, width, height), see get_potential_pylons.
+        """
         # debug only
         global run_id, step_id
         run_id += 1
         step_id = 0
 
-        pylons = [p for p in PylonDetector.get_potential_pylons(image)
+        pylons = [p for p in PylonDetector.get_potential_pylons(image, regions)
                   if PylonDetector.has_proper_size_ratio(p)]
 
         PylonDetector.set_distance_estimation(image.shape[0], pylons)
@@ -290,3 +505,71 @@ class PylonDetector:
     def get_distance_estimation(image_height: int, pylon_height: int) -> float:
         pylon_height_rate = float(image_height) / float(pylon_height)
         return DISTANCE_ESTIMATE_MAGIC_NUMBER * pylon_height_rate
+
+
+class PylonTracker:
+    """
+    Finds pylons in consecutive frames of a video. Since pylons move only a little
+    between frames, only regions around the pylons of the previous frame are searched.
+    The full frame is scanned every TRACKING_FULL_SCAN_INTERVAL frames or when a
+    tracked pylon is lost.
+
+    find_pylons can be used in place of PylonDetector.find_pylons. As each frame
+    is searched around the pylons of the previous one, frames must be passed in
+    order, see `sequential`.
+    """
+
+    # The result of a frame depends on the previous frame, a DetectionPipeline
+    # runs a single worker for it.
+    sequential = True
+
+    def __init__(self, full_scan_interval: int = None, margin: float = None):
+        self.full_scan_interval = full_scan_interval or TRACKING_FULL_SCAN_INTERVAL
+        self.margin = TRACKING_REGION_MARGIN if margin is None else margin
+        self.pylons = []
+        self.frames_since_full_scan = 0
+        self.full_scans = 0
+        self.lock = threading.Lock()
+
+    def find_pylons(self, image) -> List[Pylon]:
+        with self.lock:
+            tracked = self.pylons
+            is_full_scan = not tracked or self.frames_since_full_scan + 1 >= self.full_scan_interval
+            if not is_full_scan:
+                self.frames_since_full_scan += 1
+
+        pylons = None
+        if not is_full_scan:
+            pylons = PylonDetector.find_pylons(image, self.get_regions(tracked))
+            # Lost track of a pylon: it may have left its region.
+            if len(pylons) < len(tracked):
+                pylons = None
+
+        if pylons is None:
+            pylons = PylonDetector.find_pylons(image)
+            with self.lock:
+                self.frames_since_full_scan = 0
+                self.full_scans += 1
+
+        with self.lock:
+            self.pylons = pylons
+        return pylons
+
+    def get_regions(self, pylons: List[Pylon]) -> List[tuple]:
+        """
+        Returns the regions of interest (x, y, width, height) around pylons.
+        """
+        regions = []
+        for pylon in pylons:
+            dx = pylon.width * self.margin
+            dy = pylon.height * self.margin
+            x, y = pylon.position
+            regions.append((x - dx, y - dy, pylon.width + 2 * dx, pylon.height + 2 * dy))
+        return regions
+
+    def reset(self):
+        """
+        Forgets the tracked pylons, the next frame is scanned fully.
+        """
+        with self.lock:
+            self.pylons = []
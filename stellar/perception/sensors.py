@@ -15,9 +15,17 @@ sys.path.append(path.dirname(DIRECTORY))
 # workaround for autopep8 moving imports to the top.
 if 'send_message' not in sys.modules:
     from communication.sender import send_message
+    from communication.shared_frame import CAMERA_FEED_NAME, SharedFrameBuffer
 
 picam_sim = None
+pylon_pipeline = None
+camera_feed: SharedFrameBuffer = None
+camera_feed_index = 0
 
+# Number of directions a full turn is quantized into for ray casting.
+RAY_CASTING_ANGLE_BINS = 1440
+
+ray_casters: dict = {}
 
 
 class SensorArray:
@@ -41,13 +49,25 @@ class SensorArray:
 
     def sense(self, world, map_pose):
         """Returns current sensor measurements about the world."""
-        measurements = list()
-        for _, sonar_angle in self.sonar_sensors:
-            distance = sense_distance(
-                world, map_pose, sonar_angle, z_max=self.z_max)
-            measurements.append((sonar_angle, distance))
+        angles = [sonar_angle for _, sonar_angle in self.sonar_sensors]
+        distances = get_ray_caster(self.z_max).cast(world, map_pose, angles)
+
+        return list(zip(angles, distances.tolist()))
+
+    def sense_batch(self, world, map_poses):
+        """Returns current sensor measurements of many robots.
+
+        Args:
+            world:      Gridmap representing the world.
+            map_poses:  Tuple of arrays (x, y, theta) with the robots poses in cells.
 
-        return measurements
+        Returns:
+            An array of shape (robots, sonars) with the distance measured
+            by each sonar, in the order of `sonar_sensors`.
+
+        """
+        angles = [sonar_angle for _, sonar_angle in self.sonar_sensors]
+        return get_ray_caster(self.z_max).cast_batch(world, map_poses, angles)
 
 
 def get_occupied_cell_from_distance(world, pose, distance, angle):
@@ -65,7 +85,7 @@ def sense_distance(world, position, direction, threshold=0.5, z_max=10):
     Returns distance to nearest obstacle in given direction.
 
     Args:
-        world:      Gridmap representing the world.
+        world:      Gridmap representing the world, an array or a TiledGrid.
         position:   Current robots pose.
         direction:  Direction that the sensor is facing.
 
@@ -73,28 +93,118 @@ def sense_distance(world, position, direction, threshold=0.5, z_max=10):
         Distance to nearest obstacle in given direction or -1 if
         there was any error.
     """
-    xr, yr, theta = position
-    angle = theta + direction
+    distances = get_ray_caster(z_max).cast(
+        world, position, [direction], threshold)
+
+    return distances.item()
+
+
+class RayCaster:
+    """Casts sonar beams through a gridmap using precomputed rays.
+
+    The directions of a full turn are quantized into bins. For every bin,
+    the cells of the beam (a bresenham line of length z_max, relative to
+    the robot) and their distances are computed once. Casting a beam then
+    boils down to a lookup, a boundary check and a search for the first
+    occupied cell.
+    """
+
+    def __init__(self, z_max, angle_bins=RAY_CASTING_ANGLE_BINS):
+        """Precompute the rays.
+
+        Args:
+            z_max:      Maximum distance for the sonar sensors (cells).
+            angle_bins: Number of directions a full turn is divided into.
+
+        """
+        self.z_max = z_max
+        self.angle_bins = angle_bins
+
+        # Round away floating point noise, e.g. cos(pi/2), before flooring.
+        angles = 2 * np.pi * np.arange(angle_bins) / angle_bins
+        x_max = np.floor(np.round(z_max * np.cos(angles), 9)).astype(int)
+        y_max = np.floor(np.round(z_max * np.sin(angles), 9)).astype(int)
+        rays = [list(bresenham(0, 0, x, y)) for x, y in zip(x_max, y_max)]
 
-    x_max = floor(z_max * np.cos(angle) + xr)
-    y_max = floor(z_max * np.sin(angle) + yr)
+        max_length = max(len(ray) for ray in rays)
+        self.offsets = np.zeros((angle_bins, max_length, 2), dtype=np.intp)
+        self.in_ray = np.zeros((angle_bins, max_length), dtype=bool)
+        for i, ray in enumerate(rays):
+            self.offsets[i, :len(ray)] = ray
+            self.in_ray[i, :len(ray)] = True
 
-    # Span bresenham line continually to z_max with given sonar angle.
-    # When the first obstacle is detected, break and return the sensed
-    # (x, y) coordinates of the object, where the ping reflected.
+        self.distances = np.hypot(self.offsets[..., 0], self.offsets[..., 1])
 
-    # TODO: Check boundaries
-    ping_reflected_at_xy = (0, 0)
-    for x2, y2 in bresenham(xr, yr, x_max, y_max):
-        if world[y2, x2] > threshold:
-            ping_reflected_at_xy = (x2, y2)
-            break
+    def get_angle_bins(self, angles):
+        """Returns the bins of the given angles (rad)."""
+        bins = np.rint(np.asarray(angles) * self.angle_bins / (2 * np.pi))
+        return bins.astype(np.intp) % self.angle_bins
 
-    if ping_reflected_at_xy == (0, 0):
-        return -1
-    else:
-        x2, y2 = ping_reflected_at_xy
-        return np.sqrt((xr - x2)**2 + (yr - y2)**2)
+    def cast(self, world, pose, directions, threshold=0.5):
+        """Casts one beam per direction.
+
+        Args:
+            world:      Gridmap representing the world.
+            pose:       Current robots pose (x, y, theta) in cells.
+            directions: Directions of the sensors, relative to the robot.
+            threshold:  Cells with a higher value reflect the beam.
+
+        Returns:
+            An array with the distance to the nearest obstacle for each
+            direction, or -1 if there was none within z_max.
+
+        """
+        poses = tuple(np.atleast_1d(value) for value in pose)
+        return self.cast_batch(world, poses, directions, threshold)[0]
+
+    def cast_batch(self, world, poses, directions, threshold=0.5):
+        """Casts one beam per direction for each of many robots.
+
+        Args:
+            world:      Gridmap representing the world, an array or a TiledGrid.
+            poses:      Tuple of arrays (x, y, theta) with the robots poses in cells.
+            directions: Directions of the sensors, relative to the robots.
+            threshold:  Cells with a higher value reflect the beam.
+
+        Returns:
+            An array of shape (robots, directions) with the distance to the
+            nearest obstacle, or -1 if there was none within z_max.
+
+        """
+        xr, yr, theta = (np.asarray(value) for value in poses)
+        bins = self.get_angle_bins(
+            theta[:, np.newaxis] + np.asarray(directions)[np.newaxis, :])
+
+        xs = self.offsets[bins, :, 0] + \
+            xr.astype(np.intp)[:, np.newaxis, np.newaxis]
+        ys = self.offsets[bins, :, 1] + \
+            yr.astype(np.intp)[:, np.newaxis, np.newaxis]
+
+        if hasattr(world, 'tiles'):
+            # A TiledGrid is unbounded, cells of missing tiles hold the fill value.
+            inside = self.in_ray[bins]
+        else:
+            # Beams leaving the map can not hit anything.
+            height, width = world.shape[:2]
+            inside = self.in_ray[bins] & (xs >= 0) & (xs < width) & \
+                (ys >= 0) & (ys < height)
+
+        hits = np.zeros(inside.shape, dtype=bool)
+        hits[inside] = world[ys[inside], xs[inside]] > threshold
+
+        first_hit = hits.argmax(axis=-1)
+        has_hit = np.take_along_axis(
+            hits, first_hit[..., np.newaxis], axis=-1)[..., 0]
+
+        return np.where(has_hit, self.distances[bins, first_hit], -1)
+
+
+def get_ray_caster(z_max) -> RayCaster:
+    """Returns the (cached) ray caster for the given range."""
+    if z_max not in ray_casters:
+        ray_casters[z_max] = RayCaster(z_max)
+
+    return ray_casters[z_max]
 
 
 def send_data_to_observatory(data: dict):
@@ -141,18 +251,23 @@ class Sensors:
             self.out_queue.put(values)
 
     def write_observatory_camera_feed(self):
+        """Shares the annotated camera frame with the observatory."""
         from pylon_detection import PylonDetector
-        import json
-        import base64
+        import cv2
+        global camera_feed, camera_feed_index
 
-        frame = picam_sim.current_frame
-        if (frame is None):
-            return None
+        result = pylon_pipeline.get_latest_result()
+        if result is None or result[0] == camera_feed_index:
+            return None  # No new frame has been processed.
 
-        pylons_found = PylonDetector.find_pylons(frame)
+        camera_feed_index, frame, pylons_found = result
         image_out = PylonDetector.mark_pylons(frame, pylons_found)
-        PylonDetector.write_image(
-            image_out, "stellar/observatory/debug-ui/current-frame.jpg")
+        image_out = cv2.cvtColor(image_out, cv2.COLOR_HSV2BGR)
+
+        if camera_feed is None:
+            camera_feed = SharedFrameBuffer.create(
+                CAMERA_FEED_NAME, image_out.shape)
+        camera_feed.write(image_out)
 
     import datetime
     time_created = datetime.datetime.now()  # temp
@@ -190,17 +305,21 @@ class Sensors:
 
 
 if __name__ == '__main__':
-    from picam_simulator import PicamSimulator
-    from threading import Thread
+    from picam_simulator import DetectionPipeline, PicamSimulator
+    from pylon_detection import PylonTracker
     import time
 
     sensors = Sensors(None, None)  # temporary
     picam_sim = PicamSimulator("stellar/perception/cv_video_final.mp4")
-    Thread(target=picam_sim.run).start()
+    pylon_pipeline = DetectionPipeline(
+        picam_sim, PylonTracker().find_pylons, realtime=True).start()
 
-    while picam_sim.is_running:
-        try:
+    try:
+        while any(thread.is_alive() for thread in pylon_pipeline.threads):
             send_data_to_observatory(sensors.get_mock_data())
-        except:
-            picam_sim.stop()
-            raise
+    except:
+        pylon_pipeline.stop()
+        raise
+    finally:
+        if camera_feed is not None:
+            camera_feed.close()
@@ -0,0 +1,248 @@
+"""
+Append-only recordings of learning mode runs.
+
+A run file starts with a header, followed by chunks of a fixed size. Each
+chunk holds a snapshot of the occupancy grid map, followed by the records
+(map pose and sonar readings) of the next `snapshot_interval` ticks:
+
+    MAGIC | header length | JSON header | padding
+    snapshot 0 | tick 0 | tick 1 | ... | tick n - 1
+    snapshot 1 | tick n | ...
+
+Snapshot k holds the map after k * snapshot_interval ticks. As all sizes
+are known from the header, any snapshot or tick is opened with `np.memmap`
+at a computed offset, without reading the rest of the run. The map of any
+other step is rebuilt by replaying at most `snapshot_interval` ticks on top
+of the previous snapshot.
+"""
+import json
+import os
+import struct
+
+import numpy as np
+
+from stellar.cognition import mapping
+from stellar.models.gridmap import LogOddsGrid
+
+MAGIC = b'STELLRUN'
+VERSION = 1
+# Take a snapshot of the map every n ticks.
+SNAPSHOT_INTERVAL = 100
+# The first snapshot starts at a multiple of it.
+HEADER_ALIGNMENT = 64
+
+
+def get_record_dtype(sonars: int) -> np.dtype:
+    """Record of one tick: the map pose (cells) and the distance measured by each sonar."""
+    return np.dtype([('x', '<i4'), ('y', '<i4'), ('theta', '<f8'),
+                     ('distances', '<f8', (sonars,))])
+
+
+def is_run_file(path: str) -> bool:
+    with open(path, 'rb') as fd:
+        return fd.read(len(MAGIC)) == MAGIC
+
+
+def load_map(path: str):
+    """Loads the final map of a run file, or an occupancy grid map saved with `np.save`."""
+    if is_run_file(path):
+        return RunReader(path).get_map()
+    return np.load(path)
+
+
+class RunLayout:
+    """Offsets of the snapshots and tick records of a run file, given its header."""
+
+    def __init__(self, header: dict, data_offset: int):
+        self.header = header
+        self.data_offset = data_offset
+        self.shape = tuple(header['shape'])
+        self.dtype = np.dtype(header['dtype'])
+        self.snapshot_interval = header['snapshot_interval']
+        self.record_dtype = get_record_dtype(len(header['sonar_angles']))
+
+        self.snapshot_size = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.chunk_size = self.snapshot_size + self.snapshot_interval * self.record_dtype.itemsize
+
+    def get_snapshot_offset(self, index: int) -> int:
+        return self.data_offset + index * self.chunk_size
+
+    def get_tick_offset(self, step: int) -> int:
+        chunk, index = divmod(step, self.snapshot_interval)
+        return self.get_snapshot_offset(chunk) + self.snapshot_size + index * self.record_dtype.itemsize
+
+
+class RunWriter:
+    """
+    Records a learning mode run to a run file.
+
+    Call `write_tick` every tick, before the readings are applied to the map.
+    """
+
+    def __init__(self, path: str, gridmap, sensors, snapshot_interval: int = SNAPSHOT_INTERVAL):
+        """
+        Args:
+            path: Path of the run file, it is overwritten.
+            gridmap: Occupancy grid map of the run, an array or a `LogOddsGrid`.
+            sensors: SensorArray of the robot.
+            snapshot_interval: Take a snapshot of the map every n ticks.
+
+        """
+        data = gridmap.data if isinstance(gridmap, LogOddsGrid) else np.asarray(gridmap)
+        header = {
+            'version': VERSION,
+            'shape': list(data.shape),
+            'dtype': data.dtype.str,
+            'scale': gridmap.scale if isinstance(gridmap, LogOddsGrid) else 1,
+            'limits': [mapping.LOG_ODD_MIN, mapping.LOG_ODD_MAX],
+            'snapshot_interval': snapshot_interval,
+            'sonar_angles': [float(angle) for _, angle in sensors.sonar_sensors],
+            'sonar_opening_angle': float(sensors.sonar_opening_angle),
+            'z_max': sensors.z_max
+        }
+        encoded = json.dumps(header).encode('utf-8')
+        prefix = MAGIC + struct.pack('<I', len(encoded)) + encoded
+        padding = -len(prefix) % HEADER_ALIGNMENT
+
+        self.layout = RunLayout(header, len(prefix) + padding)
+        self.ticks = 0
+        self.fd = open(path, 'wb')
+        self.fd.write(prefix + bytes(padding))
+
+    def write_tick(self, map_pose, distances, gridmap):
+        """
+        Appends the record of a tick, preceded by a snapshot of the map
+        every `snapshot_interval` ticks.
+
+        Args:
+            map_pose: Robots pose (x, y, theta) in the map.
+            distances: Distance measured by each sonar, in the order of
+                       `SensorArray.sonar_sensors`.
+            gridmap: The map, without the readings of this tick.
+
+        """
+        if self.ticks % self.layout.snapshot_interval == 0:
+            data = gridmap.data if isinstance(gridmap, LogOddsGrid) else gridmap
+            self.fd.write(np.ascontiguousarray(data, dtype=self.layout.dtype).tobytes())
+
+        record = np.zeros((), dtype=self.layout.record_dtype)
+        record['x'], record['y'], record['theta'] = map_pose
+        record['distances'] = distances
+        self.fd.write(record.tobytes())
+        self.ticks += 1
+
+    def flush(self):
+        self.fd.flush()
+
+    def close(self):
+        self.fd.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RunReader:
+    """
+    Reads a run file, which may still be written to.
+
+    Only complete snapshots and ticks are read, see `snapshots` and `ticks`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as fd:
+            if fd.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a run file: {path}")
+            length, = struct.unpack('<I', fd.read(4))
+            header = json.loads(fd.read(length).decode('utf-8'))
+
+        if header['version'] != VERSION:
+            raise ValueError(f"Unsupported run file version: {header['version']}")
+
+        prefix = len(MAGIC) + 4 + length
+        self.layout = RunLayout(header, prefix + -prefix % HEADER_ALIGNMENT)
+        self.header = header
+        self.refresh()
+
+    def refresh(self):
+        """Updates the number of snapshots and ticks, e.g. while the run is still recorded."""
+        layout = self.layout
+        size = max(os.path.getsize(self.path) - layout.data_offset, 0)
+        chunks, rest = divmod(size, layout.chunk_size)
+
+        self.snapshots = chunks
+        self.ticks = chunks * layout.snapshot_interval
+        if rest >= layout.snapshot_size:
+            self.snapshots += 1
+            self.ticks += (rest - layout.snapshot_size) // layout.record_dtype.itemsize
+
+    def get_snapshot(self, index: int) -> np.memmap:
+        """Memory maps snapshot index read-only, in stored units (log odds * header['scale'])."""
+        if not 0 <= index < self.snapshots:
+            raise IndexError(f"Snapshot {index} out of range, the run has {self.snapshots}")
+        return np.memmap(self.path, dtype=self.layout.dtype, mode='r', shape=self.layout.shape,
+                         offset=self.layout.get_snapshot_offset(index))
+
+    def get_ticks(self, start: int = 0, stop: int = None) -> np.ndarray:
+        """Returns the records of the ticks start to stop, see `get_record_dtype`."""
+        stop = self.ticks if stop is None else min(stop, self.ticks)
+        interval = self.layout.snapshot_interval
+        records = []
+        while start < stop:
+            # Records are contiguous within a chunk only.
+            end = min(stop, (start // interval + 1) * interval)
+            records.append(np.memmap(self.path, dtype=self.layout.record_dtype, mode='r',
+                                     shape=(end - start,), offset=self.layout.get_tick_offset(start)))
+            start = end
+
+        if len(records) == 1:
+            return records[0]
+        return np.concatenate(records) if records else np.zeros(0, dtype=self.layout.record_dtype)
+
+    def create_map(self, snapshot: int = None):
+        """Creates a map like the one of the run, initialized with the given snapshot."""
+        header = self.header
+        if self.layout.dtype in (np.int8, np.float16):
+            gridmap = LogOddsGrid(self.layout.shape, header['limits'], self.layout.dtype, header['scale'])
+            data = gridmap.data
+        else:
+            gridmap = data = np.zeros(self.layout.shape, dtype=self.layout.dtype)
+
+        if snapshot is not None:
+            data[...] = self.get_snapshot(snapshot)
+        return gridmap
+
+    def replay(self, gridmap, start: int = 0, stop: int = None):
+        """Applies the sonar readings of the ticks start to stop to gridmap in place."""
+        header = self.header
+        for tick in self.get_ticks(start, stop):
+            map_pose = (int(tick['x']), int(tick['y']), float(tick['theta']))
+            for angle, distance in zip(header['sonar_angles'], tick['distances'].tolist()):
+                mapping.update_occupancy_map(
+                    gridmap, map_pose, distance, angle,
+                    header['sonar_opening_angle'], header['z_max'], out=gridmap)
+
+        return gridmap
+
+    def get_map(self, step: int = None):
+        """
+        Rebuilds the map after the given number of ticks (default: all) from
+        the previous snapshot and the readings of the ticks since.
+
+        Returns:
+            The map as array of log odds.
+        """
+        step = self.ticks if step is None else step
+        if not 0 <= step <= self.ticks:
+            raise IndexError(f"Step {step} out of range, the run has {self.ticks} ticks")
+
+        snapshot = min(step // self.layout.snapshot_interval, self.snapshots - 1)
+        if snapshot < 0:
+            return np.asarray(self.create_map())
+
+        gridmap = self.create_map(snapshot)
+        self.replay(gridmap, snapshot * self.layout.snapshot_interval, step)
+        return np.asarray(gridmap)
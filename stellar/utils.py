@@ -1,7 +1,17 @@
+import hashlib
 import math
+import os
+
 import png
 import numpy
 import matplotlib.pyplot as plt
+from skimage.transform import resize
+
+# Where decoded occupancy data is cached between runs. Entries are never
+# pruned, so the disk cache is only used if a directory is configured.
+CACHE_DIRECTORY = os.environ.get('STELLAR_CACHE_DIR')
+
+ogm_cache: dict = {}
 
 
 def dist2d(point1, point2):
@@ -23,35 +33,96 @@ def dist2d(point1, point2):
 def png_to_ogm(filename, normalized=False, origin='lower'):
     """
     Convert a png image to occupancy data.
+
+    Rows are decoded straight into a preallocated array, only the first
+    channel of each pixel is kept.
+
     :param filename: the image filename
     :param normalized: whether the data should be normalised, i.e. to be in value range [0, 1]
     :param origin:
-    :return:
+    :return: 2D float32 array
     """
     r = png.Reader(filename)
-    img = r.read()
-    img_data = list(img[2])
+    width, height, rows, info = r.read()
+    planes = info['planes']
+    bitdepth = info['bitdepth']
+
+    dtype = numpy.uint16 if bitdepth > 8 else numpy.uint8
+    img_data = numpy.empty((height, width * planes), dtype=dtype)
+    for i, row in enumerate(rows):
+        img_data[i] = numpy.frombuffer(row, dtype=dtype)
 
-    out_img = []
-    bitdepth = img[3]['bitdepth']
+    out_img = img_data[:, ::planes]
 
-    for i in range(len(img_data)):
+    if origin == 'lower':
+        out_img = out_img[::-1]
 
-        out_img_row = []
+    if normalized:
+        return numpy.multiply(out_img, 1.0 / (2**bitdepth), dtype=numpy.float32)
 
-        for j in range(len(img_data[0])):
-            if j % img[3]['planes'] == 0:
-                if normalized:
-                    out_img_row.append(img_data[i][j]*1.0/(2**bitdepth))
-                else:
-                    out_img_row.append(img_data[i][j])
+    return out_img.astype(numpy.float32)
 
-        out_img.append(out_img_row)
 
-    if origin == 'lower':
-        out_img.reverse()
+def load_ogm(filename, shape=None, normalized=True, origin='lower'):
+    """
+    Load occupancy data from a png image, optionally scaled to shape.
+
+    Results are cached in memory and, if STELLAR_CACHE_DIR is set, on disk
+    (see CACHE_DIRECTORY), keyed by path, modification time and target
+    shape. Repeated loads of an unchanged image therefore skip decoding
+    and resizing.
+
+    :param filename: the image filename
+    :param shape: (rows, columns) to scale the data to, None to keep the image size
+    :param normalized: whether the data should be normalised, i.e. to be in value range [0, 1]
+    :param origin:
+    :return: 2D float32 array
+    """
+    path = os.path.abspath(filename)
+    shape = tuple(int(n) for n in shape) if shape is not None else None
+    key = (path, os.stat(path).st_mtime_ns, shape, normalized, origin)
+
+    if key not in ogm_cache:
+        ogm = _load_ogm_from_disk_cache(key)
+        if ogm is None:
+            ogm = _decode_ogm(key)
+        ogm_cache[key] = ogm
+
+    return ogm_cache[key].copy()
+
+
+def _decode_ogm(key):
+    path, _, shape, normalized, origin = key
+    ogm = png_to_ogm(path, normalized=normalized, origin=origin)
+
+    if shape is not None and ogm.shape != shape:
+        ogm = resize(ogm, shape).astype(numpy.float32)
+
+    if CACHE_DIRECTORY is None:
+        return ogm
+
+    try:
+        os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+        numpy.save(_get_disk_cache_path(key), ogm)
+    except OSError:
+        pass  # Caching is an optimization only.
+
+    return ogm
+
+
+def _load_ogm_from_disk_cache(key):
+    if CACHE_DIRECTORY is None:
+        return None
+
+    try:
+        return numpy.load(_get_disk_cache_path(key))
+    except (OSError, ValueError):
+        return None
+
 
-    return out_img
+def _get_disk_cache_path(key):
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIRECTORY, f'ogm_{digest}.npy')
 
 
 def plot_path(path):
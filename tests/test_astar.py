@@ -0,0 +1,129 @@
+"""
+Tests for the grid based A* planner.
+"""
+import heapq
+import math
+
+import numpy as np
+import pytest
+
+from stellar.models.astar import AStarPlanner
+from stellar.models.gridmap import TiledGrid
+
+
+@pytest.fixture(scope='module')
+def obstacles():
+    """Arena with an outer wall and two inner walls."""
+    ox, oy = [], []
+    for i in range(-10, 60):
+        ox.append(i)
+        oy.append(-10.0)
+    for i in range(-10, 60):
+        ox.append(60.0)
+        oy.append(i)
+    for i in range(-10, 61):
+        ox.append(i)
+        oy.append(60.0)
+    for i in range(-10, 61):
+        ox.append(-10.0)
+        oy.append(i)
+    for i in range(-10, 40):
+        ox.append(20.0)
+        oy.append(i)
+    for i in range(0, 40):
+        ox.append(40.0)
+        oy.append(60.0 - i)
+    return ox, oy
+
+
+def test_obstacle_map_matches_brute_force(obstacles):
+    """
+    Ensure a cell is blocked iff any obstacle is within the robot radius.
+    """
+    ox, oy = obstacles
+    planner = AStarPlanner(ox, oy, 2.0, 1.5)
+
+    assert planner.obmap.shape == (planner.xwidth, planner.ywidth)
+    for ix in range(planner.xwidth):
+        x = planner.calc_grid_position(ix, planner.minx)
+        for iy in range(planner.ywidth):
+            y = planner.calc_grid_position(iy, planner.miny)
+            expected = any(math.hypot(iox - x, ioy - y) <= planner.rr
+                           for iox, ioy in zip(ox, oy))
+            assert planner.obmap[ix, iy] == expected
+
+
+def test_planning_finds_shortest_path_around_walls(obstacles):
+    ox, oy = obstacles
+    planner = AStarPlanner(ox, oy, 1.0, 1.0)
+
+    rx, ry = planner.planning(10, 10, 50, 50)
+
+    assert (rx[0], ry[0]) == (50, 50)
+    assert (rx[-1], ry[-1]) == (10, 10)
+    length = sum(math.hypot(x2 - x1, y2 - y1)
+                 for x1, y1, x2, y2 in zip(rx, ry, rx[1:], ry[1:]))
+    assert length == pytest.approx(100.5685, abs=1e-3)
+    for x, y in zip(rx, ry):
+        assert not planner.obmap[planner.calc_xyindex(x, planner.minx),
+                                 planner.calc_xyindex(y, planner.miny)]
+
+
+def shortest_path_cost(planner, sx, sy, gx, gy):
+    """Reference: Dijkstra over the planner's grid, with its motion model."""
+    start = (planner.calc_xyindex(sx, planner.minx), planner.calc_xyindex(sy, planner.miny))
+    goal = (planner.calc_xyindex(gx, planner.minx), planner.calc_xyindex(gy, planner.miny))
+    costs = {start: 0.0}
+    frontier = [(0.0, start)]
+    while frontier:
+        cost, (x, y) = heapq.heappop(frontier)
+        if (x, y) == goal:
+            return cost
+        if cost > costs[(x, y)]:
+            continue
+        for dx, dy, step_cost in planner.motion:
+            node = planner.Node(x + dx, y + dy, cost + step_cost, -1)
+            if not planner.verify_node(node):
+                continue
+            if node.cost < costs.get((node.x, node.y), math.inf):
+                costs[(node.x, node.y)] = node.cost
+                heapq.heappush(frontier, (node.cost, (node.x, node.y)))
+    return None
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_heap_ordered_planning_finds_optimal_paths(seed):
+    rng = np.random.default_rng(seed)
+    ox = [float(x) for x in range(0, 41)] * 2 + [0.0] * 41 + [40.0] * 41
+    oy = [0.0] * 41 + [40.0] * 41 + [float(y) for y in range(0, 41)] * 2
+    ox += rng.uniform(5, 35, 40).tolist()
+    oy += rng.uniform(5, 35, 40).tolist()
+    planner = AStarPlanner(ox, oy, 1.0, 1.0)
+
+    rx, ry = planner.planning(3, 3, 37, 37)
+
+    expected = shortest_path_cost(planner, 3, 3, 37, 37)
+    assert expected is not None
+    length = sum(math.hypot(x2 - x1, y2 - y1)
+                 for x1, y1, x2, y2 in zip(rx, ry, rx[1:], ry[1:]))
+    assert length == pytest.approx(expected)
+    for x, y in zip(rx, ry):
+        assert not planner.obmap[planner.calc_xyindex(x, planner.minx),
+                                 planner.calc_xyindex(y, planner.miny)]
+
+
+def test_animation_is_off_by_default():
+    from stellar.models import astar
+
+    assert astar.show_animation is False
+
+
+def test_planner_from_tiled_grid_map(obstacles):
+    ox, oy = obstacles
+    grid = TiledGrid()
+    grid[np.int_(oy), np.int_(ox)] = 5
+
+    planner = AStarPlanner.from_gridmap(grid, 1.0, 1.0)
+
+    assert (planner.minx, planner.miny, planner.maxx, planner.maxy) == (-10, -10, 60, 60)
+    assert planner.planning(10, 10, 50, 50) == AStarPlanner(ox, oy, 1.0, 1.0).planning(10, 10, 50, 50)
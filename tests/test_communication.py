@@ -0,0 +1,166 @@
+"""
+Tests for the communication between stellar modules.
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'stellar'))
+# Modules import each other as top-level `communication` package.
+from communication import common, sender  # noqa: E402
+from communication import listener as listener_module  # noqa: E402
+from communication.listener import listen_to  # noqa: E402
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def channel(tmp_path, monkeypatch):
+    """Unix sockets are created relative to the working directory."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('tmp/stellar')
+    yield 'testing'
+    sender.close_connection('testing')
+
+
+@pytest.fixture
+def received(channel):
+    messages = []
+    listener = listen_to(channel, messages.append)
+    yield messages
+    listener.stop()
+
+
+def test_frames_roundtrip():
+    a, b = __import__('socket').socketpair()
+    with a, b:
+        common.send_frame(a, b'hello')
+        common.send_frame(a, b'')
+        assert common.receive_frame(b) == b'hello'
+        assert common.receive_frame(b) == b''
+        a.close()
+        assert common.receive_frame(b) is None
+
+
+def test_receive_frame_rejects_frames_larger_than_max_size(capsys):
+    a, b = __import__('socket').socketpair()
+    with a, b:
+        common.send_frame(a, b'12345')
+        assert common.receive_frame(b, max_size=4) is None
+        assert "Rejected frame of 5 bytes" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("codec", list(common.CODECS))
+def test_messages_are_sent_over_one_connection(channel, received, codec):
+    messages = [{'step': i, 'sensors': [0.5, -1]} for i in range(50)]
+
+    for message in messages:
+        assert sender.send_message(channel, message, codec)
+
+    assert wait_for(lambda: len(received) == len(messages))
+    assert received == messages
+    assert len(sender.connections) == 1
+
+
+def test_reconnects_after_listener_restarted(channel):
+    received = []
+    listener = listen_to(channel, received.append)
+    assert sender.send_message(channel, {'a': 1})
+    assert wait_for(lambda: received == [{'a': 1}])
+    listener.stop()
+
+    listener = listen_to(channel, received.append)
+    try:
+        # The first send may still succeed into the stale socket's buffer.
+        assert wait_for(lambda: sender.send_message(channel, {'b': 2})
+                        and {'b': 2} in received)
+    finally:
+        listener.stop()
+
+
+def test_send_message_returns_false_if_nobody_listens(channel):
+    assert not sender.send_message(channel, {'a': 1})
+
+
+def test_legacy_one_message_per_connection(channel, received):
+    legacy_socket, address = common.get_socket_and_address(channel)
+    with legacy_socket:
+        legacy_socket.connect(address)
+        legacy_socket.sendall(b'{"legacy": true}')
+
+    assert wait_for(lambda: received == [{'legacy': True}])
+
+
+def test_falls_back_to_json_if_codec_is_rejected(channel, monkeypatch, capsys):
+    # The listener doesn't know the codec the sender announces.
+    monkeypatch.setattr(listener_module, 'CODECS', dict(common.CODECS))
+    monkeypatch.setitem(common.CODECS, b'x', common.CODECS[b'j'])
+
+    received = []
+    listener = listen_to(channel, received.append)
+    try:
+        assert sender.send_message(channel, {'a': 1}, b'x')
+        assert sender.send_message(channel, {'b': 2}, b'x')
+
+        assert wait_for(lambda: received == [{'a': 1}, {'b': 2}])
+        assert sender.connections[channel][1] == b'j'
+        assert "unknown codec b'x'" in capsys.readouterr().err
+    finally:
+        listener.stop()
+
+
+def test_listener_closes_connection_on_oversized_frame(channel, received):
+    connection, address = common.get_socket_and_address(channel)
+    with connection:
+        connection.connect(address)
+        connection.sendall(b'j')
+        assert connection.recv(1) == common.CODEC_ACCEPTED
+
+        connection.sendall(common.FRAME_HEADER.pack(common.MAX_FRAME_SIZE + 1))
+        connection.settimeout(2.0)
+        assert connection.recv(1) == b''
+
+    assert received == []
+
+
+def test_handler_is_called_for_one_message_at_a_time(channel):
+    active = []
+    overlaps = []
+
+    def handler(message):
+        active.append(message)
+        overlaps.append(len(active))
+        time.sleep(0.02)
+        active.remove(message)
+
+    listener = listen_to(channel, handler)
+    try:
+        def send(i):
+            connection, address = common.get_socket_and_address(channel)
+            with connection:
+                connection.connect(address)
+                connection.sendall(b'j')
+                connection.recv(1)
+                for j in range(5):
+                    common.send_frame(connection, b'[%d, %d]' % (i, j))
+                time.sleep(0.5)
+
+        senders = [threading.Thread(target=send, args=(i,)) for i in range(4)]
+        for thread in senders:
+            thread.start()
+        for thread in senders:
+            thread.join()
+
+        assert wait_for(lambda: len(overlaps) == 20)
+        assert max(overlaps) == 1
+    finally:
+        listener.stop()
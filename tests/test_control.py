@@ -0,0 +1,50 @@
+"""
+Tests for the PID gain tuning.
+"""
+import numpy as np
+import pytest
+
+from stellar.cognition import control
+
+
+def quadratic_error(gains):
+    return (gains[0] - 2) ** 2 + (gains[1] + 1) ** 2 + gains[2] ** 2
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(control, 'twiddle_cache', {})
+
+
+def test_twiddle_finds_minimum():
+    p, err = control.twiddle(quadratic_error, tol=0.001, processes=2)
+
+    assert p == pytest.approx([2, -1, 0], abs=0.05)
+    assert err == pytest.approx(0, abs=0.01)
+
+
+def test_twiddle_caches_evaluated_gains():
+    control.twiddle(quadratic_error, tol=0.5, processes=2)
+    cached = len(control.twiddle_cache)
+
+    control.twiddle(quadratic_error, tol=0.5, processes=2)
+
+    assert cached > 0
+    assert len(control.twiddle_cache) == cached
+
+
+def test_twiddle_cache_evicts_oldest_errors(monkeypatch):
+    monkeypatch.setattr(control, 'TWIDDLE_CACHE_SIZE', 5)
+
+    control.twiddle(quadratic_error, tol=0.5, processes=2)
+
+    assert len(control.twiddle_cache) == 5
+
+
+def test_tracking_evaluator_is_deterministic():
+    reference = [(25, 25 + i) for i in range(100)]
+    evaluate = control.TrackingEvaluator(reference, (25, 25, np.radians(90)), n=50)
+
+    assert evaluate([0.1, 1.0, 0.0]) == evaluate([0.1, 1.0, 0.0])
+    assert evaluate.key == control.TrackingEvaluator(
+        list(reference), (25, 25, np.radians(90)), n=50).key
@@ -0,0 +1,134 @@
+"""
+Tests for the compact log odds occupancy grid.
+"""
+import numpy as np
+import pytest
+
+from stellar.models.gridmap import LogOddsGrid, TiledGrid
+
+
+@pytest.mark.parametrize("dtype, nbytes", [(np.int8, 200 * 200), (np.float16, 2 * 200 * 200)])
+def test_grid_is_compact(dtype, nbytes):
+    grid = LogOddsGrid((200, 200), (-2.5, 5), dtype)
+
+    assert grid.nbytes == nbytes
+    assert grid.shape == (200, 200)
+
+
+def test_updates_saturate_in_window_only():
+    grid = LogOddsGrid((10, 10), (-2.5, 5))
+
+    for _ in range(10):
+        grid.add((slice(2, 4), slice(2, 4)), 1)
+        grid.add((slice(6, 8), slice(6, 8)), -0.4)
+
+    log_odds = grid.log_odds()
+    assert np.all(log_odds[2:4, 2:4] == 5)
+    assert np.all(log_odds[6:8, 6:8] == -2.5)
+    log_odds[2:4, 2:4] = log_odds[6:8, 6:8] = 0
+    assert not log_odds.any()
+
+
+def test_int8_increments_are_exact():
+    grid = LogOddsGrid((1, 3), (-2.5, 5))
+
+    grid.add(..., [[1, -0.4, 0.4]])
+    grid.add(..., [[1, -0.4, 0.4]])
+
+    np.testing.assert_array_equal(grid.log_odds(), np.float32([[2, -0.8, 0.8]]))
+
+
+def test_views():
+    grid = LogOddsGrid((4, 4), (-2.5, 5), np.float16)
+    grid.add((slice(0, 2), slice(0, 4)), 2.0)
+
+    np.testing.assert_allclose(grid.probability()[0], 1 / (1 + np.exp(-2.0)), rtol=1e-6)
+    np.testing.assert_allclose(grid.probability()[3], 0.5)
+    np.testing.assert_array_equal(grid.occupied(1.0)[:, 0], [True, True, False, False])
+    np.testing.assert_array_equal(grid[1:3, 0], np.float32([2, 0]))
+    np.testing.assert_array_equal(np.asarray(grid), grid.log_odds())
+
+
+def test_limits_must_fit_int8():
+    with pytest.raises(ValueError):
+        LogOddsGrid((4, 4), (-10, 10))
+
+
+def test_tiled_grid_allocates_tiles_on_write():
+    grid = TiledGrid(tile_size=64)
+
+    assert grid[1000, -1000] == 0
+    assert grid.nbytes == 0 and grid.shape == (0, 0)
+
+    grid[-1, -1] = 1
+    grid[130, 5] = 2
+
+    assert set(grid.tiles) == {(-1, -1), (2, 0)}
+    assert grid.nbytes == 2 * 64 * 64 * 8
+    assert grid.bounds == (-64, 192, -64, 64)
+    assert np.asarray(grid).shape == grid.shape == (256, 128)
+    assert grid[-1, -1] == 1 and grid[130, 5] == 2
+
+
+def test_tiled_grid_slices_match_array():
+    rng = np.random.default_rng(3)
+    grid = TiledGrid(tile_size=16)
+    # Covers the cells -50..149, shifted by 50.
+    expected = np.zeros((200, 200))
+
+    for _ in range(50):
+        y, x = rng.integers(-50, 130, 2)
+        height, width = rng.integers(1, 20, 2)
+        values = rng.normal(size=(height, width))
+        grid[y:y + height, x:x + width] = values
+        expected[y + 50:y + 50 + height, x + 50:x + 50 + width] = values
+
+    np.testing.assert_array_equal(grid[-50:150, -50:150], expected)
+    np.testing.assert_array_equal(grid[-7:33, 12], expected[43:83, 62])
+    np.testing.assert_array_equal(grid[5, -20:3], expected[55, 30:53])
+    assert grid[10, 10] == expected[60, 60]
+
+
+def test_tiled_grid_broadcasts_like_numpy():
+    grid = TiledGrid(tile_size=4)
+
+    grid[2:7, 3] = np.arange(5)
+    grid[0, 0:10] = 1
+    grid[-3:-1, -3:-1] = 2
+
+    np.testing.assert_array_equal(grid[2:7, 3], [0, 1, 2, 3, 4])
+    np.testing.assert_array_equal(grid[0, -1:11], [0] + [1] * 10 + [0])
+    np.testing.assert_array_equal(grid[-3:0, -3:0], [[2, 2, 0], [2, 2, 0], [0, 0, 0]])
+
+
+def test_tiled_grid_integer_array_indexing():
+    grid = TiledGrid(tile_size=8)
+    ys = np.array([[-20, 0], [7, 8]])
+    xs = np.array([[3, -1], [100, 8]])
+
+    grid[ys, xs] = [[1, 2], [3, 4]]
+
+    np.testing.assert_array_equal(grid[ys, xs], [[1, 2], [3, 4]])
+    np.testing.assert_array_equal(grid[[8, 9, -20], 8], [4, 0, 0])
+    assert len(grid.tiles) == 4
+
+
+def test_tiled_grid_from_array_is_sparse():
+    array = np.zeros((200, 100))
+    array[150, 20] = 5
+
+    grid = TiledGrid.from_array(array)
+
+    assert list(grid.tiles) == [(2, 0)]
+    np.testing.assert_array_equal(grid[0:200, 0:100], array)
+    ys, xs = grid.get_occupied_cells()
+    assert ys.tolist() == [150] and xs.tolist() == [20]
+
+
+def test_tiled_grid_rejects_unsupported_indices():
+    grid = TiledGrid()
+
+    with pytest.raises(IndexError):
+        grid[0:10:2, 0]
+    with pytest.raises(IndexError):
+        grid[0]
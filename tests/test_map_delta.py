@@ -0,0 +1,70 @@
+"""
+Tests for publishing occupancy grid maps incrementally.
+"""
+import numpy as np
+
+from stellar.cognition import mapping
+from stellar.communication.map_delta import MapDeltaDecoder, MapDeltaEncoder, quantize
+
+
+def drive(encoder, decoder, gridmap, poses, lost=()):
+    """Updates gridmap at poses, publishing the changes after every step."""
+    messages = []
+    for step, pose in enumerate(poses):
+        for angle in (0.0, np.radians(90), np.radians(-90)):
+            gridmap, region = mapping.update_occupancy_map(
+                gridmap, pose, 20.0, angle, np.radians(15), 40, return_region=True)
+            encoder.mark_dirty(region)
+
+        message = encoder.encode(gridmap)
+        if message is not None and step not in lost:
+            decoder.apply(message)
+        messages.append(message)
+    return gridmap, messages
+
+
+def test_decoder_rebuilds_map():
+    encoder = MapDeltaEncoder((200, 200))
+    decoder = MapDeltaDecoder()
+    poses = [(50 + step, 100, np.radians(90)) for step in range(30)]
+
+    gridmap, _ = drive(encoder, decoder, np.zeros((200, 200)), poses)
+
+    assert decoder.is_complete
+    np.testing.assert_array_equal(decoder.quantized, quantize(gridmap))
+    np.testing.assert_allclose(decoder.get_map(), gridmap, atol=0.02)
+
+
+def test_only_changed_tiles_are_sent():
+    encoder = MapDeltaEncoder((200, 200), tile_size=16)
+    poses = [(50 + step, 100, np.radians(90)) for step in range(5)]
+
+    _, messages = drive(encoder, MapDeltaDecoder(), np.zeros((200, 200)), poses)
+
+    assert messages[0]['full'] and len(messages[0]['tiles']) == 13 * 13
+    for message in messages[1:]:
+        assert not message['full']
+        assert 0 < len(message['tiles']) < 20
+
+
+def test_unchanged_map_sends_nothing():
+    encoder = MapDeltaEncoder((64, 64))
+    gridmap = np.zeros((64, 64))
+    encoder.encode(gridmap)
+
+    encoder.mark_dirty((0, 10, 0, 10))
+
+    assert encoder.encode(gridmap) is None
+
+
+def test_lost_message_is_recovered_by_keyframe():
+    encoder = MapDeltaEncoder((200, 200), keyframe_interval=10)
+    decoder = MapDeltaDecoder()
+    poses = [(50 + 2 * step, 100, np.radians(90)) for step in range(10)]
+
+    gridmap, _ = drive(encoder, decoder, np.zeros((200, 200)), poses, lost=(3,))
+    assert not decoder.is_complete
+
+    gridmap, _ = drive(encoder, decoder, gridmap, [(80, 100, np.radians(90))])
+    assert decoder.is_complete
+    np.testing.assert_array_equal(decoder.quantized, quantize(gridmap))
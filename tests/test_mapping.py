@@ -0,0 +1,260 @@
+"""
+Tests for the mapping algorithms.
+"""
+import numpy as np
+import pytest
+
+from stellar.cognition import mapping
+from stellar.models.gridmap import TiledGrid
+
+
+def update_occupancy_map_per_cell(gridmap, pose, measurement, sonar_bearing_angle,
+                                  sonar_opening_angle, z_max):
+    """Reference implementation, evaluating the sensor model cell by cell."""
+    if measurement in (-1, 0):
+        measurement = z_max
+
+    B = mapping.get_occupied_cell_from_distance(
+        gridmap, pose, measurement + 5, sonar_bearing_angle - np.deg2rad(10))
+    C = mapping.get_occupied_cell_from_distance(
+        gridmap, pose, measurement + 5, sonar_bearing_angle + np.deg2rad(10))
+    max_x, min_x, max_y, min_y = mapping.fov_bounding_box(pose, B, C)
+
+    if pose[1] <= gridmap.shape[0] and pose[0] <= gridmap.shape[1]:
+        gridmap[pose[1], pose[0]] -= mapping.LOG_ODD_FREE
+    for y in range(min_y, min(max_y, gridmap.shape[0])):
+        for x in range(min_x, min(max_x, gridmap.shape[1])):
+            p = mapping.inverse_range_sensor_model(
+                (x, y), pose, sonar_bearing_angle, sonar_opening_angle,
+                z_max, measurement)
+            if p == -1:
+                gridmap[y, x] -= mapping.LOG_ODD_FREE
+            if p == 1:
+                gridmap[y, x] += mapping.LOG_ODD_OCCU
+
+    return np.clip(gridmap, a_max=mapping.LOG_ODD_MAX, a_min=mapping.LOG_ODD_MIN)
+
+
+@pytest.mark.parametrize("pose", [
+    (20, 20, 0.0),
+    (100, 60, np.radians(90)),
+    (150, 180, np.radians(200)),
+    (3, 2, np.radians(-135)),
+])
+@pytest.mark.parametrize("sonar_angle", [np.radians(0), np.radians(90), np.radians(-90)])
+@pytest.mark.parametrize("measurement", [-1, 0, 7.0, 25.5, 40])
+def test_batched_update_is_identical_to_per_cell_update(pose, sonar_angle, measurement):
+    """
+    The vectorized sensor model must produce exactly the same map as
+    evaluating the model for every single cell.
+    """
+    rng = np.random.default_rng(42)
+    gridmap = rng.uniform(mapping.LOG_ODD_MIN, mapping.LOG_ODD_MAX, (200, 200))
+    z_max = 40
+    opening_angle = np.radians(15)
+
+    expected = update_occupancy_map_per_cell(
+        gridmap.copy(), pose, measurement, sonar_angle, opening_angle, z_max)
+    actual = mapping.update_occupancy_map(
+        gridmap.copy(), pose, measurement, sonar_angle, opening_angle, z_max)
+
+    np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize("pose", [
+    (20, 20, 0.0),
+    (100, 60, np.radians(90)),
+    (195, 5, np.radians(-45)),
+    (3, 2, np.radians(-135)),
+])
+@pytest.mark.parametrize("sonar_angle", [np.radians(0), np.radians(90), np.radians(-90)])
+def test_update_reports_changed_region(pose, sonar_angle):
+    rng = np.random.default_rng(42)
+    gridmap = rng.uniform(mapping.LOG_ODD_MIN, mapping.LOG_ODD_MAX, (200, 200))
+
+    updated, (min_y, max_y, min_x, max_x) = mapping.update_occupancy_map(
+        gridmap.copy(), pose, 25.5, sonar_angle, np.radians(15), 40, return_region=True)
+
+    changed = np.argwhere(updated != gridmap)
+    assert len(changed) > 0
+    assert 0 <= min_y <= changed[:, 0].min() and changed[:, 0].max() < max_y <= 200
+    assert 0 <= min_x <= changed[:, 1].min() and changed[:, 1].max() < max_x <= 200
+
+
+@pytest.mark.parametrize("pose", [(100, 60, np.radians(90)), (3, 2, np.radians(-135))])
+@pytest.mark.parametrize("measurement", [-1, 7.0, 25.5])
+def test_in_place_update_matches_update(pose, measurement):
+    rng = np.random.default_rng(42)
+    gridmap = rng.uniform(mapping.LOG_ODD_MIN, mapping.LOG_ODD_MAX, (200, 200))
+    expected = mapping.update_occupancy_map(
+        gridmap.copy(), pose, measurement, 0.0, np.radians(15), 40)
+
+    in_place = gridmap.copy()
+    updated = mapping.update_occupancy_map(
+        in_place, pose, measurement, 0.0, np.radians(15), 40, out=in_place)
+    assert updated is in_place
+    np.testing.assert_array_equal(in_place, expected)
+
+    out = np.empty_like(gridmap)
+    original = gridmap.copy()
+    assert mapping.update_occupancy_map(
+        gridmap, pose, measurement, 0.0, np.radians(15), 40, out=out) is out
+    np.testing.assert_array_equal(out, expected)
+    np.testing.assert_array_equal(gridmap, original)
+
+
+def test_in_place_update_saturates():
+    gridmap = np.full((100, 100), float(mapping.LOG_ODD_MAX))
+
+    for _ in range(3):
+        mapping.update_occupancy_map(gridmap, (50, 50, 0.0), 20.0, 0.0,
+                                     np.radians(15), 40, out=gridmap)
+
+    assert gridmap.max() == mapping.LOG_ODD_MAX
+    assert gridmap.min() >= mapping.LOG_ODD_MIN
+
+
+def test_log_odds_grid_is_only_updated_in_place():
+    grid = mapping.create_log_odds_grid((50, 50))
+
+    assert mapping.update_occupancy_map(grid, (25, 25, 0.0), 20.0, 0.0,
+                                        np.radians(15), 40, out=grid) is grid
+    with pytest.raises(ValueError):
+        mapping.update_occupancy_map(grid, (25, 25, 0.0), 20.0, 0.0,
+                                     np.radians(15), 40, out=np.zeros((50, 50)))
+
+
+@pytest.mark.parametrize("dtype, tolerance", [(np.int8, 1e-6), (np.float16, 1e-2)])
+def test_log_odds_grid_update_matches_array_update(dtype, tolerance):
+    rng = np.random.default_rng(7)
+    gridmap = np.zeros((200, 200))
+    grid = mapping.create_log_odds_grid((200, 200), dtype)
+
+    for _ in range(100):
+        pose = (int(rng.integers(45, 155)), int(rng.integers(45, 155)), rng.uniform(-np.pi, np.pi))
+        for sonar_angle in (0.0, np.radians(90), np.radians(-90)):
+            measurement = rng.uniform(1, 40)
+            gridmap = mapping.update_occupancy_map(
+                gridmap, pose, measurement, sonar_angle, np.radians(15), 40)
+            assert mapping.update_occupancy_map(
+                grid, pose, measurement, sonar_angle, np.radians(15), 40) is grid
+
+    np.testing.assert_allclose(grid.log_odds(), gridmap, atol=tolerance)
+
+
+def test_log_odds_grid_ignores_cells_outside():
+    grid = mapping.create_log_odds_grid((50, 50))
+
+    mapping.update_occupancy_map(grid, (2, 2, np.radians(-135)), 20.0, 0.0, np.radians(15), 40)
+
+    assert grid.log_odds()[2, 2] < 0
+    assert grid.log_odds()[-10:, :].max() == 0 and grid.log_odds()[:, -10:].max() == 0
+
+
+def test_tiled_grid_update_matches_array_update():
+    rng = np.random.default_rng(11)
+    gridmap = np.zeros((200, 200))
+    grid = TiledGrid()
+
+    for _ in range(100):
+        pose = (int(rng.integers(45, 155)), int(rng.integers(45, 155)), rng.uniform(-np.pi, np.pi))
+        for sonar_angle in (0.0, np.radians(90), np.radians(-90)):
+            measurement = rng.uniform(1, 40)
+            gridmap, region = mapping.update_occupancy_map(
+                gridmap, pose, measurement, sonar_angle, np.radians(15), 40, return_region=True)
+            assert mapping.update_occupancy_map(
+                grid, pose, measurement, sonar_angle, np.radians(15), 40,
+                return_region=True) == (grid, region)
+
+    np.testing.assert_array_equal(grid[0:200, 0:200], gridmap)
+    assert grid.bounds[0] == grid.bounds[2] == 0
+
+
+def test_tiled_grid_grows_around_poses_outside():
+    grid = TiledGrid()
+
+    _, region = mapping.update_occupancy_map(grid, (-100, -100, np.radians(-135)), 20.0, 0.0,
+                                             np.radians(15), 40, return_region=True)
+
+    assert grid[-100, -100] < 0
+    assert region[0] < -100 and region[2] < -100
+    assert grid.bounds == (-128, -64, -128, -64)
+    assert grid.get_occupied_cells()[0].size > 0
+    with pytest.raises(ValueError):
+        mapping.update_occupancy_map(grid, (0, 0, 0.0), 20.0, 0.0,
+                                     np.radians(15), 40, out=np.zeros((50, 50)))
+
+
+def test_batched_sensor_model_matches_per_cell_model():
+    """
+    Ensure the batched sensor model classifies each cell like the per-cell model.
+    """
+    pose = (30, 30, np.radians(45))
+    xs = np.arange(0, 60)
+    ys = np.arange(0, 60)
+
+    cells = mapping.inverse_range_sensor_model_batch(
+        xs[np.newaxis, :], ys[:, np.newaxis], pose, 0, np.radians(15), 40, 20)
+
+    for y in ys:
+        for x in xs:
+            assert cells[y, x] == mapping.inverse_range_sensor_model(
+                (x, y), pose, 0, np.radians(15), 40, 20)
+
+
+def test_batched_maps_update_is_identical_to_single_map_updates():
+    """
+    Updating the maps of many robots at once must produce the same maps as
+    updating each map on its own.
+    """
+    rng = np.random.default_rng(3)
+    gridmaps = rng.uniform(mapping.LOG_ODD_MIN, mapping.LOG_ODD_MAX, (4, 200, 200))
+    xs = np.array([60, 100, 150, 120])
+    ys = np.array([60, 140, 100, 50])
+    thetas = np.radians([0, 90, 225, 300])
+    z_max = 40
+
+    for sonar_angle, measurements in [(0, [10.0, -1, 25.0, 0]),
+                                      (np.radians(90), [33.5, 12.0, -1, 40])]:
+        expected = [mapping.update_occupancy_map(
+            gridmap.copy(), (x, y, theta), measurement, sonar_angle,
+            np.radians(15), z_max)
+            for gridmap, x, y, theta, measurement in zip(gridmaps, xs, ys, thetas, measurements)]
+
+        mapping.update_occupancy_maps(gridmaps, (xs, ys, thetas), measurements,
+                                      sonar_angle, np.radians(15), z_max)
+
+        np.testing.assert_array_equal(gridmaps, expected)
+
+
+def test_batched_maps_update_only_updates_selected_maps():
+    gridmaps = np.zeros((3, 100, 100))
+
+    mapping.update_occupancy_maps(gridmaps, (np.array([50]), np.array([50]), np.array([0.0])),
+                                  [20.0], 0, np.radians(15), 40, indices=np.array([1]))
+
+    assert not gridmaps[0].any() and not gridmaps[2].any()
+    assert gridmaps[1].min() < 0 < gridmaps[1].max()
+
+
+def test_batched_maps_update_adds_up_poses_of_the_same_map():
+    """
+    Poses sharing a map must add up like updating the map with one pose after
+    the other, even where their cells overlap.
+    """
+    gridmaps = np.zeros((2, 100, 100))
+    xs = np.array([50, 50, 30])
+    ys = np.array([50, 50, 40])
+    thetas = np.radians([0, 0, 90])
+    measurements = [20.0, 20.0, 25.0]
+
+    expected = np.zeros((1, 100, 100))
+    for x, y, theta, measurement in zip(xs, ys, thetas, measurements):
+        mapping.update_occupancy_maps(expected, (np.array([x]), np.array([y]), np.array([theta])),
+                                      [measurement], 0, np.radians(15), 40)
+
+    mapping.update_occupancy_maps(gridmaps, (xs, ys, thetas), measurements,
+                                  0, np.radians(15), 40, indices=np.array([1, 1, 1]))
+
+    assert not gridmaps[0].any()
+    np.testing.assert_allclose(gridmaps[1], expected[0])
@@ -0,0 +1,346 @@
+"""
+Tests for the observatory server.
+"""
+import gzip
+import http.client
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'stellar'))
+from communication.shared_frame import SharedFrameBuffer  # noqa: E402
+from observatory import server  # noqa: E402
+
+
+@pytest.fixture
+def debug_ui(tmp_path, monkeypatch):
+    root = tmp_path / 'debug-ui'
+    root.mkdir()
+    (root / 'index.html').write_text('<html>' + 'stellar ' * 100 + '</html>')
+    (root / 'small.js').write_text('let x = 1;')
+    (tmp_path / 'secret.txt').write_text('secret')
+    monkeypatch.setattr(server, 'root_path', str(root))
+    monkeypatch.setattr(server, 'assets', {})
+    return root
+
+
+@pytest.fixture
+def connect(debug_ui):
+    httpd = ThreadingHTTPServer(('localhost', 0), server.RequestHandler)
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+
+    connections = []
+
+    def connect():
+        connection = http.client.HTTPConnection('localhost', httpd.server_address[1], timeout=2)
+        connections.append(connection)
+        return connection
+
+    yield connect
+    for connection in connections:
+        connection.close()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def get(connect, path, headers=None):
+    connection = connect()
+    connection.request('GET', path, headers=headers or {})
+    response = connection.getresponse()
+    return response, response.read()
+
+
+def test_file_is_sent_with_headers(connect, debug_ui):
+    response, body = get(connect, '/')
+
+    assert response.status == 200
+    assert body == (debug_ui / 'index.html').read_bytes()
+    assert response.getheader('Content-Type') == 'text/html; charset=utf-8'
+    assert response.getheader('Content-Length') == str(len(body))
+    assert response.getheader('ETag')
+
+
+def test_gzip_body_is_sent_if_accepted(connect, debug_ui):
+    response, body = get(connect, '/index.html', {'Accept-Encoding': 'gzip, deflate'})
+
+    assert response.getheader('Content-Encoding') == 'gzip'
+    assert response.getheader('Content-Length') == str(len(body))
+    assert gzip.decompress(body) == (debug_ui / 'index.html').read_bytes()
+
+
+def test_small_file_is_not_compressed(connect):
+    response, body = get(connect, '/small.js', {'Accept-Encoding': 'gzip'})
+
+    assert response.getheader('Content-Encoding') is None
+    assert body == b'let x = 1;'
+
+
+def test_unmodified_file_is_not_sent_again(connect):
+    response, _ = get(connect, '/index.html')
+
+    response, body = get(connect, '/index.html', {'If-None-Match': response.getheader('ETag')})
+
+    assert response.status == 304
+    assert body == b''
+
+
+@pytest.mark.parametrize('if_none_match, status', [
+    ('"other", {etag}', 304),
+    ('W/{etag}', 304),
+    ('*', 304),
+    ('"other"', 200),
+    ('{etag}x', 200),
+    ('"x{tag}"', 200),
+])
+def test_if_none_match_lists_are_parsed(connect, if_none_match, status):
+    etag = get(connect, '/index.html')[0].getheader('ETag')
+
+    response, _ = get(connect, '/index.html', {
+        'If-None-Match': if_none_match.format(etag=etag, tag=etag.strip('"'))})
+
+    assert response.status == status
+
+
+def test_modified_file_is_reloaded(connect, debug_ui):
+    response, _ = get(connect, '/small.js')
+    (debug_ui / 'small.js').write_text('let x = 2;')
+    os.utime(debug_ui / 'small.js', ns=(0, 10 ** 9))
+
+    changed, body = get(connect, '/small.js', {'If-None-Match': response.getheader('ETag')})
+
+    assert changed.status == 200
+    assert body == b'let x = 2;'
+
+
+@pytest.mark.parametrize('path', ['/missing.js', '/../secret.txt', '/%2e%2e/secret.txt'])
+def test_missing_file_is_not_found(connect, path):
+    response, body = get(connect, path)
+
+    assert response.status == 404
+    assert body == b'File not found'
+
+
+@pytest.fixture
+def debug_stream(monkeypatch):
+    stream = server.DebugStream()
+    monkeypatch.setattr(server, 'debug_stream', stream)
+    return stream
+
+
+def open_debug_stream(connect):
+    connection = connect()
+    connection.request('GET', '/debug-stream')
+    response = connection.getresponse()
+    assert response.getheader('Content-Type') == 'text/event-stream'
+    return response
+
+
+def read_event(response):
+    lines = []
+    while not lines or lines[-1] != b'\n':
+        lines.append(response.fp.readline())
+    return b''.join(lines)
+
+
+def test_debug_data_is_pushed_to_all_clients(connect, debug_stream, monkeypatch):
+    serialized = []
+    dumps = server.json.dumps
+    monkeypatch.setattr(server.json, 'dumps',
+                        lambda *args, **kwargs: serialized.append(args) or dumps(*args, **kwargs))
+    clients = [open_debug_stream(connect) for _ in range(3)]
+
+    server.receive_debug_data({'battery': 99})
+
+    for client in clients:
+        assert read_event(client) == b'data: {"battery": 99}\n\n'
+    assert len(serialized) == 1
+
+
+def test_debug_stream_starts_with_latest_data(connect, debug_stream):
+    server.receive_debug_data({'battery': 98})
+    server.receive_debug_data({'battery': 97})
+
+    client = open_debug_stream(connect)
+
+    assert read_event(client) == b'data: {"battery": 97}\n\n'
+    server.receive_debug_data({'battery': 96})
+    assert read_event(client) == b'data: {"battery": 96}\n\n'
+
+
+def test_idle_debug_stream_sends_keepalive(connect, debug_stream, monkeypatch):
+    monkeypatch.setattr(server, 'DEBUG_STREAM_KEEPALIVE_INTERVAL', 0.05)
+
+    client = open_debug_stream(connect)
+
+    assert read_event(client) == b': keepalive\n\n'
+
+
+def test_debug_data_is_sent_once_serialized(connect, debug_stream):
+    server.receive_debug_data({'battery': 95})
+
+    response, body = get(connect, '/debug-data')
+
+    assert body == b'{"battery": 95}'
+
+
+@pytest.fixture
+def camera_feed(monkeypatch):
+    name = f'stellar_test_camera_{os.getpid()}'
+    feed = SharedFrameBuffer.create(name, (48, 64, 3))
+    stream = server.CameraStream(name)
+    monkeypatch.setattr(server, 'camera_stream', stream)
+    monkeypatch.setattr(server, 'CAMERA_STREAM_MAX_FPS', 100)
+    yield feed
+    stream.close()
+    feed.close()
+
+
+def open_camera_stream(connect):
+    connection = connect()
+    connection.request('GET', '/camera-stream')
+    response = connection.getresponse()
+    assert response.getheader('Content-Type') == 'multipart/x-mixed-replace; boundary=frame'
+    return response
+
+
+def read_part(response):
+    assert response.fp.readline() == b'--frame\r\n'
+    headers = {}
+    for line in iter(response.fp.readline, b'\r\n'):
+        key, value = line.decode('ascii').split(':', 1)
+        headers[key] = value.strip()
+    assert headers['Content-Type'] == 'image/jpeg'
+    jpeg = response.fp.read(int(headers['Content-Length']))
+    assert response.fp.readline() == b'\r\n'
+    return cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def test_camera_frames_are_encoded_once_for_all_clients(connect, camera_feed, monkeypatch):
+    encoded = []
+    imencode = server.cv2.imencode
+    monkeypatch.setattr(server.cv2, 'imencode',
+                        lambda *args: encoded.append(args) or imencode(*args))
+    frame = np.full((48, 64, 3), 200, dtype=np.uint8)
+    camera_feed.write(frame)
+
+    clients = [open_camera_stream(connect) for _ in range(3)]
+
+    for client in clients:
+        image = read_part(client)
+        assert image.shape == frame.shape
+        assert np.abs(image.astype(int) - frame).max() <= 2
+    assert len(encoded) == 1
+
+
+def test_camera_stream_sends_new_frames(connect, camera_feed):
+    camera_feed.write(np.zeros((48, 64, 3), dtype=np.uint8))
+    client = open_camera_stream(connect)
+    assert read_part(client).max() <= 2
+
+    camera_feed.write(np.full((48, 64, 3), 255, dtype=np.uint8))
+
+    assert read_part(client).min() >= 253
+
+
+def test_camera_stream_is_rate_limited(camera_feed, monkeypatch):
+    monkeypatch.setattr(server, 'CAMERA_STREAM_MAX_FPS', 1)
+    stream = server.camera_stream
+    camera_feed.write(np.zeros((48, 64, 3), dtype=np.uint8))
+    assert stream.get_jpeg()[0] == 1
+
+    camera_feed.write(np.zeros((48, 64, 3), dtype=np.uint8))
+
+    assert stream.get_jpeg()[0] == 1
+
+
+def test_closed_camera_stream_ends(camera_feed):
+    stream = server.camera_stream
+
+    stream.close()
+
+    assert stream.wait(0) == (0, None)
+
+
+def test_camera_stream_reattaches_after_perception_restarted(monkeypatch):
+    monkeypatch.setattr(server, 'CAMERA_FEED_STALE_TIMEOUT', 0)
+    name = f'stellar_test_camera_restart_{os.getpid()}'
+    stream = server.CameraStream(name)
+    feed = SharedFrameBuffer.create(name, (48, 64, 3))
+    feed.write(np.zeros((48, 64, 3), dtype=np.uint8))
+    assert stream.read_frame().max() == 0
+
+    feed.close()
+    assert stream.read_frame() is None
+    feed = SharedFrameBuffer.create(name, (48, 64, 3))
+    feed.write(np.full((48, 64, 3), 255, dtype=np.uint8))
+    try:
+        assert stream.read_frame().min() == 255
+    finally:
+        stream.close()
+        feed.close()
+
+
+@pytest.fixture
+def map_decoder(monkeypatch):
+    decoder = server.MapDeltaDecoder()
+    monkeypatch.setattr(server, 'map_decoder', decoder)
+    monkeypatch.setattr(server, 'map_png', (0, None))
+    return decoder
+
+
+def test_map_is_rebuilt_from_deltas(connect, map_decoder):
+    from communication.map_delta import MapDeltaEncoder
+
+    assert get(connect, '/map.png')[0].status == 404
+
+    gridmap = np.zeros((40, 40))
+    encoder = MapDeltaEncoder(gridmap.shape)
+    server.receive_map_delta(encoder.encode(gridmap))
+    gridmap[0:4, 20:24] = 5
+    encoder.mark_dirty((0, 4, 20, 24))
+    server.receive_map_delta(encoder.encode(gridmap))
+
+    response, body = get(connect, '/map.png')
+    image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+
+    assert response.getheader('Content-Type') == 'image/png'
+    # Row 0 of the map is at the bottom of the image.
+    assert image[-4:, 20:24].max() < 5
+    assert image[:-4].min() == 128 and image[:, :20].min() == 128
+
+
+def test_map_is_only_sent_once_complete(connect, map_decoder):
+    from communication.map_delta import MapDeltaEncoder
+
+    gridmap = np.zeros((40, 40))
+    encoder = MapDeltaEncoder(gridmap.shape, tile_size=8)
+    encoder.encode(gridmap)  # Lost keyframe.
+    gridmap[0:4, 20:24] = 5
+    encoder.mark_dirty((0, 4, 20, 24))
+    server.receive_map_delta(encoder.encode(gridmap))
+
+    assert get(connect, '/map.png')[0].status == 404
+
+
+def test_last_complete_map_is_sent_after_lost_change(connect, map_decoder):
+    from communication.map_delta import MapDeltaEncoder
+
+    gridmap = np.zeros((40, 40))
+    encoder = MapDeltaEncoder(gridmap.shape, tile_size=8)
+    server.receive_map_delta(encoder.encode(gridmap))
+    complete = get(connect, '/map.png')[1]
+
+    for cells in (slice(0, 4), slice(8, 12)):
+        gridmap[cells, 20:24] = 5
+        encoder.mark_dirty((cells.start, cells.stop, 20, 24))
+        message = encoder.encode(gridmap)
+    server.receive_map_delta(message)
+
+    assert get(connect, '/map.png')[1] == complete
@@ -0,0 +1,82 @@
+"""
+Tests for the simulated camera and the detection pipeline.
+"""
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from stellar.perception.picam_simulator import DetectionPipeline, PicamSimulator
+
+
+@pytest.fixture(scope='module')
+def video(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('video') / 'frames.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (64, 48))
+    for i in range(30):
+        frame = np.zeros((48, 64, 3), dtype=np.uint8)
+        frame[:, :8 + i] = 255
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def test_rotate_frame_turns_frame_by_180_degrees():
+    frame = np.arange(4 * 6 * 3, dtype=np.uint8).reshape(4, 6, 3)
+
+    np.testing.assert_array_equal(
+        PicamSimulator.rotate_frame(frame), frame[::-1, ::-1])
+
+
+def test_pipeline_processes_stream_and_reports_stats(video):
+    processed = []
+
+    def detect(frame):
+        time.sleep(0.01)
+        processed.append(frame)
+        return len(processed)
+
+    pipeline = DetectionPipeline(PicamSimulator(video), detect, workers=2)
+    pipeline.start().join()
+
+    report = pipeline.stats.report()
+    frames = report['frames']
+    assert frames['decoded'] == 30
+    assert frames['detected'] == len(processed)
+    assert frames['detected'] + frames.get('dropped', 0) == 30
+    assert set(report['latency_ms']) == {'decode', 'queue', 'detect', 'total'}
+    assert report['fps'] > 0
+
+    index, frame, _ = pipeline.get_latest_result()
+    assert index == 30
+    assert frame.shape == (48, 64, 3)
+
+
+def test_slow_workers_drop_stale_frames(video):
+    pipeline = DetectionPipeline(PicamSimulator(video),
+                                 lambda frame: time.sleep(0.05), workers=1)
+    pipeline.start().join()
+
+    frames = pipeline.stats.report()['frames']
+    assert frames['dropped'] > 0
+    assert pipeline.get_latest_result()[0] == 30
+
+
+def test_sequential_detector_gets_a_single_worker(video):
+    class Tracker:
+        sequential = True
+
+        def __init__(self):
+            self.threads = set()
+
+        def detect(self, frame):
+            self.threads.add(threading.get_ident())
+
+    tracker = Tracker()
+    pipeline = DetectionPipeline(PicamSimulator(video), tracker.detect, workers=4)
+    assert len(pipeline.threads) == 2
+
+    pipeline.start().join()
+    assert len(tracker.threads) == 1
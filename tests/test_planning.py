@@ -0,0 +1,98 @@
+"""
+Tests for the path planning.
+"""
+import numpy as np
+
+from stellar.cognition import planning
+from stellar.cognition.planning import AStarPlanner
+from stellar.models.gridmap import TiledGrid
+
+
+def test_plan_returns_list_of_coordinates_from_start_to_goal():
+    gridmap = np.zeros((50, 50))
+
+    path = AStarPlanner().plan(gridmap, (5, 5), (40, 20))
+
+    assert path[0] == (5, 5)
+    assert path[-1] == (40, 20)
+    assert all(isinstance(node, tuple) for node in path)
+    # Diagonal moves cost as much as straight ones.
+    assert len(path) == 36
+
+
+def test_plan_avoids_occupied_cells():
+    gridmap = np.zeros((50, 50))
+    gridmap[0:45, 25] = 5
+
+    path = AStarPlanner().plan(gridmap, (5, 5), (45, 5))
+
+    assert path[-1] == (45, 5)
+    assert all(gridmap[y, x] <= 0 for x, y in path)
+    for (x1, y1), (x2, y2) in zip(path, path[1:]):
+        assert max(abs(x2 - x1), abs(y2 - y1)) == 1
+
+
+def test_plan_returns_none_if_goal_is_unreachable():
+    gridmap = np.zeros((50, 50))
+    gridmap[:, 25] = 5
+
+    assert AStarPlanner().plan(gridmap, (5, 5), (45, 5)) is None
+
+
+def test_plan_route_skips_unreachable_waypoints(capsys):
+    gridmap = np.zeros((50, 50))
+    gridmap[:, 25] = 5
+
+    path = AStarPlanner().plan_route(gridmap, (5, 5), [(10, 20), (45, 5), (5, 40)])
+
+    assert path[0] == (5, 5)
+    assert (10, 20) in path
+    assert path[-1] == (5, 40)
+    assert all(x < 25 for x, _ in path)
+    assert "No path from (10, 20) to (45, 5)" in capsys.readouterr().err
+
+
+def test_plan_on_tiled_grid_matches_plan_on_array():
+    gridmap = np.zeros((64, 64))
+    gridmap[0:45, 25] = 5
+    grid = TiledGrid.from_array(gridmap)
+
+    assert AStarPlanner().plan(grid, (5, 5), (45, 5)) == \
+        AStarPlanner().plan(gridmap, (5, 5), (45, 5))
+
+
+def test_plan_on_tiled_grid_handles_negative_cells():
+    grid = TiledGrid(tile_size=16)
+    grid[-40:-5, -20] = 5
+
+    path = AStarPlanner().plan(grid, (-30, -30), (-10, -30))
+
+    assert path[0] == (-30, -30)
+    assert path[-1] == (-10, -30)
+    assert all(grid[y, x] <= 0 for x, y in path)
+    assert min(y for _, y in path) < -40
+
+
+def test_plan_on_tiled_grid_grows_window_around_start_and_goal(monkeypatch):
+    grid = TiledGrid(tile_size=16)
+    grid[0:100, 50] = 5
+    grid[1000, 1000] = 5
+    windows = []
+
+    def get_planning_window(grid, *nodes, margin=None):
+        window = planning_window(grid, *nodes, margin=margin)
+        if margin is not None:
+            windows.append(window)
+        return window
+
+    planning_window = planning.get_planning_window
+    monkeypatch.setattr(planning, 'get_planning_window', get_planning_window)
+    path = AStarPlanner().plan(grid, (40, 10), (60, 10))
+
+    assert path[-1] == (60, 10)
+    assert max(y for _, y in path) >= 100
+    margin = planning.PLANNING_WINDOW_MARGIN
+    # Cut to the allocated tiles, start and goal.
+    assert windows[0] == (0, 10 + margin + 1, 40, 60 + margin + 1)
+    assert len(windows) > 1
+    assert windows[-1][1] < 1000
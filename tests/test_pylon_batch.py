@@ -0,0 +1,58 @@
+"""
+Tests for batch pylon detection.
+"""
+import threading
+
+import cv2
+import numpy as np
+
+from stellar.perception import pylon_batch, pylon_detection
+from stellar.perception.pylon_detection import PylonDetector
+
+
+def test_directory_results_match_single_detection(monkeypatch):
+    frames = pylon_batch.read_frames("tests/pylon_test_images", threads=2)
+    results = list(pylon_batch.detect_frames(frames, processes=2, segregation_mode='median'))
+
+    assert [result['frame'] for result in results] == ["0001.jpg", "0124.jpg", "0389.jpg"]
+
+    monkeypatch.setattr(pylon_detection, "COLOR_SEGREGATION_MODE", "median")
+    for result in results:
+        image = PylonDetector.load_image(f"tests/pylon_test_images/{result['frame']}")
+        assert result['pylons'] == pylon_batch.detect(image)[0]
+        assert result['decode_ms'] > 0 and result['detect_ms'] > 0
+
+
+def test_video_frames_are_numbered(tmp_path):
+    path = str(tmp_path / "video.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 48))
+    for i in range(5):
+        writer.write(np.full((48, 64, 3), i * 40, dtype=np.uint8))
+    writer.release()
+
+    results = list(pylon_batch.detect_frames(pylon_batch.read_frames(path), processes=2))
+
+    assert [result['frame'] for result in results] == [1, 2, 3, 4, 5]
+    assert all(result['pylons'] == [] for result in results)
+
+
+def test_directory_decodes_are_bounded(monkeypatch, tmp_path):
+    for i in range(20):
+        (tmp_path / f"{i:04}.jpg").touch()
+
+    lock = threading.Lock()
+    decoded = []
+
+    def load_frame(path):
+        with lock:
+            decoded.append(path)
+        return path, 0.0, None
+
+    monkeypatch.setattr(pylon_batch, "load_frame", load_frame)
+    frames = pylon_batch.read_directory(str(tmp_path), threads=2)
+
+    for consumed, (frame_id, _, _) in enumerate(frames, 1):
+        assert frame_id.endswith(f"{consumed - 1:04}.jpg")
+        # Consumed frames plus at most 2 * threads pending decodes.
+        assert len(decoded) <= consumed + 4
+    assert consumed == 20
@@ -1,9 +1,14 @@
 """
 Tests for pylon detection.
 """
+import os
+import threading
+
+import numpy as np
 import pytest
 
-from stellar.perception.pylon_detection import PylonDetector
+from stellar.perception import pylon_detection
+from stellar.perception.pylon_detection import PylonDetector, PylonTracker
 
 
 def test_not_crashing():
@@ -40,6 +45,183 @@ def test_0389_has_3_pylons():
     assert len(pylons_found) == 3
 
 
+def test_0389_has_3_pylons_with_median_segregation(monkeypatch):
+    """
+    Ensure the fast color segregation detects the same pylons.
+    """
+    monkeypatch.setattr(pylon_detection, "COLOR_SEGREGATION_MODE", "median")
+
+    test_image = PylonDetector.load_image(
+        "tests/pylon_test_images/0389.jpg")
+
+    pylons_found = PylonDetector.find_pylons(test_image)
+
+    assert len(pylons_found) == 3
+
+
+def test_unknown_segregation_mode_raises():
+    with pytest.raises(ValueError):
+        PylonDetector.segregate_colors(None, "unknown")
+
+
+def detect_pylon_colors_per_threshold(image):
+    """Reference: one (or two, for negative H) inRange pass per color."""
+    t_min, t_max = pylon_detection.PYLON_COLOR_ORANGE_THRESHOLD
+    image_orange = PylonDetector.detect_color(image, t_min, t_max)
+    t_min, t_max = pylon_detection.PYLON_COLOR_WHITE_THRESHOLD
+    image_white = PylonDetector.detect_color(image, t_min, t_max)
+    return np.clip(image_orange + image_white, 0, 255)
+
+
+@pytest.fixture
+def random_hsv_image():
+    rng = np.random.default_rng(0)
+    return np.dstack([rng.integers(0, 180, (100, 100)),
+                      rng.integers(0, 256, (100, 100)),
+                      rng.integers(0, 256, (100, 100))]).astype(np.uint8)
+
+
+def test_pylon_color_lookup_matches_thresholds(random_hsv_image):
+    np.testing.assert_array_equal(
+        PylonDetector.detect_pylon_colors(random_hsv_image),
+        detect_pylon_colors_per_threshold(random_hsv_image))
+
+
+def test_pylon_color_lookup_follows_threshold_changes(monkeypatch, random_hsv_image):
+    PylonDetector.detect_pylon_colors(random_hsv_image)
+    monkeypatch.setattr(pylon_detection, "PYLON_COLOR_ORANGE_THRESHOLD",
+                        np.array([[5, 100, 100], [30, 255, 255]]))
+
+    np.testing.assert_array_equal(
+        PylonDetector.detect_pylon_colors(random_hsv_image),
+        detect_pylon_colors_per_threshold(random_hsv_image))
+
+
+def boxes(pylons):
+    return sorted((int(p.position[0]), int(p.position[1]), int(p.width), int(p.height))
+                  for p in pylons)
+
+
+def test_merge_regions_joins_overlapping_regions():
+    regions = [(0, 0, 20, 20), (10, 10, 20, 20), (50, 50, 10, 10), (-10, 90, 30, 30)]
+
+    merged = PylonDetector.merge_regions(regions, 2.0, (50, 100))
+
+    assert sorted(merged) == [(0, 0, 15, 15), (0, 45, 10, 50), (25, 25, 30, 30)]
+
+
+@pytest.fixture
+def median_segregation(monkeypatch):
+    monkeypatch.setattr(pylon_detection, "COLOR_SEGREGATION_MODE", "median")
+    monkeypatch.setattr(pylon_detection, "DO_CREATE_DEBUG_IMAGES", False)
+
+
+def test_tracker_follows_moving_pylons(median_segregation):
+    test_image = PylonDetector.load_image("tests/pylon_test_images/0389.jpg")
+    moved_image = np.roll(test_image, (8, -8), axis=(0, 1))
+    tracker = PylonTracker()
+
+    tracker.find_pylons(test_image)
+    pylons_found = tracker.find_pylons(moved_image)
+
+    assert tracker.full_scans == 1
+    assert boxes(pylons_found) == boxes(PylonDetector.find_pylons(moved_image))
+
+
+def test_tracker_rescans_when_pylons_are_lost(median_segregation):
+    test_image = PylonDetector.load_image("tests/pylon_test_images/0389.jpg")
+    tracker = PylonTracker()
+
+    tracker.find_pylons(test_image)
+    pylons_found = tracker.find_pylons(np.zeros_like(test_image))
+
+    assert tracker.full_scans == 2
+    assert pylons_found == []
+
+
+def test_tracker_rescans_periodically(median_segregation):
+    test_image = PylonDetector.load_image("tests/pylon_test_images/0389.jpg")
+    tracker = PylonTracker(full_scan_interval=3)
+
+    for _ in range(6):
+        assert len(tracker.find_pylons(test_image)) == 3
+
+    assert tracker.full_scans == 2
+
+
+def test_debug_images_are_skipped_by_default(monkeypatch):
+    images = []
+    monkeypatch.setattr(pylon_detection, "debug_image_hook",
+                        lambda image, name: images.append(name))
+
+    PylonDetector.find_pylons(PylonDetector.load_image("tests/pylon_test_images/0389.jpg"))
+
+    assert images == []
+
+
+def test_debug_images_are_passed_to_hook(monkeypatch):
+    images = []
+    monkeypatch.setattr(pylon_detection, "DO_CREATE_DEBUG_IMAGES", True)
+    monkeypatch.setattr(pylon_detection, "COLOR_SEGREGATION_MODE", "median")
+    monkeypatch.setattr(pylon_detection, "debug_image_hook",
+                        lambda image, name: images.append(name))
+
+    PylonDetector.find_pylons(PylonDetector.load_image("tests/pylon_test_images/0389.jpg"))
+
+    run_id = pylon_detection.run_id
+    assert images == [f"{run_id}_0_original", f"{run_id}_1_resized", f"{run_id}_2_seg",
+                      f"{run_id}_3_bin", f"{run_id}_4_morphed"]
+
+
+def test_debug_image_writer_writes_in_background(tmp_path):
+    writer = pylon_detection.DebugImageWriter(str(tmp_path))
+    image = np.zeros((10, 20, 3), dtype=np.uint8)
+
+    assert writer.write(image, "first")
+    image[:] = 255
+    writer.flush()
+
+    written = PylonDetector.load_image(str(tmp_path / "first.png"))
+    assert written.shape == (10, 20, 3)
+    assert not written.any()
+
+
+def test_debug_image_writer_drops_images_when_full(tmp_path, monkeypatch):
+    writing = threading.Event()
+    monkeypatch.setattr(PylonDetector, "write_image",
+                        staticmethod(lambda image, path: writing.wait()))
+    writer = pylon_detection.DebugImageWriter(str(tmp_path), max_queued_images=2)
+    image = np.zeros((10, 20), dtype=np.uint8)
+
+    written = [writer.write(image, str(i)) for i in range(5)]
+    writing.set()
+    writer.flush()
+
+    # The writer may have taken the first image off the queue already.
+    assert written[:2] == [True, True]
+    assert writer.dropped == written.count(False) >= 2
+
+
+def test_debug_image_writer_survives_write_errors(tmp_path, monkeypatch, capsys):
+    def write_image(image, path):
+        if path.endswith("bad.png"):
+            raise OSError("No space left on device")
+        written.append(os.path.basename(path))
+
+    written = []
+    monkeypatch.setattr(PylonDetector, "write_image", staticmethod(write_image))
+    writer = pylon_detection.DebugImageWriter(str(tmp_path))
+    image = np.zeros((10, 20), dtype=np.uint8)
+
+    for name in ["bad", "good", "bad"]:
+        writer.write(image, name)
+    writer.flush()
+
+    assert written == ["good.png"]
+    assert writer.failed == 2
+    assert "No space left on device" in capsys.readouterr().err
+
+
 def test_distance_is_80():
     """
     Ensure PylonDetector detects the correct distance.
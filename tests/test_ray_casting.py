@@ -0,0 +1,107 @@
+"""
+Tests for the simulated sonar sensors.
+"""
+from math import floor
+
+import numpy as np
+import pytest
+from bresenham import bresenham
+
+from stellar.models.gridmap import TiledGrid
+from stellar.perception.sensors import SensorArray, RayCaster, sense_distance
+
+
+def sense_distance_per_cell(world, position, direction, threshold=0.5, z_max=10):
+    """Reference implementation, walking the beam cell by cell."""
+    xr, yr, theta = position
+    angle = theta + direction
+
+    x_max = floor(z_max * np.cos(angle) + xr)
+    y_max = floor(z_max * np.sin(angle) + yr)
+
+    for x2, y2 in bresenham(xr, yr, x_max, y_max):
+        if world[y2, x2] > threshold:
+            return np.sqrt((xr - x2)**2 + (yr - y2)**2)
+
+    return -1
+
+
+@pytest.fixture(scope='module')
+def world():
+    rng = np.random.default_rng(7)
+    world = np.zeros((200, 200))
+    world[rng.integers(0, 200, 400), rng.integers(0, 200, 400)] = 1
+    world[0, :] = world[-1, :] = world[:, 0] = world[:, -1] = 1
+    return world
+
+
+@pytest.mark.parametrize("theta_deg", [0, 30, 90, 135.25, 200, 271.5])
+def test_ray_caster_matches_bresenham_walk(world, theta_deg):
+    """
+    For directions that fall on a bin, the lookup tables must yield the
+    same distances as walking the beam.
+    """
+    z_max = 40
+    caster = RayCaster(z_max)
+    directions = np.radians([0, 90, -90])
+    theta = np.radians(theta_deg)
+
+    for xr, yr in [(50, 50), (100, 20), (180, 170), (42, 137)]:
+        pose = (xr, yr, theta)
+        expected = [sense_distance_per_cell(world, pose, direction, z_max=z_max)
+                    for direction in directions]
+
+        assert caster.cast(world, pose, directions).tolist() == expected
+
+
+def test_beams_leaving_the_map_do_not_wrap_around():
+    world = np.zeros((20, 20))
+    world[:, -1] = 1
+
+    assert sense_distance(world, (1, 10, np.pi), 0, z_max=10) == -1
+    assert sense_distance(world, (15, 10, 0.0), 0, z_max=10) == 4
+
+
+def test_tiled_world_matches_array_world(world):
+    caster = RayCaster(40)
+    tiled_world = TiledGrid.from_array(world, tile_size=32)
+    directions = np.radians([0, 90, -90])
+
+    for pose in [(50, 50, 0.3), (100, 20, 2.0), (180, 170, -1.0), (5, 195, np.pi / 4)]:
+        np.testing.assert_array_equal(caster.cast(tiled_world, pose, directions),
+                                      caster.cast(world, pose, directions))
+
+
+def test_tiled_world_is_unbounded():
+    world = TiledGrid()
+    world[-100, -80:-60] = 1
+
+    assert sense_distance(world, (-70, -90, -np.pi / 2), 0, z_max=20) == 10
+    assert sense_distance(world, (-70, -90, np.pi / 2), 0, z_max=20) == -1
+
+
+def test_sensor_array_senses_all_sonars(world):
+    sensors = SensorArray(z_max=40)
+    pose = (100, 100, np.radians(45))
+
+    measurements = sensors.sense(world, pose)
+
+    assert [angle for angle, _ in measurements] == \
+        [angle for _, angle in SensorArray.sonar_sensors]
+    assert [distance for _, distance in measurements] == [
+        sense_distance(world, pose, angle, z_max=40)
+        for _, angle in SensorArray.sonar_sensors]
+
+
+def test_sensor_array_senses_many_robots_at_once(world):
+    sensors = SensorArray(z_max=40)
+    xs = np.array([50, 100, 180])
+    ys = np.array([50, 20, 170])
+    thetas = np.radians([0, 45, 300])
+
+    distances = sensors.sense_batch(world, (xs, ys, thetas))
+
+    assert distances.shape == (3, 3)
+    for i, pose in enumerate(zip(xs, ys, thetas)):
+        assert distances[i].tolist() == [
+            distance for _, distance in sensors.sense(world, pose)]
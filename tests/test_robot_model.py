@@ -4,7 +4,7 @@ Test `Robot` model.
 import pytest
 import numpy as np
 from pytest import fixture
-from stellar.models.robot import Robot
+from stellar.models.robot import Robot, RobotBatch
 
 from hypothesis import given
 import hypothesis.strategies as some
@@ -95,3 +95,41 @@ def test_robot_downwards_motion(distance):
 
     if distance >= 0.0:
         assert pytest.approx(robot.y, 0.1) == -distance
+
+
+def test_robot_batch_moves_like_single_robots():
+    """
+    Ensure every robot of a batch follows the same trajectory as a single
+    robot given the same commands.
+    """
+    starts = [(0, 0, 0), (2, 2, np.pi / 2), (5, 1, np.pi)]
+    distances = [1.0, 0.5, -1.0]
+    directions = [0.3, -2.0, np.pi]
+
+    batch = RobotBatch(len(starts))
+    batch.set(*zip(*starts))
+    robots = []
+    for start in starts:
+        robots.append(Robot())
+        robots[-1].set(*start)
+
+    for _ in range(10):
+        batch.move(distances, directions)
+        for robot, distance, direction in zip(robots, distances, directions):
+            robot.move(distance, direction)
+
+    for i, robot in enumerate(robots):
+        assert (batch.x[i], batch.y[i], batch.theta[i]) == (robot.x, robot.y, robot.theta)
+        assert batch.total_distance_covered[i] == robot.total_distance_covered
+        assert batch.pose_in_grid(0.1)[0][i] == robot.pose_in_grid(0.1)[0]
+        assert str(batch[i]) == str(robot)
+
+
+def test_robot_batch_in_goal():
+    batch = RobotBatch(3)
+    batch.set([2, 1.8, 0], [2, 1.8, 0], 0)
+    batch.total_distance_covered[:] = [10, 10, 0]
+
+    assert batch.in_goal((2, 2), proximity=0.5, min_distance=5).tolist() == \
+        [True, True, False]
+    assert batch.in_goal((2, 2), proximity=0.0).tolist() == [True, False, False]
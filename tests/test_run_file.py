@@ -0,0 +1,90 @@
+"""
+Tests for the run files of learning mode runs.
+"""
+import numpy as np
+import pytest
+
+from stellar.cognition import mapping
+from stellar.perception.sensors import SensorArray
+from stellar.simulation.run_file import RunReader, RunWriter, load_map
+
+
+def record_run(path, gridmap, ticks, snapshot_interval=10, seed=5):
+    """Runs a random learning drive, returns the maps after each tick."""
+    rng = np.random.default_rng(seed)
+    world = np.zeros((100, 100))
+    world[rng.integers(0, 100, 200), rng.integers(0, 100, 200)] = 1
+    sensors = SensorArray(z_max=30)
+
+    maps = [np.array(gridmap)]
+    with RunWriter(path, gridmap, sensors, snapshot_interval) as writer:
+        for _ in range(ticks):
+            map_pose = (int(rng.integers(20, 80)), int(rng.integers(20, 80)), rng.uniform(-np.pi, np.pi))
+            measurements = sensors.sense(world, map_pose)
+            writer.write_tick(map_pose, [distance for _, distance in measurements], gridmap)
+            for angle, distance in measurements:
+                mapping.update_occupancy_map(gridmap, map_pose, distance, angle,
+                                             sensors.sonar_opening_angle, sensors.z_max, out=gridmap)
+            maps.append(np.array(gridmap))
+
+    return maps
+
+
+@pytest.mark.parametrize("gridmap", [
+    pytest.param(lambda: mapping.create_log_odds_grid((100, 100)), id='int8'),
+    pytest.param(lambda: np.zeros((100, 100)), id='float64'),
+])
+def test_replay_rebuilds_the_map_of_every_step(tmp_path, gridmap):
+    path = tmp_path / 'learning.run'
+    maps = record_run(str(path), gridmap(), 35)
+
+    reader = RunReader(str(path))
+
+    assert (reader.ticks, reader.snapshots) == (35, 4)
+    for step in (0, 1, 9, 10, 11, 29, 30, 34, 35):
+        np.testing.assert_array_equal(reader.get_map(step), maps[step])
+    np.testing.assert_array_equal(load_map(str(path)), maps[-1])
+
+
+def test_snapshots_and_ticks_are_memory_mapped(tmp_path):
+    path = tmp_path / 'learning.run'
+    gridmap = mapping.create_log_odds_grid((100, 100))
+    maps = record_run(str(path), gridmap, 25)
+
+    reader = RunReader(str(path))
+    snapshot = reader.get_snapshot(2)
+    ticks = reader.get_ticks(5, 15)
+
+    assert isinstance(snapshot, np.memmap) and snapshot.dtype == np.int8
+    np.testing.assert_array_equal(snapshot.astype(np.float32) / np.float32(reader.header['scale']), maps[20])
+    assert len(ticks) == 10 and ticks['distances'].shape == (10, 3)
+    assert reader.layout.data_offset % 64 == 0
+    with pytest.raises(IndexError):
+        reader.get_snapshot(3)
+
+
+def test_incomplete_run_is_read_up_to_the_last_complete_tick(tmp_path):
+    path = tmp_path / 'learning.run'
+    maps = record_run(str(path), mapping.create_log_odds_grid((100, 100)), 20)
+    layout = RunReader(str(path)).layout
+
+    # Cut within the snapshot of tick 20 and within tick 15.
+    for size, ticks in [(layout.get_snapshot_offset(2) + 5, 20),
+                        (layout.get_tick_offset(15) + 7, 15)]:
+        with open(path, 'r+b') as fd:
+            fd.truncate(size)
+        reader = RunReader(str(path))
+
+        assert reader.ticks == ticks and reader.snapshots == 2
+        np.testing.assert_array_equal(reader.get_map(), maps[ticks])
+
+
+def test_load_map_reads_saved_arrays(tmp_path):
+    path = tmp_path / 'map.np'
+    gridmap = np.arange(12.0).reshape(3, 4)
+    with open(path, 'wb') as fd:
+        np.save(fd, gridmap)
+
+    np.testing.assert_array_equal(load_map(str(path)), gridmap)
+    with pytest.raises(ValueError):
+        RunReader(str(path))
@@ -0,0 +1,82 @@
+"""
+Tests for sharing camera frames through shared memory.
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'stellar'))
+from communication.shared_frame import SharedFrameBuffer  # noqa: E402
+
+
+@pytest.fixture
+def buffers():
+    writer = SharedFrameBuffer.create(f'stellar_test_{os.getpid()}', (40, 60, 3))
+    reader = SharedFrameBuffer.attach(f'stellar_test_{os.getpid()}')
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def test_reader_gets_latest_frame_once(buffers):
+    writer, reader = buffers
+    assert reader.read() == (0, None)
+
+    frames = [np.full((40, 60, 3), i, dtype=np.uint8) for i in range(5)]
+    for frame in frames:
+        writer.write(frame)
+
+    sequence, frame = reader.read()
+    assert sequence == 5
+    np.testing.assert_array_equal(frame, frames[-1])
+    assert reader.read(sequence) == (5, None)
+
+
+def test_frames_may_be_smaller_than_the_slots(buffers):
+    writer, reader = buffers
+    small = np.arange(20 * 30, dtype=np.uint8).reshape(20, 30)
+
+    writer.write(small)
+
+    _, frame = reader.read()
+    np.testing.assert_array_equal(frame[..., 0], small)
+
+
+def test_frames_bigger_than_the_slots_are_rejected(buffers):
+    writer, _ = buffers
+    with pytest.raises(ValueError):
+        writer.write(np.zeros((80, 60, 3), dtype=np.uint8))
+
+
+def test_attaching_before_creation_fails():
+    with pytest.raises(FileNotFoundError):
+        SharedFrameBuffer.attach('stellar_test_missing')
+
+
+def test_reader_notices_writer_restart():
+    name = f'stellar_test_restart_{os.getpid()}'
+    writer = SharedFrameBuffer.create(name, (40, 60, 3))
+    reader = SharedFrameBuffer.attach(name)
+    writer.write(np.full((40, 60, 3), 1, dtype=np.uint8))
+    assert reader.is_current()
+
+    # A restarted writer replaces the buffer, the reader keeps the old one.
+    restarted = SharedFrameBuffer.create(name, (40, 60, 3))
+    restarted.write(np.full((40, 60, 3), 2, dtype=np.uint8))
+    try:
+        assert not reader.is_current()
+        assert reader.read(1) == (1, None)
+
+        reattached = SharedFrameBuffer.attach(name)
+        sequence, frame = reattached.read()
+        assert sequence == 1 and frame.max() == 2
+        assert reattached.is_current()
+        reattached.close()
+    finally:
+        reader.close()
+        restarted.close()
+
+    assert not restarted.is_current()
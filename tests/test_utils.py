@@ -0,0 +1,93 @@
+"""
+Tests for loading occupancy data from png images.
+"""
+import os
+
+import numpy as np
+import png
+import pytest
+
+from stellar import utils
+from stellar.models.gridmap import OccupancyGridMap
+from stellar.simulation.data import load_world
+
+
+def png_to_ogm_per_pixel(filename, normalized=False, origin='lower'):
+    """Reference implementation, converting the image pixel by pixel."""
+    img = png.Reader(filename).read()
+    img_data = list(img[2])
+    bitdepth = img[3]['bitdepth']
+
+    out_img = []
+    for row in img_data:
+        out_img.append([value * 1.0 / (2**bitdepth) if normalized else value
+                        for j, value in enumerate(row) if j % img[3]['planes'] == 0])
+
+    if origin == 'lower':
+        out_img.reverse()
+
+    return out_img
+
+
+@pytest.fixture(autouse=True)
+def cache_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'CACHE_DIRECTORY', str(tmp_path))
+    monkeypatch.setattr(utils, 'ogm_cache', {})
+    return tmp_path
+
+
+@pytest.mark.parametrize("filename", [
+    "tests/maps/track.png",
+    "tests/maps/example_map_occupancy.png",
+])
+@pytest.mark.parametrize("normalized", [True, False])
+@pytest.mark.parametrize("origin", ['lower', 'upper'])
+def test_png_to_ogm_matches_per_pixel_conversion(filename, normalized, origin):
+    expected = np.array(png_to_ogm_per_pixel(filename, normalized, origin))
+
+    actual = utils.png_to_ogm(filename, normalized, origin)
+
+    assert actual.dtype == np.float32
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_load_ogm_scales_to_shape_and_caches_on_disk(cache_directory):
+    ogm = utils.load_ogm("tests/maps/track.png", (200, 200))
+
+    assert ogm.shape == (200, 200)
+    assert ogm.dtype == np.float32
+    assert len(os.listdir(cache_directory)) == 1
+
+    # A fresh process only has the disk cache.
+    utils.ogm_cache.clear()
+    np.testing.assert_array_equal(
+        utils.load_ogm("tests/maps/track.png", (200, 200)), ogm)
+
+
+def test_load_ogm_caches_in_memory_only_without_cache_directory(monkeypatch):
+    monkeypatch.setattr(utils, 'CACHE_DIRECTORY', None)
+
+    def save(*args):
+        raise AssertionError("Wrote to the disk cache")
+
+    monkeypatch.setattr(utils.numpy, 'save', save)
+    ogm = utils.load_ogm("tests/maps/track.png", (200, 200))
+
+    assert len(utils.ogm_cache) == 1
+    np.testing.assert_array_equal(utils.load_ogm("tests/maps/track.png", (200, 200)), ogm)
+
+
+def test_load_ogm_returns_independent_copies():
+    ogm = utils.load_ogm("tests/maps/track.png")
+    ogm[:] = -1
+
+    assert utils.load_ogm("tests/maps/track.png").min() >= 0
+
+
+def test_load_world_and_gridmap_share_the_loader():
+    world = load_world("tests/maps/track.png", (20, 20), 10)
+    gridmap = OccupancyGridMap.from_png("tests/maps/track.png", 10)
+
+    assert world.shape == (200, 200)
+    assert gridmap.world.shape == (712, 841)
+    assert len(utils.ogm_cache) == 2